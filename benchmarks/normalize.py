@@ -0,0 +1,93 @@
+"""
+Compares the normalization stage with per-row loops. The default stage is
+the fbSpend and date loop itself; the typed stage trades speed for
+converting every metric according to its type.
+
+Usage:
+	python benchmarks/normalize.py --rows 500000 --days 30
+
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from nanigans.normalize import Schema, normalize
+
+METRICS = ['impressions', 'clicks', 'fbSpend', 'ctr']
+SCHEMA = Schema({'impressions': 'integer', 'clicks': 'integer', 'fbSpend': 'currency',
+				 'ctr': 'percent'})
+
+
+def make_rows(count, days):
+	rows = []
+	for i in range(count):
+		rows.append({'date': '2016/06/{0:02d}'.format(i % days+1),
+					 'adPlan': 'Plan {0}'.format(i % 50),
+					 'impressions': '{0:,}'.format(i*7),
+					 'clicks': str(i % 300),
+					 'fbSpend': '{0:,.2f}'.format(i*1.37),
+					 'ctr': '{0:.2f}%'.format((i % 1000)/100.0)})
+	return rows
+
+
+def per_row_loop(rows):
+	"""The loop get_stats and get_view ran over every row before."""
+	for item in rows:
+		if item.get('fbSpend'):
+			item['fbSpend'] = item['fbSpend'].replace(',','')
+		if item.get('date'):
+			item['date'] = item['date'].replace('/','-')
+	return rows
+
+
+def per_row_typed(rows):
+	"""A per-row loop producing the same types as normalize(typed=True).
+	Dates are memoized like normalize does, so the comparison measures the
+	column-wise stage rather than the date cache.
+	"""
+	from datetime import datetime
+	dates = {}
+	for item in rows:
+		item['impressions'] = int(item['impressions'].replace(',',''))
+		item['clicks'] = int(item['clicks'])
+		item['fbSpend'] = float(item['fbSpend'].replace(',',''))
+		item['ctr'] = float(item['ctr'].rstrip('%'))
+		day = dates.get(item['date'])
+		if day is None:
+			day = dates[item['date']] = datetime.strptime(item['date'], '%Y/%m/%d').date()
+		item['date'] = day
+	return rows
+
+
+def timed(name, function, count, days, repeat):
+	best = None
+	for _ in range(repeat):
+		rows = make_rows(count, days)
+		started = time.perf_counter()
+		function(rows)
+		elapsed = time.perf_counter()-started
+		best = elapsed if best is None else min(best, elapsed)
+	print('{0:<40} {1:8.3f}s  {2:10.0f} rows/s'.format(name, best, count/best))
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--rows', type=int, default=200000)
+	parser.add_argument('--days', type=int, default=30)
+	parser.add_argument('--repeat', type=int, default=3)
+	args = parser.parse_args()
+
+	print('{0} rows over {1} days, best of {2}'.format(args.rows, args.days, args.repeat))
+	timed('per-row loop, fbSpend and date', per_row_loop, args.rows, args.days, args.repeat)
+	timed('normalize, fbSpend and date', lambda rows: normalize(rows, ['fbSpend']),
+		  args.rows, args.days, args.repeat)
+	timed('per-row loop, typed', per_row_typed, args.rows, args.days, args.repeat)
+	timed('normalize, typed', lambda rows: normalize(rows, METRICS, SCHEMA, typed=True),
+		  args.rows, args.days, args.repeat)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,76 @@
+"""
+Compares the memory held by a pull as row dicts and as compact Rows, and
+the time compacting takes. The rows arrive a day at a time, as they do in
+get_stats, and each day is compacted before the next one is decoded.
+
+Usage:
+	python benchmarks/rows.py --rows 500000 --attributes 4 --metrics 10
+
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from nanigans.rows import compact
+
+
+def make_bodies(count, attributes, metrics, days):
+	bodies = []
+	for day in range(days):
+		rows = []
+		for i in range(count//days):
+			row = {'date': '2016-06-{0:02d}'.format(day+1)}
+			for a in range(attributes):
+				row['attribute{0}'.format(a)] = 'Value {0}'.format(i % (10**(a+1)))
+			for m in range(metrics):
+				row['metric{0}'.format(m)] = '{0:,}'.format(i*(m+1))
+			rows.append(row)
+		bodies.append(json.dumps({'success': True, 'data': rows}))
+	return bodies
+
+
+def pull(bodies, function):
+	data = []
+	for body in bodies:
+		rows = json.loads(body)['data']
+		function(rows)
+		data.extend(rows)
+	return data
+
+
+def measure(name, bodies, function):
+	started = time.perf_counter()
+	pull(bodies, function)
+	elapsed = time.perf_counter()-started
+
+	tracemalloc.start()
+	data = pull(bodies, function)
+	held, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	print('{0:<10} {1:8.1f} MB held {2:8.1f} MB peak {3:8.3f}s'.format(
+		name, held/2.0**20, peak/2.0**20, elapsed))
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__,
+									 formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--rows', type=int, default=200000)
+	parser.add_argument('--attributes', type=int, default=3)
+	parser.add_argument('--metrics', type=int, default=6)
+	parser.add_argument('--days', type=int, default=30)
+	args = parser.parse_args()
+
+	bodies = make_bodies(args.rows, args.attributes, args.metrics, args.days)
+	print('{0} rows over {1} days, {2} attributes, {3} metrics'.format(
+		args.rows, args.days, args.attributes, args.metrics))
+	measure('dicts', bodies, lambda rows: None)
+	measure('compact', bodies, compact)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,124 @@
+"""
+Compares the descriptors of nanigans.structures with the previous ones,
+which kept every value in a WeakKeyDictionary on the descriptor.
+
+Usage:
+	python benchmarks/structures.py --number 1000000
+
+"""
+import argparse
+import os
+import sys
+import timeit
+
+from weakref import WeakKeyDictionary
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from nanigans.structures import StringDescriptor, DictDescriptor, ListDescriptor
+
+
+class WeakDescriptor(object):
+	"""The descriptor nanigans.structures provided before."""
+	kind = object
+
+	def __init__(self):
+		self.data = WeakKeyDictionary()
+
+	def __get__(self, instance, owner):
+		return self.data[instance]
+
+	def __set__(self, instance, value):
+		if value and not isinstance(value, self.kind):
+			raise TypeError("{0} is not valid".format(value))
+		self.data[instance] = value
+
+
+class WeakString(WeakDescriptor):
+	kind = str
+
+
+class WeakDict(WeakDescriptor):
+	kind = dict
+
+
+class WeakList(WeakDescriptor):
+	kind = list
+
+
+class WeakResponse(object):
+	data = WeakList()
+	errors = WeakList()
+
+	def __init__(self, data=None, errors=None):
+		self.data = data if data else []
+		self.errors = errors if errors else []
+
+
+class SlotResponse(object):
+	__slots__ = ('_data', '_errors')
+	data = ListDescriptor()
+	errors = ListDescriptor()
+
+	def __init__(self, data=None, errors=None):
+		self.data = data if data else []
+		self.errors = errors if errors else []
+
+
+class WeakRequest(object):
+	resource = WeakString()
+	parameters = WeakDict()
+	required_fields = WeakDict()
+	filters = WeakDict()
+
+	def __init__(self, resource, required_fields, parameters=None, filters=None):
+		self.resource = resource
+		self.required_fields = required_fields
+		self.filters = filters if filters else {}
+		self.parameters = parameters if parameters else {}
+
+
+class SlotRequest(object):
+	__slots__ = ('_resource', '_parameters', '_required_fields', '_filters')
+	resource = StringDescriptor()
+	parameters = DictDescriptor()
+	required_fields = DictDescriptor()
+	filters = DictDescriptor()
+
+	def __init__(self, resource, required_fields, parameters=None, filters=None):
+		self.resource = resource
+		self.required_fields = required_fields
+		self.filters = filters if filters else {}
+		self.parameters = parameters if parameters else {}
+
+
+def cases(response, request):
+	instance = response()
+	fields = {'source': 'placements'}
+	return [
+		('create Response', lambda: response()),
+		('read Response.data', lambda: instance.data),
+		('write Response.data', lambda: setattr(instance, 'data', [])),
+		('create PreparedRequest', lambda: request('adhoc', fields)),
+		('create and drop 1000 Responses', lambda: [response() for _ in range(1000)]),
+	]
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__,
+									 formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--number', type=int, default=200000)
+	parser.add_argument('--repeat', type=int, default=5)
+	args = parser.parse_args()
+
+	print('{0:<32} {1:>12} {2:>12} {3:>8}'.format('ns per call', 'weakref', 'slots', 'speedup'))
+	for (name, weak), (_, slot) in zip(cases(WeakResponse, WeakRequest),
+									   cases(SlotResponse, SlotRequest)):
+		number = args.number//1000 if '1000' in name else args.number
+		before = min(timeit.repeat(weak, number=number, repeat=args.repeat))/number*1e9
+		after = min(timeit.repeat(slot, number=number, repeat=args.repeat))/number*1e9
+		print('{0:<32} {1:12.0f} {2:12.0f} {3:7.1f}x'.format(name, before, after, before/after))
+
+
+if __name__ == '__main__':
+	main()
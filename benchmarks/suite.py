@@ -0,0 +1,149 @@
+"""
+Measures the adapter end to end against a local stub of the Reporting API.
+
+The stub from nanigans.tests.server serves the adhoc, view, events and
+authenticate.php endpoints with the given latency, rows per day and share
+of failed requests, so runs are repeatable and need no account. For every
+scenario the suite reports wall time, rows per second, latency percentiles
+of the individual requests, including their retries, and the peak memory
+allocated while it ran.
+
+Usage:
+	python benchmarks/suite.py --days 30 --rows 500 --latency 20 --workers 8
+	python benchmarks/suite.py --error-rate 0.05 --scenarios stats-concurrent events-click
+
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from datetime import datetime, timedelta
+from mock import patch
+
+import nanigans
+
+from nanigans.api import facebook, events
+from nanigans.models import Adapter, Response
+from nanigans.retry import RetryPolicy, set_retry_policy
+from nanigans.tests.server import StubServer
+
+
+class Timings(object):
+	"""Collects the duration of every Adapter.get while installed."""
+
+	def __init__(self):
+		self.durations = []
+		self._lock = threading.Lock()
+		self._get = Adapter.get
+
+	def install(self):
+		timings, get = self, self._get
+
+		def timed(adapter):
+			started = time.perf_counter()
+			try:
+				return get(adapter)
+			finally:
+				elapsed = time.perf_counter()-started
+				with timings._lock:
+					timings.durations.append(elapsed)
+
+		return patch.object(Adapter, 'get', timed)
+
+	def percentile(self, share):
+		if not self.durations:
+			return 0.0
+		ordered = sorted(self.durations)
+		return ordered[min(len(ordered)-1, int(share*len(ordered)))]
+
+
+def scenarios(args):
+	start = (datetime(2016, 6, 1)-timedelta(days=args.days)).strftime('%Y-%m-%d')
+	end = '2016-06-01'
+	workers = args.workers
+
+	return [
+		('stats-serial', lambda: facebook.get_stats(start=start, end=end)),
+		('stats-concurrent', lambda: facebook.get_stats(start=start, end=end,
+														max_workers=workers)),
+		('stats-chunked', lambda: facebook.get_stats(start=start, end=end, chunk_size=7,
+													 max_workers=workers)),
+		('view', lambda: Response.concat(
+			facebook.get_view('benchmark') for _ in range(args.days))),
+		('events-click', lambda: events.get_time_of_click(['timestamp'], start, end,
+														  max_workers=workers)),
+		('events-conversion', lambda: events.get_time_of_conversion(['timestamp'], start, end,
+																	max_workers=workers)),
+		('events-both', lambda: Response.concat(events.get_events(
+			['click', 'conversion'], ['timestamp'], start, end, max_workers=workers).values())),
+		('events-compact', lambda: events.get_time_of_click(['timestamp'], start, end,
+															max_workers=workers, compact=True)),
+		('events-processes', lambda: events.get_time_of_click(['timestamp'], start, end,
+															  max_workers=workers, compact=True,
+															  processes=args.processes)),
+	]
+
+
+def run(name, function, repeat):
+	best = None
+	for _ in range(repeat):
+		timings = Timings()
+		tracemalloc.start()
+		started = time.perf_counter()
+		with timings.install():
+			response = function()
+		elapsed = time.perf_counter()-started
+		peak = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+		if best is None or elapsed < best[0]:
+			best = (elapsed, peak, timings, response)
+
+	elapsed, peak, timings, response = best
+	print('{0:<18} {1:>6} {2:>8} {3:>5} {4:8.3f}s {5:10.0f} {6:8.1f} {7:8.1f} {8:8.1f} {9:8.1f}'.format(
+		name, len(timings.durations), len(response.data), len(response.errors), elapsed,
+		len(response.data)/elapsed, timings.percentile(0.5)*1000, timings.percentile(0.9)*1000,
+		timings.percentile(0.99)*1000, peak/2.0**20))
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__,
+									 formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--days', type=int, default=30, help='days in the date range')
+	parser.add_argument('--rows', type=int, default=100, help='rows served per day')
+	parser.add_argument('--latency', type=float, default=10.0, help='server latency in ms')
+	parser.add_argument('--error-rate', type=float, default=0.0,
+						help='share of requests failing with a 503')
+	parser.add_argument('--workers', type=int, default=8, help='max_workers of concurrent scenarios')
+	parser.add_argument('--processes', type=int, default=os.cpu_count(),
+						help='processes of the events-processes scenario')
+	parser.add_argument('--repeat', type=int, default=3)
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--scenarios', nargs='*', help='scenarios to run, all by default')
+	args = parser.parse_args()
+
+	nanigans.set_default_config('benchmark@example.com', 'benchmark', '123456')
+	set_retry_policy(RetryPolicy(max_attempts=5, backoff=0.01, max_backoff=0.1))
+	selected = [(name, function) for name, function in scenarios(args)
+				if not args.scenarios or name in args.scenarios]
+
+	with StubServer(latency=args.latency/1000.0, rows=args.rows, error_rate=args.error_rate,
+					seed=args.seed):
+		started = time.perf_counter()
+		nanigans.auth.token
+		print('{0} days, {1} rows per day, {2:.0f}ms latency, {3:.0%} errors, best of {4}'.format(
+			args.days, args.rows, args.latency, args.error_rate, args.repeat))
+		print('authentication {0:.1f}ms'.format((time.perf_counter()-started)*1000))
+		print('{0:<18} {1:>6} {2:>8} {3:>5} {4:>9} {5:>10} {6:>8} {7:>8} {8:>8} {9:>8}'.format(
+			'scenario', 'reqs', 'rows', 'errs', 'wall', 'rows/s', 'p50 ms', 'p90 ms', 'p99 ms',
+			'peak MB'))
+		for name, function in selected:
+			run(name, function, args.repeat)
+
+
+if __name__ == '__main__':
+	main()
@@ -33,16 +33,21 @@ Get Publishers data:
 True
 
 """
-from nanigans.utils import Credentials, set_default_config, change_site_id, generate_token
+from nanigans.auth import TokenCache
+from nanigans.retry import RetryPolicy, set_retry_policy
+from nanigans.ratelimit import RateLimiter, set_rate_limiter
+from nanigans.cache import ResponseCache, set_response_cache, MetadataCache, set_metadata_cache
+from nanigans.decoding import Decoder, set_decoder
+from nanigans.hooks import Hooks, Collector, set_hooks
+from nanigans.utils import (Credentials, set_default_config, change_site_id, generate_token,
+                            get_token, set_token_cache, set_session, configure_session)
 
 auth = Credentials()
 
-if auth.credentials:
-    auth.credentials['token'] = generate_token(auth.credentials['username'], 
-                                               auth.credentials['password'],
-                                               auth.credentials['site'])
-
 from nanigans.api import facebook, multichannel, publishers, events
+from nanigans.client import Client, fetch_many_sites
+from nanigans.backfill import Backfill, Checkpoint, Sync, SyncState
+from nanigans.sinks import CSVSink, JSONLinesSink, ParquetSink
 
 
 
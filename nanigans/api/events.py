@@ -4,12 +4,23 @@ The events module contains 2 functions to access event data:
 	.get_time_of_click:: retrieves event level data attributed to time of click
 	.get_time_of_conversion:: retrieves event level data attributed to time of conversion
 
+Both have coroutine versions, .get_time_of_click_async and .get_time_of_conversion_async,
+and .iter_events yields either one a day at a time.
+
+.get_events fetches several attributions in one pass, returning a Response per
+attribution, and .iter_events_many streams them as (attribution, Response) pairs.
+
+.iter_event_rows yields single events as they are read, for days too large to hold.
+
 """
 from datetime import date, timedelta
 from nanigans.utils import generate_dates
-from nanigans.models import PreparedRequest, Response
+from nanigans.decoding import ProcessDecoder, activate_decoder
+from nanigans.models import (PreparedRequest, AsyncPreparedRequest, Response, 
+							 send_many, send_many_async)
 
-def get_time_of_click(fields=None, start=None, end=None):
+def get_time_of_click(fields=None, start=None, end=None, max_workers=1, compact=False,
+					  processes=None):
 	"""Retrieves specific events given set of parameters. The events 
 	are attributed to the time of click.
 
@@ -19,34 +30,35 @@ def get_time_of_click(fields=None, start=None, end=None):
 	:param metrics: list/str, metrics fields
 	:param start: str, start date in %Y-%m-%d format 
 	:param end: str, end date in %Y-%m-%d format 
+	:param max_workers: int, number of days requested concurrently
+	:param compact: bool, store rows as Rows sharing one header instead of dicts
+	:param processes: int, decode bodies in this many worker processes, see iter_events
 	"""
-	if isinstance(fields, str):
-		fields = [fields]
-
-	if not fields:
-		fields = ['client_user_id,','placement_id', 'placement_datetime']
-
-	if start == None or end == None:
-		start = (date.today()-timedelta(days=7)).strftime('%Y-%m-%d')
-		end = (date.today()-timedelta(days=1)).strftime('%Y-%m-%d')
+	return Response.concat(iter_events('click', fields, start, end, max_workers, compact,
+									   processes))
 
-	dates = generate_dates(start,end)
-	response = Response()
-	required_fields = {'attribution':'click'}
 
-	for day in dates:
-		parameters = {'fields[]=':fields,'date':day}
-		request = PreparedRequest('events', required_fields, parameters)
-		record = request.send()
+async def get_time_of_click_async(fields=None, start=None, end=None, max_concurrency=10,
+								  compact=False):
+	"""Coroutine version of get_time_of_click. Days are requested 
+	concurrently without blocking the event loop.
 
-		response += record
-		if response.errors:
-			break
+	Endpoint:
+	/sites/:siteId/events
 
-	return response 
+	:param metrics: list/str, metrics fields
+	:param start: str, start date in %Y-%m-%d format 
+	:param end: str, end date in %Y-%m-%d format 
+	:param max_concurrency: int, number of days requested concurrently
+	:param compact: bool, store rows as Rows sharing one header instead of dicts
+	"""
+	requests = _events_requests(AsyncPreparedRequest, ['click'], fields, start, end)
+	records = await send_many_async(requests, max_concurrency)
+	return Response.concat(record.compact() if compact else record for record in records)
 
 
-def get_time_of_conversion(fields=None, start=None, end=None):
+def get_time_of_conversion(fields=None, start=None, end=None, max_workers=1, compact=False,
+						   processes=None):
 	"""Retrieves specific events given set of parameters. The events 
 	are attributed to the time of conversion.
 
@@ -56,32 +68,216 @@ def get_time_of_conversion(fields=None, start=None, end=None):
 	:param metrics: list/str, metrics fields
 	:param start: str, start date in %Y-%m-%d format 
 	:param end: str, end date in %Y-%m-%d format 
+	:param max_workers: int, number of days requested concurrently
+	:param compact: bool, store rows as Rows sharing one header instead of dicts
+	:param processes: int, decode bodies in this many worker processes, see iter_events
+	"""
+	return Response.concat(iter_events('conversion', fields, start, end, max_workers, compact,
+									   processes))
+
+
+async def get_time_of_conversion_async(fields=None, start=None, end=None, max_concurrency=10,
+									   compact=False):
+	"""Coroutine version of get_time_of_conversion. Days are requested 
+	concurrently without blocking the event loop.
+
+	Endpoint:
+	/sites/:siteId/events
+
+	:param metrics: list/str, metrics fields
+	:param start: str, start date in %Y-%m-%d format 
+	:param end: str, end date in %Y-%m-%d format 
+	:param max_concurrency: int, number of days requested concurrently
+	:param compact: bool, store rows as Rows sharing one header instead of dicts
+	"""
+	requests = _events_requests(AsyncPreparedRequest, ['conversion'], fields, start, end)
+	records = await send_many_async(requests, max_concurrency)
+	return Response.concat(record.compact() if compact else record for record in records)
+
+
+def iter_events(attribution, fields=None, start=None, end=None, max_workers=1, compact=False,
+				processes=None):
+	"""Yields a Response of events per day as each one arrives, instead of
+	collecting the whole range in memory. Days are yielded in the same order
+	as get_time_of_click and get_time_of_conversion, including days that 
+	failed, so callers should check each Response's ok attribute.
+
+	With processes, the bodies of busy days are decoded, dated and, with
+	compact, compacted in a pool of worker processes while max_workers
+	threads keep downloading, so large pulls use every core. The pool is
+	stopped once iteration is over.
+
+	Endpoint:
+	/sites/:siteId/events
+
+	:param attribution: str, click or conversion
+	:param metrics: list/str, metrics fields
+	:param start: str, start date in %Y-%m-%d format 
+	:param end: str, end date in %Y-%m-%d format 
+	:param max_workers: int, number of days requested concurrently
+	:param compact: bool, store rows as Rows sharing one header instead of dicts
+	:param processes: int, number of worker processes that decode, date and, with compact,
+		compact the bodies of days larger than 64KB, None to decode in the threads
+	"""
+	requests = _events_requests(PreparedRequest, [attribution], fields, start, end)
+	return _send(requests, max_workers, compact, processes)
+
+
+def iter_event_rows(attribution, fields=None, start=None, end=None):
+	"""Yields events one at a time as they are read from the socket, day
+	after day in the same order as iter_events, without holding a whole
+	day's response in memory. A day that fails raises ValueError, see
+	Adapter.iter_rows.
+
+	Endpoint:
+	/sites/:siteId/events
+
+	:param attribution: str, click or conversion
+	:param fields: list/str, event fields
+	:param start: str, start date in %Y-%m-%d format 
+	:param end: str, end date in %Y-%m-%d format 
+	"""
+	for request in _events_requests(PreparedRequest, [attribution], fields, start, end):
+		yield from request.iter_rows()
+
+
+def get_events(attributions=('click', 'conversion'), fields=None, start=None, end=None,
+			   max_workers=1, compact=False, processes=None):
+	"""Retrieves events for several attributions in one pass and returns
+	a dict of Responses keyed by attribution, e.g. 
+
+		events = get_events(start='2016-06-01', end='2016-06-08', max_workers=8)
+		events['click'].data, events['conversion'].data
+
+	The days of every attribution share the max_workers threads, so pulling
+	click and conversion events takes about as long as pulling one of them
+	with twice the workers, instead of two passes over the range.
+
+	Endpoint:
+	/sites/:siteId/events
+
+	:param attributions: list, click and/or conversion
+	:param fields: list/str, event fields
+	:param start: str, start date in %Y-%m-%d format 
+	:param end: str, end date in %Y-%m-%d format 
+	:param max_workers: int, number of requests sent concurrently
+	:param compact: bool, store rows as Rows sharing one header instead of dicts
+	:param processes: int, decode bodies in this many worker processes, see iter_events
+	"""
+	attributions = _attributions(attributions)
+	results = dict((attribution, []) for attribution in attributions)
+	for attribution, record in iter_events_many(attributions, fields, start, end, max_workers,
+												compact, processes):
+		results[attribution].append(record)
+	return dict((attribution, Response.concat(records)) for attribution, records in results.items())
+
+
+async def get_events_async(attributions=('click', 'conversion'), fields=None, start=None,
+						   end=None, max_concurrency=10, compact=False):
+	"""Coroutine version of get_events. Every attribution and day is 
+	requested concurrently without blocking the event loop.
+
+	Endpoint:
+	/sites/:siteId/events
+
+	:param attributions: list, click and/or conversion
+	:param fields: list/str, event fields
+	:param start: str, start date in %Y-%m-%d format 
+	:param end: str, end date in %Y-%m-%d format 
+	:param max_concurrency: int, number of requests sent concurrently
+	:param compact: bool, store rows as Rows sharing one header instead of dicts
+	"""
+	attributions = _attributions(attributions)
+	requests = _events_requests(AsyncPreparedRequest, attributions, fields, start, end)
+	records = await send_many_async(requests, max_concurrency)
+	results = dict((attribution, []) for attribution in attributions)
+	for request, record in zip(requests, records):
+		results[request.required_fields['attribution']].append(record.compact() if compact 
+																else record)
+	return dict((attribution, Response.concat(records)) for attribution, records in results.items())
+
+
+def iter_events_many(attributions=('click', 'conversion'), fields=None, start=None, end=None,
+					 max_workers=1, compact=False, processes=None):
+	"""Yields an (attribution, Response) pair per attribution and day as 
+	each one arrives. Every day is requested for all attributions before the
+	next, in the same date order as iter_events, and the requests share the
+	max_workers threads, so a day of clicks does not wait for a whole range
+	of conversions. Failed days are yielded too, so callers should check
+	each Response's ok attribute.
+
+	Endpoint:
+	/sites/:siteId/events
+
+	:param attributions: list, click and/or conversion
+	:param fields: list/str, event fields
+	:param start: str, start date in %Y-%m-%d format 
+	:param end: str, end date in %Y-%m-%d format 
+	:param max_workers: int, number of requests sent concurrently
+	:param compact: bool, store rows as Rows sharing one header instead of dicts
+	:param processes: int, decode bodies in this many worker processes, see iter_events
+	"""
+	requests = _events_requests(PreparedRequest, _attributions(attributions), fields, start, end)
+	tags = [request.required_fields['attribution'] for request in requests]
+	return zip(tags, _send(requests, max_workers, compact, processes))
+
+
+def _send(requests, max_workers, compact, processes):
+	"""Sends events requests and yields their Responses in order."""
+	records = send_many(requests, max_workers)
+	if processes:
+		records = _decoded(ProcessDecoder(processes, compact), records)
+
+	for record in records:
+		if compact:
+			record.compact()
+		yield record
+
+
+def _decoded(decoder, records):
+	"""Iterates over records with decoder active while the requests are
+	sent, and stops its processes at the end.
+	"""
+	with decoder:
+		while True:
+			with activate_decoder(decoder):
+				record = next(records, None)
+			if record is None:
+				return
+			yield record
+
+
+def _attributions(attributions):
+	if isinstance(attributions, str):
+		attributions = [attributions]
+	attributions = list(dict.fromkeys(attributions))
+	if not attributions:
+		raise ValueError('At least one attribution is required.')
+	return attributions
+
+
+def _events_requests(request_class, attributions, fields, start, end):
+	"""Builds one events request per attribution and day in the date range,
+	filling in default fields and dates. The requests of a day come one
+	after the other, in the order of attributions.
 	"""
 	if isinstance(fields, str):
 		fields = [fields]
 
 	if not fields:
-		fields = ['client_user_id,','placement_id', 'placement_datetime']
+		fields = ['client_user_id','placement_id', 'placement_datetime']
 
 	if start == None or end == None:
 		start = (date.today()-timedelta(days=7)).strftime('%Y-%m-%d')
 		end = (date.today()-timedelta(days=1)).strftime('%Y-%m-%d')
 
 	dates = generate_dates(start,end)
-	response = Response()
-	required_fields = {'attribution':'conversion'}
 
+	requests = []
 	for day in dates:
-		parameters = {'fields[]=':fields,'date':day}
-		request = PreparedRequest('events', required_fields, parameters)
-		record = request.send()
-
-		response += record
-		if response.errors:
-			break
-
-	return response 
-
-
-
+		for attribution in attributions:
+			required_fields = {'attribution':attribution}
+			parameters = {'fields[]=':fields,'date':day,'attribution':attribution}
+			requests.append(request_class('events', required_fields, parameters))
 
+	return requests
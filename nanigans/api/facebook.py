@@ -6,11 +6,16 @@ The facebook module contains the core functions used to retrieve data from nativ
 	.get_metrics:: used to retrieve all metrics available for data source
 	.get_view:: used to retrieve a specific view created in the Nanigans interface
 	.get_stats:: used to retrieve data for user-defined queries
+	.get_stats_async:: coroutine version of get_stats
+	.iter_stats:: yields the data of get_stats one day at a time
 
 """
 from datetime import date, timedelta
+from functools import partial
 from nanigans.utils import generate_dates
-from nanigans.models import PreparedRequest, Response
+from nanigans.normalize import Schema, normalize
+from nanigans.models import (PreparedRequest, AsyncPreparedRequest, Response, 
+							 send_many, send_chunked, send_many_async)
 
 def get_timeranges():
 	"""Retrieves available time ranges for given data source.
@@ -51,7 +56,7 @@ def get_metrics():
 	return response
 
 
-def get_view(view, depth=0):
+def get_view(view, depth=0, typed=False, compact=False):
 	"""Retrieves data for a specific view id. 
 
 	Endpoint:
@@ -59,23 +64,26 @@ def get_view(view, depth=0):
 
 	:param view: str, view id of created view
 	:param depth: int, dimension depth of data
+	:param typed: bool, parse metrics and dates to Python types
+	:param compact: bool, store rows as Rows sharing one header instead of dicts
 	"""
 	required_fields = {'source':'placements','view':view}
 	parameters = {'format':format,'depth':depth}
 	response = PreparedRequest('view', required_fields, parameters).send()
 
 	# Remove commas from fbSpend value
-
-	if response.ok: 
-		if response.data[0].get('fbSpend'): 
-			for record in response.data:
-				record['fbSpend'] = record['fbSpend'].replace(',','')
-				record['date'] = record['date'].replace('/','-')
+	if response.ok:
+		schema = _schema() if typed else None
+		metrics = set(schema.metrics) | set(['fbSpend']) if typed else ['fbSpend']
+		normalize(response.data, metrics, schema, typed)
+		if compact:
+			response.compact()
 
 	return response
 
 
-def get_stats(attributes=None, metrics=None, start=None, end=None, depth=0):
+def get_stats(attributes=None, metrics=None, start=None, end=None, depth=0, max_workers=1,
+			  chunk_size=1, max_rows=None, typed=False, compact=False):
 	"""Retrieves specific data requested given set of parameters.
 
 	Endpoint:
@@ -86,50 +94,130 @@ def get_stats(attributes=None, metrics=None, start=None, end=None, depth=0):
 	:param start: str, start date in %Y-%m-%d format 
 	:param end: str, end date in %Y-%m-%d format 
 	:param depth: int, dimension depth of data
+	:param max_workers: int, number of requests sent concurrently
+	:param chunk_size: int, days covered by each request, see iter_stats
+	:param max_rows: int, row count at which a multi-day request is split
+	:param typed: bool, parse metrics and dates to Python types
+	:param compact: bool, store rows as Rows sharing one header instead of dicts
 	"""
-	if isinstance(metrics, str):
-		metrics = [metrics]
-	if not metrics:
-		metrics = ['impressions','clicks','fbSpend']
-	if isinstance(attributes, str):
-		attributes = [attributes]
-	if not attributes:
-		attributes = ['budgetPool','strategyGroup','adPlan']
+	records = iter_stats(attributes, metrics, start, end, depth, max_workers, chunk_size, max_rows,
+						 typed, compact)
 
-	if start == None or end == None:
-		start = (date.today()-timedelta(days=7)).strftime('%Y-%m-%d')
-		end = (date.today()-timedelta(days=1)).strftime('%Y-%m-%d')
+	return Response.concat(records)
 
-	dates = generate_dates(start,end)
-	response = Response()
-	required_fields = {'source':'placements'}
 
-	for day in dates:
-		parameters = {'metrics[]=':metrics,
-					  'attributes[]=':attributes,
-					  'start':day,
-					  'end':day,
-					  'depth':depth}
-		request = PreparedRequest('adhoc', required_fields, parameters)
-		record = request.send()
+def iter_stats(attributes=None, metrics=None, start=None, end=None, depth=0, max_workers=1,
+			   chunk_size=1, max_rows=None, typed=False, compact=False):
+	"""Retrieves the same data as get_stats, but yields a Response per request
+	as each one arrives instead of collecting the whole range in memory. 
+	Responses are yielded in the same order as get_stats, including ones that 
+	failed, so callers should check each Response's ok attribute.
+
+	By default each request covers one day. With a chunk_size above one, each 
+	request covers up to chunk_size days and is broken down by date, so 
+	far fewer requests are sent. A multi-day request that fails, or returns 
+	max_rows rows or more, is split and sent again as smaller requests.
+
+	Endpoint:
+	/sites/:siteId/datasources/placements/views/adhoc
 
-		# Remove commas from fbSpend value
+	:param attributes: list/str, attributes fields 
+	:param metrics: list/str, metrics fields
+	:param start: str, start date in %Y-%m-%d format 
+	:param end: str, end date in %Y-%m-%d format 
+	:param depth: int, dimension depth of data
+	:param max_workers: int, number of requests sent concurrently
+	:param chunk_size: int, days covered by each request
+	:param max_rows: int, row count at which a multi-day request is split
+	:param typed: bool, parse metrics and dates to Python types
+	:param compact: bool, store rows as Rows sharing one header instead of dicts
+	"""
+	attributes, metrics, start, end = _stats_defaults(attributes, metrics, start, end)
+	schema = _schema() if typed else None
+
+	if chunk_size > 1:
+		# Break the rows of each multi-day request down by date first
+		attributes = ['date']+[attribute for attribute in attributes if attribute != 'date']
+		depth = depth+1 if depth else depth
+		build = partial(_stats_request, PreparedRequest, attributes, metrics, depth)
+		records = send_chunked(build, start, end, chunk_size, max_workers, max_rows)
+	else:
+		build = partial(_stats_request, PreparedRequest, attributes, metrics, depth)
+		records = send_many([build(day, day) for day in generate_dates(start, end)], max_workers)
+
+	for record in records:
+		# Remove commas from fbSpend and normalise dates
 		if record.ok:
-			for item in record.data:
-				if item.get('fbSpend'):
-					item['fbSpend'] = item['fbSpend'].replace(',','')
-		response += record
-		if response.errors:
-			break
+			if chunk_size > 1:
+				record.data.sort(key=lambda item: item.get('date') or '', reverse=True)
+			normalize(record.data, metrics, schema, typed)
+			if compact:
+				record.compact(attributes+metrics)
+		yield record
 
-	return response 
 
+async def get_stats_async(attributes=None, metrics=None, start=None, end=None, depth=0, 
+						  max_concurrency=10, typed=False, compact=False):
+	"""Coroutine version of get_stats. Days are requested concurrently 
+	without blocking the event loop.
 
+	Endpoint:
+	/sites/:siteId/datasources/placements/views/adhoc
 
+	:param attributes: list/str, attributes fields 
+	:param metrics: list/str, metrics fields
+	:param start: str, start date in %Y-%m-%d format 
+	:param end: str, end date in %Y-%m-%d format 
+	:param depth: int, dimension depth of data
+	:param max_concurrency: int, number of days requested concurrently
+	:param typed: bool, parse metrics and dates to Python types
+	:param compact: bool, store rows as Rows sharing one header instead of dicts
+	"""
+	attributes, metrics, start, end = _stats_defaults(attributes, metrics, start, end)
+	schema = _schema() if typed else None
+	requests = [_stats_request(AsyncPreparedRequest, attributes, metrics, depth, day, day) 
+				for day in generate_dates(start, end)]
+	records = await send_many_async(requests, max_concurrency)
+	for record in records:
+		# Remove commas from fbSpend and normalise dates
+		if record.ok:
+			normalize(record.data, metrics, schema, typed)
+			if compact:
+				record.compact(attributes+metrics)
 
+	return Response.concat(records)
 
 
+def _schema():
+	"""Field types of the data source, used by the typed option."""
+	return Schema.from_responses(get_metrics(), get_attributes())
 
 
+def _stats_defaults(attributes, metrics, start, end):
+	"""Fills in the default fields and date range of get_stats."""
+	if isinstance(metrics, str):
+		metrics = [metrics]
+	if not metrics:
+		metrics = ['impressions','clicks','fbSpend']
+	if isinstance(attributes, str):
+		attributes = [attributes]
+	if not attributes:
+		attributes = ['budgetPool','strategyGroup','adPlan']
 
+	if start == None or end == None:
+		start = (date.today()-timedelta(days=7)).strftime('%Y-%m-%d')
+		end = (date.today()-timedelta(days=1)).strftime('%Y-%m-%d')
+
+	return attributes, metrics, start, end
+
+
+def _stats_request(request_class, attributes, metrics, depth, start, end):
+	"""Builds an adhoc request covering start to end inclusive."""
+	required_fields = {'source':'placements'}
+	parameters = {'metrics[]=':metrics,
+				  'attributes[]=':attributes,
+				  'start':start,
+				  'end':end,
+				  'depth':depth}
 
+	return request_class('adhoc', required_fields, parameters)
@@ -1,5 +1,19 @@
+import contextvars
+import json
+import os
+import threading
+import time
+
+from contextlib import contextmanager
 from nanigans.config import AUTH
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_active_client = contextvars.ContextVar('nanigans_client', default=None)
+
 class Credentials(object):
     """ The <[Credentials Object]> is an adapted version of
     https://github.com/faif/python-patterns/blob/master/borg.py.
@@ -7,8 +21,15 @@ class Credentials(object):
     It shares credentials amongst its instances to allow users to set default 
     credentials in a Python environment or set up credentials in a config.py file.
 
+    The access token is not requested until the first request needs it, see
+    the token property.
+
+    Inside a nanigans.client.Client scope, credentials and token are those
+    of the client instead, so several sites can be used at the same time.
+
     """
     _shared_state = {}
+    _token_lock = threading.Lock()
 
     def __init__(self):
         self.__dict__ = self._shared_state
@@ -16,8 +37,24 @@ class Credentials(object):
 
     @property
     def credentials(self):
+        client = _active_client.get()
+        if client is not None:
+            return client.credentials
         return self._credentials
 
+    @property
+    def token(self):
+        """ The access token for the current credentials. It is fetched from
+        the token cache the first time it is read and kept until the site or
+        credentials change, or until the token cache would refresh it, so
+        long running processes never send an expired token. Concurrent
+        readers share a single fetch.
+        """
+        client = _active_client.get()
+        if client is not None:
+            return client.token
+        return resolve_token(self._credentials, self._token_lock)
+
     def __repr__(self):
         if self._credentials:
             return "<Credentials Object [Signed]>"
@@ -26,3 +63,204 @@ class Credentials(object):
 
     def __str__(self):
         return "<[Credentials Object]>"
+
+
+def resolve_token(credentials, lock):
+    """ Return the token of a credentials dict, fetching it from the token
+    cache under lock when it is not set yet or is due for a refresh.
+
+    The time the token cache would refresh the token is kept next to it in
+    credentials['refresh']. A token set by hand, without it, is kept.
+    """
+    if not credentials:
+        return None
+    if _stale(credentials):
+        with lock:
+            if _stale(credentials):
+                from nanigans.utils import get_token, get_token_cache
+                credentials['token'] = get_token(credentials['username'],
+                                                 credentials['password'],
+                                                 credentials['site'])
+                credentials['refresh'] = get_token_cache().refresh_at(credentials['username'],
+                                                                      str(credentials['site']))
+    return credentials['token']
+
+
+def _stale(credentials):
+    refresh = credentials.get('refresh')
+    return not credentials.get('token') or (refresh is not None and refresh <= time.time())
+
+
+def get_active_client():
+    """ Return the Client whose scope the caller is running in, or None.
+    """
+    return _active_client.get()
+
+
+@contextmanager
+def activate_client(client):
+    """ Run the body of a with statement, and the threads and tasks it
+    starts through nanigans, with the credentials of client.
+    """
+    reset = _active_client.set(client)
+    try:
+        yield client
+    finally:
+        _active_client.reset(reset)
+
+
+class TokenCache(object):
+    """ The <[Token Cache]> object keeps access tokens per (username, site)
+    so switching between sites does not re-authenticate every time.
+
+    A token is trusted for ttl seconds after it was issued and is refreshed
+    once it is within refresh_margin seconds of expiring, so requests never
+    go out with a token that is about to lapse. When a path is given, tokens
+    are also kept in that JSON file, guarded by an exclusive file lock, so
+    worker processes share tokens instead of each authenticating.
+
+    :param ttl: int, seconds a token is valid for after it is issued
+    :param refresh_margin: int, seconds before expiry to fetch a new token
+    :param path: str, optional file used to share tokens between processes
+
+    """
+
+    def __init__(self, ttl=3600, refresh_margin=300, path=None):
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.path = path
+        self._tokens = {}
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def get(self, username, password, site, fetch):
+        """ Return a fresh token for the username and site, calling
+        fetch(username, password, site) only when there is none.
+
+        The locks are only held to read and store the token, so tokens of
+        different sites are fetched at the same time. Concurrent callers
+        asking for the same username and site wait for one fetch.
+        """
+        key = self._key(username, site)
+        with self._lock:
+            token = self._fresh(self._tokens.get(key))
+            if token:
+                return token
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.token
+
+        try:
+            flight.token = self._fetch(key, username, password, site, fetch)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.token
+
+    def _fetch(self, key, username, password, site, fetch):
+        with self._lock, self._locked_file() as stored:
+            self._tokens.update(stored)
+            token = self._fresh(self._tokens.get(key))
+        if token:
+            return token
+
+        token = fetch(username, password, site)
+        if token:
+            entry = [token, time.time()+self.ttl]
+            with self._lock, self._locked_file() as stored:
+                self._tokens[key] = stored[key] = entry
+        return token
+
+    def refresh_at(self, username, site):
+        """ Return the time after which the token for the username and site
+        is refreshed, or None when there is none.
+        """
+        with self._lock:
+            entry = self._tokens.get(self._key(username, site))
+        if entry is None:
+            return None
+        return entry[1]-self.refresh_margin
+
+    def invalidate(self, username, site):
+        """ Forget the token for the username and site, e.g. after it was
+        rejected by the API.
+        """
+        key = self._key(username, site)
+        with self._lock:
+            self._tokens.pop(key, None)
+            with self._locked_file() as stored:
+                stored.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+            with self._locked_file() as stored:
+                stored.clear()
+
+    def _key(self, username, site):
+        return '{0}|{1}'.format(username, site)
+
+    def _fresh(self, entry):
+        if entry and entry[1]-self.refresh_margin > time.time():
+            return entry[0]
+        return None
+
+    @contextmanager
+    def _locked_file(self):
+        """ Yields the tokens stored on disk while holding the file lock and
+        writes them back afterwards. Without a path this is a scratch dict.
+        """
+        if not self.path:
+            yield {}
+            return
+
+        with open(self.path+'.lock', 'a') as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                try:
+                    with open(self.path) as f:
+                        stored = json.load(f)
+                except (IOError, ValueError):
+                    stored = {}
+                before = dict(stored)
+                yield stored
+                if stored == before:
+                    return
+                now = time.time()
+                stored = dict((k, v) for k, v in stored.items() if v[1] > now)
+                tmp = '{0}.{1}'.format(self.path, os.getpid())
+                fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(stored, f)
+                os.rename(tmp, self.path)
+            finally:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def __repr__(self):
+        return "<Token Cache [{0} tokens]>".format(len(self._tokens))
+
+    def __str__(self):
+        return "<[Token Cache]>"
+
+
+class _Flight(object):
+    """ A token fetch in progress that other callers can wait for.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.token = None
+        self.error = None
@@ -0,0 +1,477 @@
+"""
+Resumable backfills of long date ranges, and incremental syncs that only
+fetch the days added or changed since the last run.
+
+"""
+import contextvars
+import functools
+import hashlib
+import json
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import date, datetime, timedelta
+from nanigans import auth
+from nanigans.cache import Connection
+from nanigans.models import Response
+from nanigans.rows import as_dicts
+from nanigans.utils import generate_dates, next_date
+
+
+class Checkpoint(object):
+	"""The '<Nanigans Checkpoint [path]>' object records in a SQLite file
+	which (site, source, day) units of a backfill have been written, so an
+	interrupted backfill only fetches the days it is missing.
+
+	:param path: str, SQLite file holding the checkpoint
+	"""
+	_schema = '''CREATE TABLE IF NOT EXISTS units (
+		site TEXT, source TEXT, day TEXT, rows INTEGER, completed REAL,
+		PRIMARY KEY (site, source, day))'''
+
+	def __init__(self, path):
+		self.path = path
+		self._lock = threading.Lock()
+		with self._connect() as db:
+			db.execute(self._schema)
+
+	def completed(self, site, source, start=None, end=None):
+		"""Returns the set of days completed for a site and source,
+		optionally limited to the range from start up to but not including end.
+
+		:param site: str, site id
+		:param source: str, name of the data being backfilled
+		:param start: str, first day in %Y-%m-%d format
+		:param end: str, day after the last one in %Y-%m-%d format
+		"""
+		query = 'SELECT day FROM units WHERE site = ? AND source = ?'
+		values = [str(site), source]
+		if start:
+			query += ' AND day >= ?'
+			values.append(start)
+		if end:
+			query += ' AND day < ?'
+			values.append(end)
+		with self._connect() as db:
+			return set(row[0] for row in db.execute(query, values))
+
+	def mark(self, site, source, day, rows=0):
+		"""Records a day as completed.
+
+		:param site: str, site id
+		:param source: str, name of the data being backfilled
+		:param day: str, day in %Y-%m-%d format
+		:param rows: int, number of rows written for the day
+		"""
+		with self._lock, self._connect() as db:
+			db.execute('INSERT OR REPLACE INTO units VALUES (?,?,?,?,?)',
+					   (str(site), source, day, rows, time.time()))
+
+	def reset(self, site=None, source=None, start=None, end=None):
+		"""Forgets the completed days matching every given argument, so they
+		are fetched again. Without arguments the checkpoint is emptied.
+
+		:param site: str, site id
+		:param source: str, name of the data being backfilled
+		:param start: str, first day in %Y-%m-%d format
+		:param end: str, day after the last one in %Y-%m-%d format
+		"""
+		clauses, values = [], []
+		for column, value in (('site', site), ('source', source)):
+			if value is not None:
+				clauses.append(column+' = ?')
+				values.append(str(value))
+		if start:
+			clauses.append('day >= ?')
+			values.append(start)
+		if end:
+			clauses.append('day < ?')
+			values.append(end)
+		where = ' WHERE '+' AND '.join(clauses) if clauses else ''
+		with self._lock, self._connect() as db:
+			return db.execute('DELETE FROM units'+where, values).rowcount
+
+	def _connect(self):
+		return Connection(self.path)
+
+	def __repr__(self):
+		return '<Nanigans Checkpoint [{0}]>'.format(self.path)
+
+
+class Backfill(object):
+	"""The '<Nanigans Backfill [source]>' object pulls a date range one day at
+	a time, hands each successful day to write as soon as it arrives, and
+	then records the day in the checkpoint. Running it again, e.g. after a
+	crash, skips the days already recorded.
+
+	A day that fails, or whose fetch raises, is left out of the checkpoint
+	and does not stop the other days, so the next run retries just those.
+	A day is recorded only after write returns, so write should replace
+	any output it may have left for that day on an earlier run.
+
+	For example, clicks for a year written to one file per day, with
+	as_dicts so that compact results are written as objects too:
+
+		def write(day, response):
+			with open('clicks-{0}.json'.format(day), 'w') as f:
+				json.dump(as_dicts(response.data), f)
+
+		fetch = partial(nanigans.events.get_time_of_click, ['timestamp'])
+		Backfill(fetch, write, 'backfill.sqlite', 'events/click').run('2015-06-01', '2016-06-01')
+
+	:param fetch: callable, takes start and end keywords and returns a Response
+	:param write: callable, takes the day and its Response
+	:param checkpoint: Checkpoint/str, checkpoint or the path of its file
+	:param source: str, name of the data being backfilled, part of the checkpoint key
+	:param max_workers: int, number of days fetched concurrently
+	"""
+
+	def __init__(self, fetch, write, checkpoint, source, max_workers=1):
+		self.fetch = fetch
+		self.write = write
+		self.checkpoint = checkpoint if isinstance(checkpoint, Checkpoint) else Checkpoint(checkpoint)
+		self.source = source
+		self.max_workers = max(1, max_workers)
+
+	def pending(self, start, end, site=None):
+		"""Returns the days from start up to but not including end that are
+		not completed yet, most recent first.
+
+		:param start: str, start date in %Y-%m-%d format
+		:param end: str, end date in %Y-%m-%d format
+		:param site: str, defaults to the current site
+		"""
+		site = site if site is not None else auth.credentials['site']
+		done = self.checkpoint.completed(site, self.source, start, end)
+		return [day for day in generate_dates(start, end) if day not in done]
+
+	def run(self, start, end):
+		"""Fetches and writes every pending day of the range. Returns a
+		Response whose data lists the days completed by this run and whose
+		errors hold a {'date': day, 'errors': errors} entry per failed day.
+
+		:param start: str, start date in %Y-%m-%d format
+		:param end: str, end date in %Y-%m-%d format
+		"""
+		site = auth.credentials['site']
+		days = iter(self.pending(start, end, site))
+		result = Response()
+
+		with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+			running = {}
+			while True:
+				for day in days:
+					context = contextvars.copy_context()
+					running[executor.submit(context.run, self._fetch, day)] = day
+					if len(running) >= self.max_workers:
+						break
+				if not running:
+					break
+				finished, _ = wait(running, return_when=FIRST_COMPLETED)
+				for future in finished:
+					self._complete(site, running.pop(future), future, result)
+
+		return result
+
+	def _fetch(self, day):
+		return self.fetch(start=day, end=next_date(day))
+
+	def _complete(self, site, day, future, result):
+		try:
+			response = future.result()
+		except Exception as e:
+			response = Response(errors=[str(e)])
+		if not response.ok:
+			result.errors.extend(_failed(day, response))
+			return
+		self.write(day, response)
+		self.checkpoint.mark(site, self.source, day, len(response.data))
+		result.data.append(day)
+
+	def __repr__(self):
+		return '<Nanigans Backfill [{0}]>'.format(self.source)
+
+
+class SyncState(object):
+	"""The '<Nanigans Sync State [path]>' object records in a SQLite file,
+	per (site, source, signature), the content hash and row count of every
+	day a sync fetched, whether the day was already settled when fetched,
+	and the last settled date up to which every day is settled.
+
+	:param path: str, SQLite file holding the state
+	"""
+	_schema = ("""CREATE TABLE IF NOT EXISTS days (
+		site TEXT, source TEXT, signature TEXT, day TEXT, digest TEXT, rows INTEGER,
+		settled INTEGER, fetched REAL, PRIMARY KEY (site, source, signature, day))""",
+		"""CREATE TABLE IF NOT EXISTS syncs (
+		site TEXT, source TEXT, signature TEXT, settled TEXT, updated REAL,
+		PRIMARY KEY (site, source, signature))""")
+
+	def __init__(self, path):
+		self.path = path
+		self._lock = threading.Lock()
+		with self._connect() as db:
+			for schema in self._schema:
+				db.execute(schema)
+
+	def days(self, site, source, signature, start=None, end=None):
+		"""Returns a dict of (digest, settled) tuples keyed by day for the days
+		recorded for a site, source and signature, optionally limited to the
+		range from start up to but not including end.
+
+		:param site: str, site id
+		:param source: str, name of the data being synced
+		:param signature: str, signature of the query
+		:param start: str, first day in %Y-%m-%d format
+		:param end: str, day after the last one in %Y-%m-%d format
+		"""
+		query = 'SELECT day, digest, settled FROM days WHERE site = ? AND source = ? AND signature = ?'
+		values = [str(site), source, signature]
+		if start:
+			query += ' AND day >= ?'
+			values.append(start)
+		if end:
+			query += ' AND day < ?'
+			values.append(end)
+		with self._connect() as db:
+			return dict((day, (digest, bool(settled))) for day, digest, settled 
+						in db.execute(query, values))
+
+	def record(self, site, source, signature, day, digest, rows=0, settled=False):
+		"""Records the content hash of a fetched day.
+
+		:param site: str, site id
+		:param source: str, name of the data being synced
+		:param signature: str, signature of the query
+		:param day: str, day in %Y-%m-%d format
+		:param digest: str, hash of the day's rows
+		:param rows: int, number of rows of the day
+		:param settled: bool, whether the day could no longer change when fetched
+		"""
+		with self._lock, self._connect() as db:
+			db.execute('INSERT OR REPLACE INTO days VALUES (?,?,?,?,?,?,?,?)',
+					   (str(site), source, signature, day, digest, rows, int(settled), time.time()))
+
+	def settled(self, site, source, signature):
+		"""Returns the last settled date of a site, source and signature, or
+		None before its first sync.
+
+		:param site: str, site id
+		:param source: str, name of the data being synced
+		:param signature: str, signature of the query
+		"""
+		with self._connect() as db:
+			row = db.execute('SELECT settled FROM syncs WHERE site = ? AND source = ? AND signature = ?',
+							 (str(site), source, signature)).fetchone()
+		return row[0] if row else None
+
+	def settle(self, site, source, signature, day):
+		"""Records the last settled date of a site, source and signature.
+
+		:param site: str, site id
+		:param source: str, name of the data being synced
+		:param signature: str, signature of the query
+		:param day: str, day in %Y-%m-%d format
+		"""
+		with self._lock, self._connect() as db:
+			db.execute('INSERT OR REPLACE INTO syncs VALUES (?,?,?,?,?)',
+					   (str(site), source, signature, day, time.time()))
+
+	def reset(self, site=None, source=None, signature=None, start=None, end=None):
+		"""Forgets the days matching every given argument, so they are 
+		fetched and reported as changed again. With a range, the last
+		settled dates are moved back before start, or before the earliest
+		day forgotten when only end is given. Without arguments the state is
+		emptied. Returns the number of days forgotten.
+
+		:param site: str, site id
+		:param source: str, name of the data being synced
+		:param signature: str, signature of the query
+		:param start: str, first day in %Y-%m-%d format
+		:param end: str, day after the last one in %Y-%m-%d format
+		"""
+		clauses, values = [], []
+		for column, value in (('site', site), ('source', source), ('signature', signature)):
+			if value is not None:
+				clauses.append(column+' = ?')
+				values.append(str(value))
+		days_clauses, days_values = list(clauses), list(values)
+		if start:
+			days_clauses.append('day >= ?')
+			days_values.append(start)
+		if end:
+			days_clauses.append('day < ?')
+			days_values.append(end)
+		where = ' WHERE '+' AND '.join(days_clauses) if days_clauses else ''
+		with self._lock, self._connect() as db:
+			firsts = db.execute('SELECT site, source, signature, MIN(day) FROM days'+where+
+								' GROUP BY site, source, signature', days_values).fetchall()
+			count = db.execute('DELETE FROM days'+where, days_values).rowcount
+			if start:
+				db.execute('UPDATE syncs SET settled = ? WHERE '+' AND '.join(clauses+['settled >= ?']),
+						   [_previous(start)]+values+[start])
+			elif end:
+				for key in firsts:
+					db.execute('UPDATE syncs SET settled = ? WHERE site = ? AND source = ? AND '
+							   'signature = ? AND settled >= ?', (_previous(key[3]),)+key)
+			else:
+				db.execute('DELETE FROM syncs'+(' WHERE '+' AND '.join(clauses) if clauses else ''),
+						   values)
+		return count
+
+	def _connect(self):
+		return Connection(self.path)
+
+	def __repr__(self):
+		return '<Nanigans Sync State [{0}]>'.format(self.path)
+
+
+class Sync(Backfill):
+	"""The '<Nanigans Sync [source]>' object keeps a date range up to date
+	incrementally. Each run fetches, one day at a time, only the days that
+	were never fetched once settled, i.e. new days and the last 
+	mutable_days days whose data may still change, and compares each day's
+	content hash with the one stored in the state. Only days whose rows
+	changed are handed to write, and run returns them, so an hourly refresh
+	costs a handful of requests and writes.
+
+	The state is kept per site, source and query signature. By default the
+	signature is derived from fetch, its function and the arguments bound
+	with functools.partial, except those that only change how the data is
+	fetched such as max_workers, so changing the query starts a new sync.
+
+		fetch = partial(nanigans.facebook.get_stats, ['adPlan'], ['impressions', 'fbSpend'])
+		sync = Sync(fetch, write, 'sync.sqlite', 'facebook/plans')
+		sync.run('2016-01-01')  # first run, every day since
+		sync.run()              # later runs, only new and recent days
+
+	A day that fails is neither written nor recorded, so the next run 
+	fetches it again, and the last settled date does not move past it.
+
+	:param fetch: callable, takes start and end keywords and returns a Response
+	:param write: callable, takes each changed day and its Response, or None
+	:param state: SyncState/str, state or the path of its file
+	:param source: str, name of the data being synced, part of the state key
+	:param signature: str, signature of the query, derived from fetch by default
+	:param mutable_days: int, number of recent days that are fetched on every run
+	:param max_workers: int, number of days fetched concurrently
+	"""
+	_ignored = ('max_workers', 'max_concurrency', 'chunk_size', 'compact', 'processes')
+
+	def __init__(self, fetch, write, state, source, signature=None, mutable_days=3, max_workers=1):
+		self.fetch = fetch
+		self.write = write
+		self.state = state if isinstance(state, SyncState) else SyncState(state)
+		self.source = source
+		self.signature = signature or self._signature(fetch)
+		self.mutable_days = mutable_days
+		self.max_workers = max(1, max_workers)
+
+	@property
+	def cutoff(self):
+		"""The first day that may still change, in %Y-%m-%d format."""
+		return (date.today()-timedelta(days=self.mutable_days)).strftime('%Y-%m-%d')
+
+	def pending(self, start, end, site=None):
+		"""Returns the days from start up to but not including end that were
+		not fetched since they settled, most recent first.
+
+		:param start: str, start date in %Y-%m-%d format
+		:param end: str, end date in %Y-%m-%d format
+		:param site: str, defaults to the current site
+		"""
+		site = site if site is not None else auth.credentials['site']
+		days = self.state.days(site, self.source, self.signature, start, end)
+		return [day for day in generate_dates(start, end) if not days.get(day, (None, False))[1]]
+
+	def run(self, start=None, end=None):
+		"""Fetches the pending days of the range and writes those that 
+		changed. Returns a Response whose data lists the changed days, most
+		recent first, and whose errors hold a {'date': day, 'errors': errors}
+		entry per failed day.
+
+		:param start: str, start date in %Y-%m-%d format, defaults to the day
+			after the last settled date, or to a week ago on the first run
+		:param end: str, end date in %Y-%m-%d format, defaults to tomorrow so
+			today is included
+		"""
+		site = auth.credentials['site']
+		settled = self.state.settled(site, self.source, self.signature)
+		if start is None:
+			start = next_date(settled) if settled else (date.today()-timedelta(days=7)).strftime('%Y-%m-%d')
+		if end is None:
+			end = next_date(date.today().strftime('%Y-%m-%d'))
+
+		self._digests = self.state.days(site, self.source, self.signature, start, end)
+		result = super(Sync, self).run(start, end)
+		result.data.sort(reverse=True)
+		self._settle(site, settled, start)
+		return result
+
+	def _complete(self, site, day, future, result):
+		try:
+			response = future.result()
+		except Exception as e:
+			response = Response(errors=[str(e)])
+		if not response.ok:
+			result.errors.extend(_failed(day, response))
+			return
+		digest = _digest(response.data)
+		if self._digests.get(day, (None, False))[0] != digest:
+			if self.write is not None:
+				self.write(day, response)
+			result.data.append(day)
+		self.state.record(site, self.source, self.signature, day, digest, len(response.data),
+						  day < self.cutoff)
+
+	def _settle(self, site, settled, start):
+		"""Moves the last settled date forward over the settled days that 
+		follow it without a gap, starting from start on the first run.
+		"""
+		following = next_date(settled) if settled else start
+		days = self.state.days(site, self.source, self.signature, following, self.cutoff)
+		day = settled
+		while days.get(following, (None, False))[1]:
+			day, following = following, next_date(following)
+		if day != settled:
+			self.state.settle(site, self.source, self.signature, day)
+
+	@classmethod
+	def _signature(cls, fetch):
+		"""Hashes the function of fetch and the arguments bound to it."""
+		function, args, keywords = fetch, (), {}
+		while isinstance(function, functools.partial):
+			args = function.args+args
+			keywords = dict(function.keywords, **keywords)
+			function = function.func
+		keywords = dict((k, v) for k, v in keywords.items() if k not in cls._ignored)
+		name = '{0}.{1}'.format(getattr(function, '__module__', ''),
+								getattr(function, '__qualname__', repr(function)))
+		fingerprint = json.dumps([name, args, keywords], sort_keys=True, default=str)
+		return hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()
+
+	def __repr__(self):
+		return '<Nanigans Sync [{0}]>'.format(self.source)
+
+
+def _previous(day):
+	"""Return the day before the given day."""
+	return (datetime.strptime(day, '%Y-%m-%d')-timedelta(days=1)).strftime('%Y-%m-%d')
+
+
+def _failed(day, response):
+	"""The errors of a failed day as {'date': day, 'errors': errors} entries,
+	keeping those Response.concat tagged already.
+	"""
+	if all(isinstance(error, dict) and 'date' in error for error in response.errors):
+		return response.errors
+	return [{'date': day, 'errors': response.errors}]
+
+
+def _digest(data):
+	"""Hashes the rows of a day regardless of their order, whether they are
+	dicts or compact Rows.
+	"""
+	rows = sorted(json.dumps(row, sort_keys=True, default=str) for row in as_dicts(data))
+	return hashlib.sha1('\n'.join(rows).encode('utf-8')).hexdigest()
@@ -0,0 +1,304 @@
+"""
+Caches for responses of the Reporting API.
+
+"""
+import copy
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from datetime import date, timedelta
+from nanigans.rows import as_dicts
+
+_response_cache = None
+_metadata_cache = None
+_metadata_cache_lock = threading.Lock()
+
+
+class ResponseCache(object):
+	"""The '<Nanigans Response Cache [path]>' object keeps the responses of
+	adhoc and events requests for settled days in a SQLite file, so a range
+	that was fetched before is only downloaded again for its recent days.
+
+	Entries are keyed on the resource, site, required fields and sorted
+	parameters of the request, which include its dates. A request touching
+	today or any of the mutable_days days before it is never read from or
+	written to the cache, because data for those days may still change, so
+	the default of 3 always fetches 4 days: today-3 up to today. Only successful
+	responses are stored. Once the stored bodies exceed max_bytes the least
+	recently used entries are evicted.
+
+	:param path: str, SQLite file holding the cache
+	:param mutable_days: int, number of days before today that are always fetched
+	:param max_bytes: int, size the stored responses are kept under
+	:param resources: tuple, resources whose responses are cached
+	"""
+	_schema = '''CREATE TABLE IF NOT EXISTS responses (
+		key TEXT PRIMARY KEY, resource TEXT, site TEXT, source TEXT,
+		first_day TEXT, last_day TEXT, size INTEGER, accessed REAL, body BLOB)'''
+
+	def __init__(self, path, mutable_days=3, max_bytes=2**30, resources=('adhoc','events')):
+		self.path = path
+		self.mutable_days = mutable_days
+		self.max_bytes = max_bytes
+		self.resources = resources
+		self._lock = threading.Lock()
+		with self._connect() as db:
+			db.execute(self._schema)
+
+	def key(self, request, site):
+		"""Returns the cache key of a request, or None when its response
+		must not be cached.
+
+		:param request: PreparedRequest, the request about to be sent
+		:param site: str, site the request is sent for
+		"""
+		if request.resource not in self.resources:
+			return None
+		first_day, last_day = self._days(request)
+		settled = (date.today()-timedelta(days=self.mutable_days)).strftime('%Y-%m-%d')
+		if not last_day or last_day >= settled:
+			return None
+
+		parameters = dict((k, v) for k, v in request.parameters.items()
+						  if k not in ('access_token', 'format'))
+		fingerprint = json.dumps([request.resource, str(site), request.required_fields,
+								  parameters], sort_keys=True, default=str)
+		return hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()
+
+	def load(self, key):
+		"""Returns the data stored under key, or None on a miss.
+
+		:param key: str, key returned by the key method
+		"""
+		with self._lock, self._connect() as db:
+			row = db.execute('SELECT body FROM responses WHERE key = ?', (key,)).fetchone()
+			if row is None:
+				return None
+			db.execute('UPDATE responses SET accessed = ? WHERE key = ?', (time.time(), key))
+		return json.loads(row[0])
+
+	def store(self, key, request, site, data):
+		"""Stores the data of a successful response under key.
+
+		:param key: str, key returned by the key method
+		:param request: PreparedRequest, the request that was sent
+		:param site: str, site the request was sent for
+		:param data: list, entities returned for the request, dicts or Rows
+		"""
+		body = json.dumps(as_dicts(data))
+		first_day, last_day = self._days(request)
+		with self._lock, self._connect() as db:
+			db.execute('INSERT OR REPLACE INTO responses VALUES (?,?,?,?,?,?,?,?,?)',
+					   (key, request.resource, str(site), request.required_fields.get('source'),
+						first_day, last_day, len(body), time.time(), body))
+			self._evict(db)
+
+	def invalidate(self, site=None, source=None, resource=None, start=None, end=None):
+		"""Removes the entries matching every given argument, e.g. all
+		entries of a site, or those overlapping a date range. Without
+		arguments the whole cache is emptied.
+
+		:param site: str, site id
+		:param source: str, data source such as placements
+		:param resource: str, adhoc or events
+		:param start: str, first day in %Y-%m-%d format
+		:param end: str, last day in %Y-%m-%d format
+		"""
+		clauses, values = [], []
+		for column, value in (('site', site), ('source', source), ('resource', resource)):
+			if value is not None:
+				clauses.append(column+' = ?')
+				values.append(str(value))
+		if start:
+			clauses.append('last_day >= ?')
+			values.append(start)
+		if end:
+			clauses.append('first_day <= ?')
+			values.append(end)
+		where = ' WHERE '+' AND '.join(clauses) if clauses else ''
+		with self._lock, self._connect() as db:
+			return db.execute('DELETE FROM responses'+where, values).rowcount
+
+	@property
+	def size(self):
+		with self._connect() as db:
+			return db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+	def _evict(self, db):
+		total = db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+		if total <= self.max_bytes:
+			return
+		for key, size in db.execute('SELECT key, size FROM responses ORDER BY accessed').fetchall():
+			db.execute('DELETE FROM responses WHERE key = ?', (key,))
+			total -= size
+			if total <= self.max_bytes:
+				break
+
+	def _days(self, request):
+		parameters = request.parameters
+		if 'date' in parameters:
+			return parameters['date'], parameters['date']
+		return parameters.get('start'), parameters.get('end')
+
+	def _connect(self):
+		return Connection(self.path)
+
+	def __repr__(self):
+		return '<Nanigans Response Cache [{0}]>'.format(self.path)
+
+
+class Connection(object):
+	"""Opens a SQLite connection that commits and closes on exit."""
+
+	def __init__(self, path):
+		self.db = sqlite3.connect(path, timeout=30)
+
+	def __enter__(self):
+		return self.db
+
+	def __exit__(self, exc_type, exc, tb):
+		try:
+			if exc_type is None:
+				self.db.commit()
+		finally:
+			self.db.close()
+
+
+class MetadataCache(object):
+	"""The '<Nanigans Metadata Cache [entries]>' object keeps the responses of
+	the attributes, metrics and timeranges resources in memory for ttl 
+	seconds, keyed by resource, site and data source. These rarely change, 
+	yet report builders request them before every query.
+
+	Concurrent callers asking for the same key while it is being fetched 
+	wait for that one request instead of sending their own. Only successful 
+	responses are kept, and every caller gets its own copy of the data.
+
+	:param ttl: float, seconds a response is kept for
+	:param resources: tuple, resources whose responses are kept
+	"""
+
+	def __init__(self, ttl=600, resources=('attributes','metrics','timeranges')):
+		self.ttl = ttl
+		self.resources = resources
+		self._entries = {}
+		self._flights = {}
+		self._lock = threading.Lock()
+
+	def get(self, key, fetch):
+		"""Returns a copy of the Response stored under key, calling fetch to 
+		get it when it is missing or expired.
+
+		:param key: tuple, (resource, site, source)
+		:param fetch: callable, returns the Response for key
+		"""
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry and entry[1] > time.time():
+				return _copy(entry[0])
+			flight = self._flights.get(key)
+			leader = flight is None
+			if leader:
+				flight = self._flights[key] = _Flight()
+
+		if leader:
+			try:
+				flight.response = fetch()
+			except Exception as e:
+				flight.error = e
+				raise
+			finally:
+				with self._lock:
+					if flight.response is not None and flight.response.ok:
+						self._entries[key] = (flight.response, time.time()+self.ttl)
+					del self._flights[key]
+				flight.done.set()
+		else:
+			flight.done.wait()
+			if flight.error is not None:
+				raise flight.error
+
+		return _copy(flight.response)
+
+	def invalidate(self, resource=None, site=None, source=None):
+		"""Removes the entries matching every given argument. Without 
+		arguments the whole cache is emptied.
+
+		:param resource: str, attributes, metrics or timeranges
+		:param site: str, site id
+		:param source: str, data source such as placements
+		"""
+		match = (resource, str(site) if site is not None else None, source)
+		with self._lock:
+			for key in list(self._entries):
+				if all(m is None or m == k for m, k in zip(match, key)):
+					del self._entries[key]
+
+	def __repr__(self):
+		return '<Nanigans Metadata Cache [{0}]>'.format(len(self._entries))
+
+
+def _copy(response):
+	"""Copies a Response down to its rows."""
+	return type(response)(copy.deepcopy(response.data), copy.deepcopy(response.errors))
+
+
+class _Flight(object):
+	"""A fetch in progress that other callers can wait for."""
+
+	def __init__(self):
+		self.done = threading.Event()
+		self.response = None
+		self.error = None
+
+
+def get_response_cache():
+	"""Return the response cache used by PreparedRequest.send, or None
+	when responses are not cached.
+	"""
+	return _response_cache
+
+
+def set_response_cache(cache):
+	"""Cache the responses of settled days, e.g.
+	set_response_cache(ResponseCache('/var/cache/nanigans.sqlite')).
+	Passing None turns caching off.
+
+	:param cache: ResponseCache, cache used by PreparedRequest.send
+	"""
+	global _response_cache
+
+	_response_cache = cache
+
+	return
+
+
+def get_metadata_cache():
+	"""Return the metadata cache used by PreparedRequest.send, creating
+	the default one on first use.
+	"""
+	global _metadata_cache
+
+	if _metadata_cache is None:
+		with _metadata_cache_lock:
+			if _metadata_cache is None:
+				_metadata_cache = MetadataCache()
+
+	return _metadata_cache
+
+
+def set_metadata_cache(cache):
+	"""Replace the metadata cache, e.g. with a longer ttl. Passing 
+	MetadataCache(resources=()) turns it off.
+
+	:param cache: MetadataCache, cache used by PreparedRequest.send
+	"""
+	global _metadata_cache
+
+	with _metadata_cache_lock:
+		_metadata_cache = cache
+
+	return
@@ -0,0 +1,164 @@
+"""
+Site-scoped clients for using several sites at the same time.
+
+"""
+import inspect
+import threading
+
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from nanigans import auth
+from nanigans.auth import activate_client, resolve_token
+from nanigans.utils import create_session
+from nanigans.models import Response
+
+
+class Client(object):
+	"""The '<Nanigans Client [site]>' object carries the site id, access token
+	and session used for one site, independently of the global credentials
+	set with set_default_config and change_site_id.
+
+	Every nanigans call made inside the client's scope, including requests
+	sent from worker threads and asyncio tasks it starts, uses the client's
+	site, token and session:
+
+		client = Client(123456)
+		with client.scope():
+			stats = nanigans.facebook.get_stats()
+
+		stats = client.facebook.get_stats()
+
+	The username and password default to the global credentials. The token
+	is fetched through the token cache on first use.
+
+	:param site: str, unique site id assigned by Nanigans
+	:param username: str, defaults to the global username
+	:param password: str, defaults to the global password
+	:param session: requests.Session, defaults to a new pooled session
+	"""
+
+	def __init__(self, site, username=None, password=None, session=None):
+		defaults = auth.credentials or {}
+		self.credentials = {'username': username or defaults.get('username'),
+							'password': password or defaults.get('password'),
+							'site': str(site),
+							'token': None}
+		self._session = session
+		self._lock = threading.Lock()
+		self._session_lock = threading.Lock()
+
+	@property
+	def site(self):
+		return self.credentials['site']
+
+	@property
+	def token(self):
+		return resolve_token(self.credentials, self._lock)
+
+	@property
+	def session(self):
+		if self._session is None:
+			with self._session_lock:
+				if self._session is None:
+					self._session = create_session()
+		return self._session
+
+	def scope(self):
+		"""Returns a context manager running its body as this client."""
+		return activate_client(self)
+
+	def call(self, function, *args, **kwargs):
+		"""Calls function as this client. Generators and coroutines it
+		returns keep running as this client when they are resumed.
+
+		:param function: callable, e.g. nanigans.facebook.get_stats
+		"""
+		with self.scope():
+			result = function(*args, **kwargs)
+		if inspect.isgenerator(result):
+			return self._generate(result)
+		if inspect.iscoroutine(result):
+			return self._await(result)
+		return result
+
+	def _generate(self, generator):
+		while True:
+			with self.scope():
+				try:
+					item = next(generator)
+				except StopIteration:
+					return
+			yield item
+
+	async def _await(self, coroutine):
+		with self.scope():
+			return await coroutine
+
+	@property
+	def facebook(self):
+		from nanigans.api import facebook
+		return _ScopedModule(self, facebook)
+
+	@property
+	def multichannel(self):
+		from nanigans.api import multichannel
+		return _ScopedModule(self, multichannel)
+
+	@property
+	def publishers(self):
+		from nanigans.api import publishers
+		return _ScopedModule(self, publishers)
+
+	@property
+	def events(self):
+		from nanigans.api import events
+		return _ScopedModule(self, events)
+
+	def __repr__(self):
+		return '<Nanigans Client [{0}]>'.format(self.site)
+
+
+class _ScopedModule(object):
+	"""An api module whose functions are called as a client."""
+
+	def __init__(self, client, module):
+		self._client = client
+		self._module = module
+
+	def __getattr__(self, name):
+		attr = getattr(self._module, name)
+		if callable(attr):
+			return partial(self._client.call, attr)
+		return attr
+
+
+def fetch_many_sites(sites, fetch, *args, max_sites=4, **kwargs):
+	"""Calls fetch(*args, **kwargs) for every site in parallel, each as its
+	own Client, and returns a dict of site to Response in the order the
+	sites were given, keyed by the site ids as given. A site whose call 
+	raises gets a Response holding the error instead of aborting the others.
+
+	For example, a week of stats for three sites with four requests in
+	flight per site:
+
+		fetch_many_sites([111, 222, 333], nanigans.facebook.get_stats,
+						 start='2016-06-01', end='2016-06-08', max_workers=4)
+
+	:param sites: iterable, site ids or Client objects
+	:param fetch: callable, returns a Response, e.g. nanigans.facebook.get_stats
+	:param max_sites: int, number of sites fetched at the same time
+	"""
+	clients = [(site.site, site) if isinstance(site, Client) else (site, Client(site)) 
+			   for site in sites]
+	results = {}
+
+	with ThreadPoolExecutor(max_workers=max(1, max_sites)) as executor:
+		futures = [(site, executor.submit(client.call, fetch, *args, **kwargs))
+				   for site, client in clients]
+		for site, future in futures:
+			try:
+				results[site] = future.result()
+			except Exception as e:
+				results[site] = Response(errors=[str(e)])
+
+	return results
@@ -0,0 +1,227 @@
+"""
+Columnar containers for Reporting API rows.
+
+"""
+import math
+
+from array import array
+
+
+def parse_number(value):
+	"""Parses a metric value as returned by the API, e.g. '1,234', '12.5%'
+	or '$1,000.00', into an int or float. Returns None when it is not a
+	number.
+
+	:param value: str/int/float, value to parse
+	"""
+	if isinstance(value, (int, float)) and not isinstance(value, bool):
+		return value
+	if not isinstance(value, str):
+		return None
+	text = value.strip().replace(',', '').lstrip('$').rstrip('%')
+	if not text:
+		return None
+	try:
+		return int(text)
+	except ValueError:
+		pass
+	try:
+		return float(text)
+	except ValueError:
+		return None
+
+
+class DictColumn(object):
+	"""The '<Nanigans Dict Column [rows, categories]>' object stores a column
+	of repeated strings, such as an attribute, as integer codes into a list
+	of distinct values. A missing value has the code -1.
+
+	:param codes: array, index into categories for each row
+	:param categories: list, distinct values in order of appearance
+	"""
+
+	def __init__(self, codes=None, categories=None):
+		self.codes = codes if codes is not None else array('l')
+		self.categories = categories if categories is not None else []
+		self._index = dict((value, code) for code, value in enumerate(self.categories))
+
+	def append(self, value):
+		if value is None:
+			self.codes.append(-1)
+			return
+		code = self._index.get(value)
+		if code is None:
+			code = self._index[value] = len(self.categories)
+			self.categories.append(value)
+		self.codes.append(code)
+
+	def decode(self):
+		"""Returns the column as a list of values."""
+		return [self.categories[code] if code >= 0 else None for code in self.codes]
+
+	def __getitem__(self, i):
+		code = self.codes[i]
+		return self.categories[code] if code >= 0 else None
+
+	def __iter__(self):
+		return iter(self.decode())
+
+	def __len__(self):
+		return len(self.codes)
+
+	def __repr__(self):
+		return '<Nanigans Dict Column [{0}, {1}]>'.format(len(self), len(self.categories))
+
+
+class Columns(object):
+	"""The '<Nanigans Columns [rows x columns]>' object holds rows column by
+	column. Metric columns are typed arrays, array('q') for whole numbers and
+	array('d') otherwise, with comma-formatted strings, percentages and
+	currency parsed. Every other column, e.g. attributes and dates, is a
+	DictColumn. A missing or unparseable metric is NaN, which turns its
+	column into floats.
+
+	Rows can be added in chunks with append, e.g. once per day yielded by
+	iter_stats, so the rows of a range never exist as dicts all at once.
+	Without a list of metrics, a column is treated as a metric when its
+	first value is a number, so pass metrics when attribute values look
+	numeric (e.g. placement ids).
+
+	:param metrics: list, names of the metric columns
+	"""
+
+	def __init__(self, metrics=None):
+		self.metrics = set(metrics) if metrics else None
+		self.columns = {}
+		self._length = 0
+
+	@classmethod
+	def from_rows(cls, rows, metrics=None):
+		"""Builds Columns from a list of row dicts.
+
+		:param rows: list, row dicts such as Response.data
+		:param metrics: list, names of the metric columns
+		"""
+		columns = cls(metrics)
+		columns.append(rows)
+		return columns
+
+	@classmethod
+	def from_responses(cls, responses, metrics=None):
+		"""Builds Columns from an iterable of Responses, e.g. iter_stats.
+
+		:param responses: iterable, Response objects
+		:param metrics: list, names of the metric columns
+		"""
+		columns = cls(metrics)
+		for response in responses:
+			columns.append(response.data)
+		return columns
+
+	def append(self, rows):
+		"""Appends a list of row dicts.
+
+		:param rows: list, row dicts
+		"""
+		for row in rows:
+			for name, value in row.items():
+				column = self.columns.get(name)
+				if column is None:
+					column = self._column(name, value)
+				if isinstance(column, DictColumn):
+					column.append(value)
+					continue
+				number = parse_number(value)
+				if number is None or (column.typecode == 'q' and not isinstance(number, int)):
+					column = self._floats(name)
+					number = float('nan') if number is None else number
+				column.append(number)
+			self._length += 1
+			if len(row) < len(self.columns):
+				for name in self.columns:
+					if name not in row:
+						self._pad(name)
+
+	def _column(self, name, value):
+		if self.metrics is not None:
+			is_metric = name in self.metrics
+		else:
+			is_metric = name != 'date' and parse_number(value) is not None
+		self.columns[name] = array('q') if is_metric else DictColumn()
+		for _ in range(self._length):
+			self._pad(name)
+		return self.columns[name]
+
+	def _floats(self, name):
+		column = self.columns[name]
+		if column.typecode == 'q':
+			column = self.columns[name] = array('d', column)
+		return column
+
+	def _pad(self, name):
+		column = self.columns[name]
+		if isinstance(column, DictColumn):
+			column.append(None)
+		else:
+			self._floats(name).append(float('nan'))
+
+	def keys(self):
+		return self.columns.keys()
+
+	def rows(self):
+		"""Yields the rows back as dicts, with metrics as numbers."""
+		names = list(self.columns)
+		for i in range(self._length):
+			row = {}
+			for name in names:
+				value = self.columns[name][i]
+				if isinstance(value, float) and math.isnan(value):
+					value = None
+				row[name] = value
+			yield row
+
+	def to_numpy(self):
+		"""Returns a dict of NumPy arrays. Metrics keep their dtype and other
+		columns become object arrays. Requires numpy.
+		"""
+		import numpy
+
+		arrays = {}
+		for name, column in self.columns.items():
+			if isinstance(column, DictColumn):
+				categories = numpy.array(column.categories+[None], dtype=object)
+				codes = numpy.array(column.codes, dtype=numpy.int64)
+				arrays[name] = categories[codes]
+			else:
+				dtype = numpy.int64 if column.typecode == 'q' else numpy.float64
+				arrays[name] = numpy.frombuffer(column, dtype=dtype).copy()
+		return arrays
+
+	def to_pandas(self):
+		"""Returns a pandas DataFrame with dictionary-encoded columns as
+		categoricals. Requires pandas.
+		"""
+		import numpy
+		import pandas
+
+		frame = {}
+		for name, column in self.columns.items():
+			if isinstance(column, DictColumn):
+				codes = numpy.array(column.codes, dtype=numpy.int64)
+				frame[name] = pandas.Categorical.from_codes(codes, categories=column.categories)
+			else:
+				dtype = numpy.int64 if column.typecode == 'q' else numpy.float64
+				frame[name] = numpy.frombuffer(column, dtype=dtype).copy()
+		return pandas.DataFrame(frame)
+
+	def __getitem__(self, name):
+		return self.columns[name]
+
+	def __contains__(self, name):
+		return name in self.columns
+
+	def __len__(self):
+		return self._length
+
+	def __repr__(self):
+		return '<Nanigans Columns [{0} x {1}]>'.format(self._length, len(self.columns))
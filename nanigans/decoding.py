@@ -0,0 +1,404 @@
+"""
+JSON decoding of Reporting API responses.
+
+"""
+import codecs
+import contextvars
+import json
+import multiprocessing
+import re
+import threading
+
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from nanigans.rows import compact, row_type
+
+_decoder = None
+_decoder_lock = threading.Lock()
+_active_decoder = contextvars.ContextVar('nanigans_decoder', default=None)
+_backends = ('orjson', 'ujson', 'json')
+_whitespace = re.compile(r'[ \t\n\r]*')
+_blank = frozenset(' \t\n\r')
+
+
+class Decoder(object):
+	"""The '<Nanigans Decoder [backend]>' object turns response bodies into
+	Python objects.
+
+	Whole bodies are decoded with orjson or ujson when one is installed,
+	otherwise with the standard library. Bodies of the resources listed in
+	stream are instead read from the socket a chunk at a time and the items
+	of their data array are decoded one by one, so neither the raw body nor
+	its text is held in memory, which matters for the events of busy days.
+
+	:param backend: str, orjson, ujson or json, defaults to the fastest installed
+	:param stream: tuple, resources whose bodies are parsed incrementally
+	:param chunk_size: int, bytes read from the socket at a time when streaming
+	"""
+
+	def __init__(self, backend=None, stream=(), chunk_size=2**16):
+		if backend is None:
+			backend = _available()
+		if backend not in _backends:
+			raise ValueError('Unknown JSON backend {0!r}.'.format(backend))
+		self.backend = backend
+		self.stream = tuple(stream)
+		self.chunk_size = chunk_size
+		self._loads = __import__(backend).loads
+
+	def streams(self, resource):
+		"""Whether the bodies of resource are parsed incrementally.
+
+		:param resource: str, resource being requested
+		"""
+		return resource in self.stream
+
+	def loads(self, body, day=None):
+		"""Decodes a whole body.
+
+		:param body: bytes/str, JSON document
+		:param day: str, date added to every row of a successful response
+		"""
+		return _date(self._loads(body), day)
+
+	def decode(self, resp, stream=False, day=None):
+		"""Decodes the body of a requests Response. Streamed responses must
+		have been requested with stream=True.
+
+		:param resp: requests.Response, response to decode
+		:param stream: bool, parse the body incrementally from resp.raw
+		:param day: str, date added to every row of a successful response
+		"""
+		if stream:
+			resp.raw.decode_content = True
+			return _date(self.parse(resp.raw), day)
+		if self.backend == 'json':
+			return _date(resp.json(), day)
+		return _date(self._loads(resp.content), day)
+
+	def parse(self, fileobj, key='data'):
+		"""Parses a JSON object from a binary file-like object, reading the
+		array under key one item at a time.
+
+		:param fileobj: file-like, returns bytes from read
+		:param key: str, member holding the array
+		"""
+		items = self.iter_items(fileobj, key)
+		data = list(items)
+		document = dict(items.members)
+		if items.found:
+			document[key] = data
+		return document
+
+	def iter_items(self, fileobj, key='data'):
+		"""Returns an ArrayStream yielding the items of the array under key
+		as they are read from a binary file-like object, without holding
+		the whole array. The other members of the object are available from
+		its members attribute once iteration is over.
+
+		:param fileobj: file-like, returns bytes from read
+		:param key: str, member holding the array
+		"""
+		return ArrayStream(fileobj, key, self.chunk_size, self._loads)
+
+	def __repr__(self):
+		return '<Nanigans Decoder [{0}]>'.format(self.backend)
+
+
+class ProcessDecoder(Decoder):
+	"""The '<Nanigans Process Decoder [processes]>' object decodes bodies in a
+	pool of worker processes, so that decoding a large pull uses every core
+	while the threads of send_many keep downloading. The thread that
+	received a body waits for its result, and responses are still returned
+	in date order.
+
+	The worker also adds the date to each row and, with compact, turns the
+	rows into Rows, sending back one header and a tuple of values per row,
+	which is much cheaper to receive than the dicts. Bodies are read whole,
+	and bodies smaller than min_size are decoded in the thread, since
+	sending them to a process costs more than decoding them.
+
+	The pool is started on first use and stopped by close, or at the end of
+	a with block:
+
+		with ProcessDecoder(4, compact=True) as decoder, activate_decoder(decoder):
+			events = nanigans.events.get_time_of_click(max_workers=8)
+
+	:param processes: int, worker processes, defaults to the number of cores
+	:param compact: bool, return the rows of successful responses as Rows
+	:param min_size: int, bytes from which a body is sent to a worker
+	:param backend: str, orjson, ujson or json, defaults to the fastest installed
+	"""
+
+	def __init__(self, processes=None, compact=False, min_size=2**16, backend=None):
+		super(ProcessDecoder, self).__init__(backend)
+		self.processes = processes
+		self.compact = compact
+		self.min_size = min_size
+		self._pool = None
+		self._lock = threading.Lock()
+
+	def loads(self, body, day=None):
+		document = super(ProcessDecoder, self).loads(body, day)
+		if self.compact and _ok(document):
+			compact(document['data'])
+		return document
+
+	def decode(self, resp, stream=False, day=None):
+		body = resp.content
+		if len(body) < self.min_size:
+			return self.loads(body, day)
+		document, header = self.pool.submit(_decode, self.backend, body, day, self.compact).result()
+		if header is not None:
+			document['data'] = list(map(row_type(header), document['data']))
+		return document
+
+	@property
+	def pool(self):
+		if self._pool is None:
+			with self._lock:
+				if self._pool is None:
+					context = multiprocessing.get_context('spawn')
+					self._pool = ProcessPoolExecutor(self.processes, mp_context=context)
+		return self._pool
+
+	def close(self):
+		"""Stops the worker processes."""
+		with self._lock:
+			if self._pool is not None:
+				self._pool.shutdown()
+				self._pool = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def __repr__(self):
+		return '<Nanigans Process Decoder [{0}]>'.format(self.processes or multiprocessing.cpu_count())
+
+
+class ArrayStream(object):
+	"""The '<Nanigans Array Stream [key]>' object incrementally parses a JSON
+	object read from a binary file-like object. Iterating over it yields the
+	items of the array under key as they are read. The other members of the
+	object are decoded whole and available from members once iteration is
+	over.
+
+	Only the unparsed part of the current chunk is kept, so memory use is
+	bounded by the chunk size and the largest single item. The whole items
+	of each chunk are decoded together with loads, falling back to one at a 
+	time for arrays of nested objects.
+
+	:param fileobj: file-like, returns bytes from read
+	:param key: str, member holding the array
+	:param chunk_size: int, bytes read at a time
+	:param loads: callable, decodes a batch of whole items
+	"""
+
+	def __init__(self, fileobj, key='data', chunk_size=2**16, loads=json.loads):
+		self.key = key
+		self.chunk_size = chunk_size
+		self.members = {}
+		self.found = False
+		self._file = fileobj
+		self._text = codecs.getincrementaldecoder('utf-8')()
+		self._scanner = json.JSONDecoder()
+		self._buffer = ''
+		self._pos = 0
+		self._eof = False
+		self._batch = True
+		self._loads = loads
+
+	def __iter__(self):
+		self._expect('{')
+		if self._peek() == '}':
+			self._pos += 1
+			return
+		while True:
+			name = self._value()
+			self._expect(':')
+			if name == self.key and self._peek() == '[':
+				self.found = True
+				self._pos += 1
+				if self._peek() == ']':
+					self._pos += 1
+				else:
+					yield from self._items()
+			else:
+				self.members[name] = self._value()
+			if self._expect(',}') == '}':
+				return
+
+	def _items(self):
+		"""Yields the items of the array being read, up to its closing bracket."""
+		scan = self._scanner.scan_once
+		match = _whitespace.match
+		while True:
+			buffer, pos = self._buffer, self._pos
+			size = len(buffer)
+			# Decode every whole object in the buffer at once, which only 
+			# succeeds when the last '},' really ends an item
+			cut = buffer.rfind('},', pos) if self._batch else -1
+			if cut > pos:
+				try:
+					items = self._loads('['+buffer[pos:cut+1]+']')
+				except ValueError:
+					self._batch = False
+				else:
+					self._pos = cut+2
+					yield from items
+					continue
+			try:
+				while True:
+					if buffer[pos:pos+1] in _blank:
+						pos = match(buffer, pos).end()
+					value, pos = scan(buffer, pos)
+					if buffer[pos:pos+1] in _blank:
+						pos = match(buffer, pos).end()
+					# The item or its delimiter may continue in the next chunk
+					if pos >= size or buffer[pos] not in ',]':
+						break
+					self._pos = pos+1
+					if buffer[pos] == ']':
+						yield value
+						return
+					pos += 1
+					yield value
+			except (StopIteration, json.JSONDecodeError):
+				if self._eof:
+					raise ValueError('Invalid item in {0!r} array of JSON stream'.format(self.key))
+			if self._eof:
+				raise ValueError('Unterminated {0!r} array in JSON stream'.format(self.key))
+			self._fill()
+
+	def _fill(self):
+		"""Reads another chunk, returning False at the end of the stream."""
+		if self._eof:
+			return False
+		chunk = self._file.read(self.chunk_size)
+		self._eof = not chunk
+		self._buffer = self._buffer[self._pos:]+self._text.decode(chunk, self._eof)
+		self._pos = 0
+		return not self._eof
+
+	def _peek(self):
+		"""Skips whitespace and returns the next character, '' at the end."""
+		while True:
+			self._pos = _whitespace.match(self._buffer, self._pos).end()
+			if self._pos < len(self._buffer):
+				return self._buffer[self._pos]
+			if not self._fill():
+				return ''
+
+	def _expect(self, chars):
+		char = self._peek()
+		if not char or char not in chars:
+			raise ValueError('Expecting one of {0!r} in JSON stream, got {1!r}'.format(chars, char))
+		self._pos += 1
+		return char
+
+	def _value(self):
+		self._peek()
+		while True:
+			try:
+				value, end = self._scanner.raw_decode(self._buffer, self._pos)
+			except ValueError:
+				if self._eof:
+					raise
+				self._fill()
+				continue
+			# A number at the end of the buffer may continue in the next chunk
+			if isinstance(value, (int, float)) and not isinstance(value, bool) and not self._eof:
+				after = _whitespace.match(self._buffer, end).end()
+				if self._buffer[after:after+1] not in (',', ']', '}'):
+					self._fill()
+					continue
+			self._pos = end
+			return value
+
+	def __repr__(self):
+		return '<Nanigans Array Stream [{0}]>'.format(self.key)
+
+
+def _ok(document):
+	return isinstance(document, dict) and document.get('success') and \
+		isinstance(document.get('data'), list)
+
+
+def _date(document, day):
+	"""Adds day to every row of a successful response."""
+	if day is not None and _ok(document):
+		for item in document['data']:
+			item['date'] = day
+	return document
+
+
+def _decode(backend, body, day, packed):
+	"""Decodes a body in a worker process and returns the document and the
+	header of its rows. With packed, the rows of a successful response are
+	sent back as a tuple of values each, otherwise the header is None.
+	"""
+	document = _date(__import__(backend).loads(body), day)
+	if not (packed and _ok(document)):
+		return document, None
+	rows = compact(document['data'])
+	document['data'] = [row.values() for row in rows]
+	return document, rows[0].keys() if rows else ()
+
+
+def _available():
+	"""Name of the fastest JSON backend installed."""
+	for backend in _backends:
+		try:
+			__import__(backend)
+		except ImportError:
+			continue
+		return backend
+
+
+def get_decoder():
+	"""Return the decoder used by every adapter, creating the default one
+	on first use. Inside activate_decoder, the decoder it was given.
+	"""
+	global _decoder
+
+	decoder = _active_decoder.get()
+	if decoder is not None:
+		return decoder
+
+	if _decoder is None:
+		with _decoder_lock:
+			if _decoder is None:
+				_decoder = Decoder()
+
+	return _decoder
+
+
+def set_decoder(decoder):
+	"""Replace the decoder, e.g. set_decoder(Decoder(stream=('events',))) to
+	parse event responses incrementally. Passing None restores the default.
+
+	:param decoder: Decoder, decoder used by every adapter
+	"""
+	global _decoder
+
+	with _decoder_lock:
+		_decoder = decoder
+
+	return
+
+
+@contextmanager
+def activate_decoder(decoder):
+	"""Run the body of a with statement, and the threads and tasks it
+	starts through nanigans, with decoder instead of the shared one.
+
+	:param decoder: Decoder, decoder used inside the with statement
+	"""
+	reset = _active_decoder.set(decoder)
+	try:
+		yield decoder
+	finally:
+		_active_decoder.reset(reset)
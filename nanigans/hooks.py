@@ -0,0 +1,307 @@
+"""
+Instrumentation hooks called by the adapters around every request.
+
+"""
+import bisect
+import threading
+
+_hooks = None
+_hooks_lock = threading.Lock()
+
+EVENTS = ('before_request', 'after_response', 'on_error', 'on_retry')
+
+
+class Attempt(object):
+	"""The '<Nanigans Attempt [resource date #number]>' object describes one
+	attempt at a request and is handed to every hook called for it. Its
+	fields are filled in as the attempt progresses.
+
+	timings holds the following durations in seconds, or None when they do
+	not apply to the attempt:
+
+		wait: time spent waiting for the rate limiter
+		dns, connect: name resolution and connection set up, None when the
+			HTTP client does not report them, e.g. with requests
+		ttfb: from sending the request until the response headers arrived
+		transfer: from sending the request until the body was received,
+			which for streamed bodies is read while decoding instead
+		parse: decoding the body
+		total: the whole attempt, including the wait
+
+	:param resource: str, resource requested, e.g. adhoc or events
+	:param site: str, site id the request is sent for
+	:param params: dict, query parameters of the request, copied without
+		the access token
+	:param number: int, attempt number, starting at 1
+	"""
+
+	def __init__(self, resource, site, params, number):
+		self.resource = resource
+		self.site = site
+		self.params = dict((k, v) for k, v in params.items() if k != 'access_token')
+		self.number = number
+		self.start = params.get('start')
+		self.date = params.get('end', params.get('date'))
+		self.url = None
+		self.status = None
+		self.bytes = None
+		self.ok = None
+		self.error = None
+		self.delay = None
+		self.timings = dict.fromkeys(('wait', 'dns', 'connect', 'ttfb', 'transfer', 'parse',
+									  'total'))
+
+	def __repr__(self):
+		return '<Nanigans Attempt [{0} {1} #{2}]>'.format(self.resource, self.date, self.number)
+
+
+class Hooks(object):
+	"""The '<Nanigans Hooks [callbacks]>' object holds the callbacks the adapters
+	call with the Attempt of every request:
+
+		before_request: the request is about to be sent
+		after_response: a response arrived and was decoded, whatever its status
+		on_error: the attempt failed, including API errors and lost connections
+		on_retry: the attempt failed and is sent again after Attempt.delay seconds
+
+	Callbacks run on the thread sending the request, so they should be quick
+	and thread safe. An exception raised by a callback propagates to the
+	caller of the request.
+
+		hooks = Hooks()
+		hooks.register('on_retry', lambda attempt: print(attempt, attempt.error))
+		set_hooks(hooks)
+	"""
+
+	def __init__(self):
+		self._callbacks = dict((event, ()) for event in EVENTS)
+		self._lock = threading.Lock()
+
+	@property
+	def active(self):
+		"""Whether any callback is registered."""
+		return any(self._callbacks.values())
+
+	def register(self, event, callback):
+		"""Adds a callback for an event and returns it, so it can be used
+		as a decorator.
+
+		:param event: str, one of before_request, after_response, on_error, on_retry
+		:param callback: callable, takes the Attempt
+		"""
+		if event not in self._callbacks:
+			raise ValueError('Unknown event {0!r}.'.format(event))
+		with self._lock:
+			self._callbacks[event] += (callback,)
+		return callback
+
+	def unregister(self, event, callback):
+		"""Removes a callback from an event.
+
+		:param event: str, one of before_request, after_response, on_error, on_retry
+		:param callback: callable, a registered callback
+		"""
+		with self._lock:
+			self._callbacks[event] = tuple(c for c in self._callbacks[event] if c != callback)
+
+	def emit(self, event, attempt):
+		"""Calls the callbacks of an event with an Attempt."""
+		for callback in self._callbacks[event]:
+			callback(attempt)
+
+	def __repr__(self):
+		return '<Nanigans Hooks [{0}]>'.format(sum(map(len, self._callbacks.values())))
+
+
+class Histogram(object):
+	"""The '<Nanigans Histogram [count]>' object counts durations in buckets
+	with the given upper bounds in seconds, plus one for longer ones.
+
+	:param bounds: tuple, increasing upper bounds of the buckets
+	"""
+	bounds = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+	def __init__(self, bounds=None):
+		self.bounds = tuple(bounds) if bounds else self.bounds
+		self.counts = [0]*(len(self.bounds)+1)
+		self.count = 0
+		self.sum = 0.0
+		self.max = 0.0
+
+	def observe(self, value):
+		self.counts[bisect.bisect_left(self.bounds, value)] += 1
+		self.count += 1
+		self.sum += value
+		self.max = max(self.max, value)
+
+	@property
+	def mean(self):
+		return self.sum/self.count if self.count else 0.0
+
+	def quantile(self, share):
+		"""Upper bound of the bucket holding the given share of the
+		durations, or the longest duration once past the last bound.
+
+		:param share: float, between 0 and 1
+		"""
+		if not self.count:
+			return 0.0
+		rank = share*self.count
+		seen = 0
+		for bound, count in zip(self.bounds, self.counts):
+			seen += count
+			if seen >= rank:
+				return min(bound, self.max)
+		return self.max
+
+	def __repr__(self):
+		return '<Nanigans Histogram [{0}]>'.format(self.count)
+
+
+class Collector(object):
+	"""The '<Nanigans Collector [endpoints]>' object aggregates the attempts
+	reported by the hooks per endpoint, i.e. per resource such as adhoc,
+	view or events: requests, errors, retries, bytes and histograms of the
+	ttfb, parse and total timings. It also adds up the time spent per
+	endpoint and day, so the slowest days can be found.
+
+		collector = Collector().install()
+		nanigans.facebook.get_stats(start='2016-06-01', end='2016-07-01')
+		collector.summary()
+		collector.slowest_days()
+
+	:param bounds: tuple, upper bounds of the histogram buckets in seconds
+	"""
+	timings = ('ttfb', 'parse', 'total')
+
+	def __init__(self, bounds=None):
+		self.bounds = bounds
+		self._endpoints = {}
+		self._days = {}
+		self._lock = threading.Lock()
+
+	def install(self, hooks=None):
+		"""Registers the collector with hooks, by default the shared ones,
+		and returns it.
+
+		:param hooks: Hooks, defaults to the hooks returned by get_hooks
+		"""
+		hooks = hooks if hooks is not None else get_hooks()
+		hooks.register('after_response', self._response)
+		hooks.register('on_error', self._error)
+		hooks.register('on_retry', self._retry)
+		return self
+
+	def uninstall(self, hooks=None):
+		"""Removes the collector from hooks, by default the shared ones.
+
+		:param hooks: Hooks, defaults to the hooks returned by get_hooks
+		"""
+		hooks = hooks if hooks is not None else get_hooks()
+		hooks.unregister('after_response', self._response)
+		hooks.unregister('on_error', self._error)
+		hooks.unregister('on_retry', self._retry)
+
+	def histogram(self, endpoint, timing='total'):
+		"""Returns the Histogram of a timing of an endpoint.
+
+		:param endpoint: str, resource such as adhoc
+		:param timing: str, ttfb, parse or total
+		"""
+		return self._endpoint(endpoint)[timing]
+
+	def summary(self):
+		"""Returns a dict per endpoint with its counts and the mean, p50,
+		p90, p99 and max total time in seconds, slowest endpoint first.
+		"""
+		rows = []
+		with self._lock:
+			for endpoint, stats in self._endpoints.items():
+				total = stats['total']
+				rows.append({'endpoint': endpoint,
+							 'requests': stats['requests'],
+							 'errors': stats['errors'],
+							 'retries': stats['retries'],
+							 'bytes': stats['bytes'],
+							 'mean': total.mean,
+							 'p50': total.quantile(0.5),
+							 'p90': total.quantile(0.9),
+							 'p99': total.quantile(0.99),
+							 'max': total.max})
+		return sorted(rows, key=lambda row: row['mean']*row['requests'], reverse=True)
+
+	def slowest_days(self, count=10):
+		"""Returns up to count (endpoint, day, seconds) tuples of the days
+		that took the longest in total, slowest first.
+
+		:param count: int, number of days returned
+		"""
+		with self._lock:
+			days = [(endpoint, day, seconds) for (endpoint, day), seconds in self._days.items()]
+		return sorted(days, key=lambda day: day[2], reverse=True)[:count]
+
+	def reset(self):
+		"""Forgets everything collected so far."""
+		with self._lock:
+			self._endpoints = {}
+			self._days = {}
+
+	def _endpoint(self, endpoint):
+		stats = self._endpoints.get(endpoint)
+		if stats is None:
+			stats = {'requests': 0, 'errors': 0, 'retries': 0, 'bytes': 0}
+			for timing in self.timings:
+				stats[timing] = Histogram(self.bounds)
+			self._endpoints[endpoint] = stats
+		return stats
+
+	def _response(self, attempt):
+		with self._lock:
+			stats = self._endpoint(attempt.resource)
+			stats['requests'] += 1
+			stats['bytes'] += attempt.bytes or 0
+			for timing in self.timings:
+				if attempt.timings[timing] is not None:
+					stats[timing].observe(attempt.timings[timing])
+			if attempt.date and attempt.timings['total'] is not None:
+				key = (attempt.resource, attempt.date)
+				self._days[key] = self._days.get(key, 0.0)+attempt.timings['total']
+
+	def _error(self, attempt):
+		with self._lock:
+			self._endpoint(attempt.resource)['errors'] += 1
+
+	def _retry(self, attempt):
+		with self._lock:
+			self._endpoint(attempt.resource)['retries'] += 1
+
+	def __repr__(self):
+		return '<Nanigans Collector [{0}]>'.format(len(self._endpoints))
+
+
+def get_hooks():
+	"""Return the hooks called by every adapter, creating empty ones on
+	first use.
+	"""
+	global _hooks
+
+	if _hooks is None:
+		with _hooks_lock:
+			if _hooks is None:
+				_hooks = Hooks()
+
+	return _hooks
+
+
+def set_hooks(hooks):
+	"""Replace the hooks called by every adapter. Passing None restores
+	empty hooks.
+
+	:param hooks: Hooks, hooks called around every request
+	"""
+	global _hooks
+
+	with _hooks_lock:
+		_hooks = hooks
+
+	return
@@ -2,11 +2,31 @@
 Core models used for accessing Nanigans ads server(s).
 
 """
+import asyncio
+import contextvars
+import time
 import requests
 
+from collections import deque
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 from nanigans import auth
+from nanigans.utils import get_session, generate_dates, next_date
+from nanigans.retry import get_retry_policy
+from nanigans.ratelimit import get_rate_limiter
+from nanigans.cache import get_response_cache, get_metadata_cache
+from nanigans.decoding import get_decoder
+from nanigans.hooks import Attempt, get_hooks
+from nanigans.columns import Columns
+from nanigans.rows import compact as compact_rows
 from nanigans.structures import StringDescriptor, DictDescriptor, ListDescriptor
 
+try:
+	import aiohttp
+	from yarl import URL
+except ImportError:
+	aiohttp = None
+
 class PreparedRequest(object):
 	"""The '<Nanigans Prepared Request [resource]>' object is used to send a
     request to one of the Nanigans resources.
@@ -33,9 +53,15 @@ class PreparedRequest(object):
 	:param parameters: dict, attributes, metrics, time range, etc.
 	:param filters: dict, similar to parameters will act to limit fields
 
+	When a response cache is set with nanigans.cache.set_response_cache, 
+	send returns cached data for settled days instead of sending the request.
+	Responses of the attributes, metrics and timeranges resources are kept in
+	memory by the cache returned by nanigans.cache.get_metadata_cache.
+
     Credit:
     https://github.com/essence-tech/twitter-ads-api/blob/master/twitter/models.py
 	"""
+	__slots__ = ('_resource', '_parameters', '_required_fields', '_filters')
 	resource = StringDescriptor()
 	parameters = DictDescriptor()
 	required_fields = DictDescriptor()
@@ -48,8 +74,32 @@ class PreparedRequest(object):
 		self.parameters = parameters if parameters else {}
 
 	def send(self):
+		metadata = get_metadata_cache()
+		if self.resource in metadata.resources:
+			key = (self.resource, str(auth.credentials['site']), self.required_fields.get('source'))
+			return metadata.get(key, self._send)
+		return self._send()
+
+	def iter_rows(self):
+		"""Yields the rows of the response one at a time as they are read
+		from the socket, see Adapter.iter_rows. The response cache is not
+		used.
+		"""
+		return Adapter(self).iter_rows()
+
+	def _send(self):
+		cache = get_response_cache()
+		key = cache.key(self, auth.credentials['site']) if cache else None
+		if key:
+			data = cache.load(key)
+			if data is not None:
+				return Response(data)
+
 		adapter = Adapter(self)
-		return adapter.get()
+		response = adapter.get()
+		if key and response.ok:
+			cache.store(key, self, auth.credentials['site'], response.data)
+		return response
 	
 	def __repr__(self):
 		return '<Nanigans Prepared Request [{0}]>'.format(self.resource)
@@ -67,6 +117,24 @@ class Adapter(object):
 	All requests will return an HTTP status of 200. Thus to handle errors, I have to 
 	either find the error message in the response or process the request text. 
 
+	Requests go through the session returned by nanigans.utils.get_session, so 
+	connections are kept alive and reused across adapters and threads.
+
+	Failed requests that look transient (connection errors, server errors, 
+	rate limiting) are sent again with backoff according to the policy 
+	returned by nanigans.retry.get_retry_policy. Only the errors of the last 
+	attempt end up in the Response.
+
+	Every attempt first waits for the rate limiter returned by 
+	nanigans.ratelimit.get_rate_limiter, which may limit requests per site
+	and per resource.
+
+	Bodies are decoded by the decoder returned by nanigans.decoding.get_decoder,
+	which may read the data of large responses from the socket incrementally.
+
+	Every attempt is reported to the hooks returned by nanigans.hooks.get_hooks
+	with its status, size and timings, when any are registered.
+
 	:param PreparedRequest: list, the entities provided by the resource.
 	"""
 	_base_endpoint = 'https://app.nanigans.com/reporting-api/sites/{0}'
@@ -85,29 +153,158 @@ class Adapter(object):
 		self._errors = []
 
 		# Required parameters that don't need to be repeatedly called in .parameters
-		self.request.parameters['access_token'] = auth.credentials['token']
+		self.request.parameters['access_token'] = auth.token
 		self.request.parameters['format'] = 'json' 
 		if self.request.resource == 'adhoc':
 			self.request.parameters['timeRange'] = 'custom'
 	
 	def get(self):
-		resp = requests.get(url=self.endpoint, params=self.params)
+		policy = get_retry_policy()
+		hooks = get_hooks()
+		attempt = 1
+		while True:
+			record = self._record(hooks, attempt)
+			response, status_code, decoded, retry_after = self._attempt(hooks, record)
+			self._report(hooks, record, response)
+			transient = not response.ok and \
+				policy.is_transient(status_code, response.errors, decoded)
+			if not policy.should_retry(attempt, response, transient):
+				response.date = self._day()
+				return response
+			delay = policy.delay(attempt, retry_after)
+			if record is not None:
+				record.delay = delay
+				hooks.emit('on_retry', record)
+			time.sleep(delay)
+			attempt += 1
+
+	def iter_rows(self):
+		"""Yields the rows of the response one at a time as they are read
+		from the socket, whatever the decoder's stream setting, with the date
+		added to the rows of single-day events and adhoc requests. Only the
+		current chunk of the body and the row being handled are held in
+		memory, so a day of events of any size can be written out row by row.
+
+		Failed attempts are retried like get as long as no row was yielded.
+		Once rows have been handed out a failure can not be retried, and
+		it raises ValueError, as do failures that are not retried.
+		"""
+		policy = get_retry_policy()
+		decoder = get_decoder()
+		day = self._day()
+		attempt = 1
+		while True:
+			resp, status_code, decoded, error, rows = None, None, True, None, 0
+			get_rate_limiter().acquire(auth.credentials['site'], self.request.resource)
+			try:
+				resp = get_session().get(url=self.endpoint, params=self.params, stream=True)
+				status_code = resp.status_code
+				if status_code == 200:
+					resp.raw.decode_content = True
+					items = decoder.iter_items(resp.raw)
+					for item in items:
+						if day is not None:
+							item['date'] = day
+						rows += 1
+						yield item
+					if items.members.get('success'):
+						return
+					error = items.members.get('error')
+				else:
+					document = decoder.loads(resp.content)
+					error = document.get('error') if isinstance(document, dict) else resp.text
+			except (requests.ConnectionError, requests.Timeout) as e:
+				error = str(e)
+			except (ValueError, requests.RequestException) as e:
+				error, decoded = str(e), False
+			finally:
+				if resp is not None:
+					resp.close()
+			transient = not rows and policy.is_transient(status_code, error, decoded)
+			if not policy.should_retry(attempt, Response(errors=[error]), transient):
+				raise ValueError(error)
+			time.sleep(policy.delay(attempt, _retry_after(resp.headers) if resp is not None else None))
+			attempt += 1
+
+	def _attempt(self, hooks=None, record=None):
+		self._data = []
+		self._errors = []
+		started = time.perf_counter()
+		get_rate_limiter().acquire(auth.credentials['site'], self.request.resource)
+		decoder = get_decoder()
+		stream = decoder.streams(self.request.resource)
+		if record is not None:
+			record.timings['wait'] = time.perf_counter()-started
+			record.url = self.endpoint
+			hooks.emit('before_request', record)
+		sent = time.perf_counter()
 		try:
-			resp_json = resp.json()
-		except:
-			self._errors.extend([resp.text])
-			return Response(self._data, self._errors)
-		if resp.status_code == 200:
+			if stream:
+				resp = get_session().get(url=self.endpoint, params=self.params, stream=True)
+			else:
+				resp = get_session().get(url=self.endpoint, params=self.params)
+		except (requests.ConnectionError, requests.Timeout) as e:
+			self._errors.extend([str(e)])
+			if record is not None:
+				record.timings['total'] = time.perf_counter()-started
+			return Response(self._data, self._errors), None, True, None
+		received = time.perf_counter()
+		try:
+			resp_json = decoder.decode(resp, stream, self._day())
+		except (ValueError, requests.RequestException) as e:
+			# A streamed body has already been consumed
+			self._errors.extend([str(e) if stream else resp.text])
+			return Response(self._data, self._errors), resp.status_code, False, \
+				_retry_after(resp.headers)
+		finally:
+			if stream:
+				resp.close()
+			if record is not None:
+				parsed = time.perf_counter()
+				record.status = resp.status_code
+				record.bytes = resp.raw.tell() if stream else len(resp.content)
+				record.timings.update(ttfb=resp.elapsed.total_seconds(), transfer=received-sent,
+									  parse=parsed-received, total=parsed-started)
+		response = self._process(resp.status_code, resp_json)
+		retry_after = None if response.ok else _retry_after(resp.headers)
+		return response, resp.status_code, True, retry_after
+
+	def _process(self, status_code, resp_json):
+		if status_code == 200:
 			if resp_json['success']:
-				if self.request.resource in ('events','adhoc'):
-					for item in resp_json['data']:
-						item['date'] = self.params['end']
 				self._data.extend(resp_json['data'])
 			else:
 				self._errors.extend([resp_json['error']])
 		else:
-			self._errors.extend([resp_json['error']])
+			self._errors.extend([resp_json.get('error')])
 		return Response(self._data, self._errors)
+
+	def _day(self):
+		"""The date the decoder adds to each row of single-day events and
+		adhoc responses. Multi-day adhoc requests carry a date attribute
+		on each row already.
+		"""
+		day = self.params.get('end', self.params.get('date'))
+		if self.request.resource in ('events','adhoc') and self.params.get('start', day) == day:
+			return day
+		return None
+
+	def _record(self, hooks, attempt):
+		"""An Attempt for the hooks to fill in, None when no hook is registered."""
+		if not hooks.active:
+			return None
+		return Attempt(self.request.resource, auth.credentials['site'], self.params, attempt)
+
+	def _report(self, hooks, record, response):
+		"""Calls the after_response and on_error hooks for a finished attempt."""
+		if record is None:
+			return
+		record.ok = response.ok
+		record.error = None if response.ok else response.errors
+		if record.status is not None:
+			hooks.emit('after_response', record)
+		if not response.ok:
+			hooks.emit('on_error', record)
 	
 	@property
 	def request(self):
@@ -145,6 +342,119 @@ class Adapter(object):
 		return '<Nanigans Adapter [Reporting API]>'
 
 
+class AsyncPreparedRequest(PreparedRequest):
+	"""The '<Nanigans Async Prepared Request [resource]>' object is the asyncio 
+	counterpart of the PreparedRequest. It takes the same arguments, but its 
+	send method is a coroutine returning a Response.
+	"""
+
+	async def send(self, session=None):
+		cache = get_response_cache()
+		key = cache.key(self, auth.credentials['site']) if cache else None
+		if key:
+			# The cache reads and writes a SQLite file, so keep it off the loop
+			data = await asyncio.get_running_loop().run_in_executor(None, cache.load, key)
+			if data is not None:
+				return Response(data)
+
+		adapter = AsyncAdapter(self)
+		response = await adapter.get(session)
+		if key and response.ok:
+			await asyncio.get_running_loop().run_in_executor(
+				None, cache.store, key, self, auth.credentials['site'], response.data)
+		return response
+
+	def __repr__(self):
+		return '<Nanigans Async Prepared Request [{0}]>'.format(self.resource)
+
+
+class AsyncAdapter(Adapter):
+	"""The '<Nanigans Async Adapter [Reporting API]>' object sends a request
+	without blocking the event loop.
+
+	When aiohttp is installed the request is made on the event loop itself, 
+	using the given aiohttp ClientSession or a temporary one. Without aiohttp 
+	the blocking Adapter.get runs in the loop's default executor instead.
+
+	:param PreparedRequest: AsyncPreparedRequest, the request to send
+	"""
+
+	async def get(self, session=None):
+		if aiohttp is None:
+			loop = asyncio.get_running_loop()
+			return await loop.run_in_executor(None, contextvars.copy_context().run, 
+											  partial(Adapter.get, self))
+		if session is None:
+			async with aiohttp.ClientSession() as session:
+				return await self.get(session)
+
+		policy = get_retry_policy()
+		hooks = get_hooks()
+		attempt = 1
+		while True:
+			record = self._record(hooks, attempt)
+			response, status_code, decoded, retry_after = \
+				await self._attempt_async(session, hooks, record)
+			self._report(hooks, record, response)
+			transient = not response.ok and \
+				policy.is_transient(status_code, response.errors, decoded)
+			if not policy.should_retry(attempt, response, transient):
+				response.date = self._day()
+				return response
+			delay = policy.delay(attempt, retry_after)
+			if record is not None:
+				record.delay = delay
+				hooks.emit('on_retry', record)
+			await asyncio.sleep(delay)
+			attempt += 1
+
+	async def _attempt_async(self, session, hooks=None, record=None):
+		self._data = []
+		self._errors = []
+		started = time.perf_counter()
+		# Let requests encode the parameters so both adapters send the same query
+		url = requests.Request('GET', self.endpoint, params=self.params).prepare().url
+		wait = get_rate_limiter().reserve(auth.credentials['site'], self.request.resource)
+		if wait:
+			await asyncio.sleep(wait)
+		if record is not None:
+			record.timings['wait'] = time.perf_counter()-started
+			record.url = self.endpoint
+			hooks.emit('before_request', record)
+		sent = time.perf_counter()
+		try:
+			async with session.get(URL(url, encoded=True)) as resp:
+				ttfb = time.perf_counter()-sent
+				status_code = resp.status
+				headers = resp.headers
+				body = await resp.read()
+		except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+			self._errors.extend([str(e)])
+			if record is not None:
+				record.timings['total'] = time.perf_counter()-started
+			return Response(self._data, self._errors), None, True, None
+		received = time.perf_counter()
+		try:
+			resp_json = get_decoder().loads(body, self._day())
+		except ValueError:
+			self._errors.extend([body.decode('utf-8', 'replace')])
+			return Response(self._data, self._errors), status_code, False, \
+				_retry_after(headers)
+		finally:
+			if record is not None:
+				parsed = time.perf_counter()
+				record.status = status_code
+				record.bytes = len(body)
+				record.timings.update(ttfb=ttfb, transfer=received-sent, parse=parsed-received,
+									  total=parsed-started)
+		response = self._process(status_code, resp_json)
+		retry_after = None if response.ok else _retry_after(headers)
+		return response, status_code, True, retry_after
+
+	def __repr__(self):
+		return '<Nanigans Async Adapter [Reporting API]>'
+
+
 class Response(object):
     """ The '<Nanigans Response [status]>' object is a carrier of information
     returned by the adapter. It should only need to be instantiated by the
@@ -155,19 +465,30 @@ class Response(object):
     requests returned while gathering the entities. The third is a boolean
     that reflects the success of the requests.
 
+    Responses are merged with +, which returns a new Response, or with += 
+    and extend, which append to the Response in place. concat merges many 
+    Responses at once, e.g. one per day of a date range, and tags the errors
+    of each failed day with its date, so callers know which days to retry.
+
+    The adapters set date on the Responses of single-day events and adhoc
+    requests.
+
     :param data: list, the entities provided by the resource.
     :param errors: dict, any failed requests whilist gathering the resource
     entities.
+    :param date: str, the day the Response covers, in %Y-%m-%d format
 
     Credit:
     https://github.com/essence-tech/twitter-ads-api/blob/master/twitter/models.py
     """
+    __slots__ = ('_data', '_errors', 'date')
     data = ListDescriptor()
     errors = ListDescriptor()
 
-    def __init__(self, data=None, errors=None):
+    def __init__(self, data=None, errors=None, date=None):
         self.data = data if data else []
         self.errors = errors if errors else []
+        self.date = date
 
     @property
     def ok(self):
@@ -183,7 +504,165 @@ class Response(object):
             return '<Nanigans Response [OK]>'
         return '<Nanigans Response [Incomplete]>'
 
+    def extend(self, other):
+        """Appends the data and errors of another Response in place."""
+        if not isinstance(other, Response):
+            raise TypeError("Adding a non-Response to a Response is not supported")
+        self.data.extend(other.data)
+        self.errors.extend(other.errors)
+
+    @classmethod
+    def concat(cls, responses):
+        """Merges an iterable of Responses into a new Response in a single 
+        pass, in the order they are given. The errors of a failed Response
+        with a date are added as one {'date': date, 'errors': errors} entry,
+        like the errors of a Backfill.
+
+        :param responses: iterable, Response objects to merge
+        """
+        response = cls()
+        for other in responses:
+            if isinstance(other, Response) and other.errors and other.date is not None:
+                response.data.extend(other.data)
+                response.errors.append({'date': other.date, 'errors': other.errors})
+            else:
+                response.extend(other)
+        return response
+
     def __add__(self, other):
         if not isinstance(other, Response):
             raise TypeError("Adding a non-Response to a Response is not supported")
         return Response(self.data + other.data, self.errors + other.errors)
+
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    def to_columns(self, metrics=None):
+        """Returns the data as Columns, with metrics parsed to numbers and
+        every other field dictionary-encoded. Columns.to_pandas and
+        Columns.to_numpy convert it further when pandas or numpy are
+        installed.
+
+        :param metrics: list, names of the metric fields
+        """
+        return Columns.from_rows(self.data, metrics)
+
+    def compact(self, fields=None):
+        """Replaces the row dicts of the data with Rows sharing one header,
+        which take a fraction of the memory and are read like dicts, and
+        returns the Response. The header starts with the given fields.
+
+        :param fields: list, e.g. the requested attributes and metrics
+        """
+        compact_rows(self.data, fields)
+        return self
+
+
+def _retry_after(headers):
+	"""Seconds asked for by a Retry-After header, if it holds a number."""
+	try:
+		return float(headers.get('Retry-After'))
+	except (TypeError, ValueError):
+		return None
+
+
+def send_many(prepared_requests, max_workers=1):
+	"""Sends a sequence of prepared requests and yields their responses in
+	the order the requests were given.
+
+	With max_workers greater than one the requests are sent from a thread 
+	pool. Only a bounded window of requests is submitted ahead of the one 
+	being yielded, so long date ranges do not queue every request at once.
+	Requests still waiting when the generator is closed are cancelled.
+
+	:param prepared_requests: iterable, PreparedRequest objects to send
+	:param max_workers: int, maximum number of requests in flight
+	"""
+	if not max_workers or max_workers <= 1:
+		for request in prepared_requests:
+			yield request.send()
+		return
+
+	executor = ThreadPoolExecutor(max_workers=max_workers)
+	pending = deque()
+	try:
+		for request in prepared_requests:
+			# Workers run in the caller's context, e.g. a Client scope
+			pending.append(executor.submit(contextvars.copy_context().run, request.send))
+			if len(pending) >= max_workers*2:
+				yield pending.popleft().result()
+		while pending:
+			yield pending.popleft().result()
+	finally:
+		for future in pending:
+			future.cancel()
+		executor.shutdown(wait=True)
+
+
+def send_chunked(build_request, start, end, chunk_size, max_workers=1, max_rows=None):
+	"""Sends requests covering the range from start up to but not including 
+	end in windows of up to chunk_size days, and yields a Response per 
+	window in the same most recent first order as generate_dates.
+
+	A multi-day window whose request fails, or returns max_rows rows or 
+	more, is split in two and its halves are sent in its place. Every 
+	window after it is then no larger than those halves, so a range that 
+	is too large for the chunk size settles on one that works.
+
+	:param build_request: callable, takes the first and last day of a window 
+	and returns the PreparedRequest for it
+	:param start: str, start date in %Y-%m-%d format 
+	:param end: str, end date in %Y-%m-%d format 
+	:param chunk_size: int, days covered by the largest window
+	:param max_workers: int, maximum number of requests in flight
+	:param max_rows: int, row count at which a window is split
+	"""
+	dates = generate_dates(start, end)
+	size = [chunk_size]
+	windows = deque()
+
+	def requests():
+		i = 0
+		while i < len(dates):
+			# Windows are cut as they are sent so they pick up any shrinking
+			window = dates[i:i+size[0]]
+			i += len(window)
+			windows.append(window)
+			yield build_request(window[-1], window[0])
+
+	for record in send_many(requests(), max_workers):
+		window = windows.popleft()
+		too_large = max_rows and len(record.data) >= max_rows
+		if len(window) > 1 and (not record.ok or too_large):
+			half = (len(window)+1)//2
+			size[0] = min(size[0], half)
+			for part in send_chunked(build_request, window[-1], next_date(window[0]), 
+									 half, max_workers, max_rows):
+				yield part
+			continue
+		yield record
+
+async def send_many_async(prepared_requests, max_concurrency=10):
+	"""Sends async prepared requests concurrently and returns their responses
+	in the order the requests were given.
+
+	:param prepared_requests: iterable, AsyncPreparedRequest objects to send
+	:param max_concurrency: int, maximum number of requests in flight
+	"""
+	semaphore = asyncio.Semaphore(max_concurrency)
+
+	# Authenticate off the event loop before the adapters need the token
+	await asyncio.get_running_loop().run_in_executor(None, contextvars.copy_context().run, 
+												   lambda: auth.token)
+
+	async def send(request, session):
+		async with semaphore:
+			return await request.send(session)
+
+	if aiohttp is None:
+		return await asyncio.gather(*[send(request, None) for request in prepared_requests])
+
+	connector = aiohttp.TCPConnector(limit=max_concurrency)
+	async with aiohttp.ClientSession(connector=connector) as session:
+		return await asyncio.gather(*[send(request, session) for request in prepared_requests])
@@ -0,0 +1,166 @@
+"""
+Normalization of the rows returned by the Reporting API.
+
+"""
+from datetime import date
+
+from nanigans.columns import parse_number
+
+_INTEGER_KINDS = ('int', 'integer', 'count', 'long')
+_FLOAT_KINDS = ('float', 'double', 'decimal', 'currency', 'money', 'percent', 'percentage', 'ratio')
+
+
+class Schema(object):
+	"""The '<Nanigans Schema [metrics, dates]>' object knows the type of each
+	field of a data source, so values can be converted with one converter
+	per field rather than by inspecting every value.
+
+	Metric kinds come from the type the metrics resource reports for each
+	metric, e.g. integer, currency or percent. Metrics of an unknown kind
+	are parsed as whichever number they hold. Percentages keep their unit,
+	so '12.5%' becomes 12.5.
+
+	:param metrics: dict, metric name to its kind, which may be None
+	:param dates: tuple, names of the date attributes
+	"""
+
+	def __init__(self, metrics=None, dates=('date',)):
+		self.metrics = dict(metrics) if metrics else {}
+		self.dates = tuple(dates)
+
+	@classmethod
+	def from_responses(cls, metrics, attributes):
+		"""Builds a Schema from the responses of get_metrics and
+		get_attributes. Failed responses and entries that can not be read
+		are skipped.
+
+		:param metrics: Response, returned by get_metrics
+		:param attributes: Response, returned by get_attributes
+		"""
+		kinds = {}
+		for name, kind in _fields(metrics):
+			kinds[name] = kind
+		dates = ['date']
+		for name, kind in _fields(attributes):
+			if name not in dates and ('date' in kind or name.lower().endswith('date')):
+				dates.append(name)
+		return cls(kinds, dates)
+
+	def converter(self, field):
+		"""Returns the function converting values of a metric field.
+
+		:param field: str, metric name
+		"""
+		kind = self.metrics.get(field) or ''
+		if kind in _INTEGER_KINDS:
+			return _to_int
+		if kind in _FLOAT_KINDS:
+			return _to_float
+		return parse_number
+
+	def __repr__(self):
+		return '<Nanigans Schema [{0}, {1}]>'.format(len(self.metrics), len(self.dates))
+
+
+def normalize(rows, metrics=(), schema=None, typed=False):
+	"""Normalizes the metric and date fields of rows in place and returns
+	them.
+
+	By default this is the loop get_stats and get_view always ran: commas
+	are removed from fbSpend and dates are formatted %Y-%m-%d, and other
+	metrics are left as they are. With typed, the given metrics become ints
+	or floats according to the schema and the schema's dates become
+	datetime.date objects. Typed rows are processed one field at a time,
+	with the converter picked once per field and date conversions memoized,
+	since every row of a day holds the same date. Missing and empty values
+	are left as they are.
+
+	:param rows: list, row dicts of a Response
+	:param metrics: iterable, names of the metric fields converted with typed
+	:param schema: Schema, field types of the data source
+	:param typed: bool, convert values to Python types
+	"""
+	if not rows:
+		return rows
+	if not typed:
+		return _strip_spend(rows)
+	schema = schema if schema is not None else Schema()
+
+	for field in metrics:
+		_apply(rows, field, schema.converter(field))
+	for field in schema.dates:
+		_apply(rows, field, _memoize(_to_date))
+
+	return rows
+
+
+def _strip_spend(rows):
+	for row in rows:
+		spend = row.get('fbSpend')
+		if spend:
+			row['fbSpend'] = spend.replace(',', '')
+		day = row.get('date')
+		if day:
+			row['date'] = day.replace('/', '-')
+	return rows
+
+
+def _apply(rows, field, convert):
+	for row in rows:
+		value = row.get(field)
+		if value:
+			row[field] = convert(value)
+
+
+def _memoize(convert):
+	cache = {}
+	def memoized(value):
+		try:
+			return cache[value]
+		except KeyError:
+			result = cache[value] = convert(value)
+			return result
+	return memoized
+
+
+def _fields(response):
+	"""Yields (name, kind) for each entry of a metrics or attributes response."""
+	if not response or not response.ok:
+		return
+	for entry in response.data:
+		if isinstance(entry, str):
+			yield entry, ''
+		elif isinstance(entry, dict):
+			name = entry.get('name') or entry.get('id') or entry.get('key')
+			kind = entry.get('type') or entry.get('format') or entry.get('dataType') or ''
+			if isinstance(name, str):
+				yield name, str(kind).lower()
+
+
+def _to_int(value):
+	if isinstance(value, str):
+		try:
+			return int(value.replace(',', ''))
+		except ValueError:
+			return parse_number(value)
+	return value
+
+
+def _to_float(value):
+	if isinstance(value, str):
+		try:
+			return float(value.replace(',', '').rstrip('%'))
+		except ValueError:
+			pass
+	number = parse_number(value)
+	return float(number) if number is not None else None
+
+
+def _to_date(value):
+	if isinstance(value, date):
+		return value
+	text = value.replace('/', '-')
+	try:
+		return date(int(text[0:4]), int(text[5:7]), int(text[8:10]))
+	except ValueError:
+		return value
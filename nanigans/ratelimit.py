@@ -0,0 +1,179 @@
+"""
+Client-side rate limiting for requests to the Reporting API.
+
+"""
+import json
+import os
+import threading
+import time
+
+try:
+	import fcntl
+except ImportError:
+	fcntl = None
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+class TokenBucket(object):
+	"""The '<Nanigans Token Bucket [rate/s]>' object allows rate requests per
+	second on average, with bursts of up to capacity requests. It is shared
+	by every thread of the process.
+
+	Callers reserve a token before each request and wait for the returned
+	number of seconds. Reservations may take the bucket below zero, so
+	waiting callers are served in the order they reserved.
+
+	:param rate: float, tokens added per second
+	:param capacity: float, largest burst, defaults to rate
+	"""
+
+	def __init__(self, rate, capacity=None):
+		self.rate = float(rate)
+		self.capacity = float(capacity if capacity else max(rate, 1))
+		self._tokens = self.capacity
+		self._updated = time.time()
+		self._lock = threading.Lock()
+
+	def reserve(self):
+		"""Takes a token and returns the seconds to wait before using it."""
+		with self._lock:
+			self._tokens, self._updated, wait = self._take(self._tokens, self._updated)
+		return wait
+
+	def _take(self, tokens, updated):
+		now = time.time()
+		tokens = min(self.capacity, tokens+(now-updated)*self.rate)-1
+		wait = -tokens/self.rate if tokens < 0 else 0.0
+		return tokens, now, wait
+
+	def __repr__(self):
+		return '<Nanigans Token Bucket [{0}/s]>'.format(self.rate)
+
+
+class FileTokenBucket(TokenBucket):
+	"""The '<Nanigans File Token Bucket [rate/s]>' object is a TokenBucket
+	whose state is kept in a small file, guarded by an exclusive file lock,
+	so every process using the same path shares one limit.
+
+	:param path: str, file holding the bucket state
+	:param rate: float, tokens added per second
+	:param capacity: float, largest burst, defaults to rate
+	"""
+
+	def __init__(self, path, rate, capacity=None):
+		super(FileTokenBucket, self).__init__(rate, capacity)
+		self.path = path
+
+	def reserve(self):
+		with self._lock:
+			with open(self.path+'.lock', 'a') as lock:
+				if fcntl:
+					fcntl.flock(lock, fcntl.LOCK_EX)
+				try:
+					try:
+						with open(self.path) as f:
+							state = json.load(f)
+					except (IOError, ValueError):
+						state = {'tokens': self.capacity, 'updated': time.time()}
+					tokens, updated, wait = self._take(state['tokens'], state['updated'])
+					tmp = '{0}.{1}'.format(self.path, os.getpid())
+					with open(tmp, 'w') as f:
+						json.dump({'tokens': tokens, 'updated': updated}, f)
+					os.rename(tmp, self.path)
+				finally:
+					if fcntl:
+						fcntl.flock(lock, fcntl.LOCK_UN)
+		return wait
+
+	def __repr__(self):
+		return '<Nanigans File Token Bucket [{0}/s]>'.format(self.rate)
+
+
+class RateLimiter(object):
+	"""The '<Nanigans Rate Limiter [buckets]>' object holds the token buckets
+	that requests have to pass through. A bucket can apply to every request,
+	to one site, to one resource (e.g. adhoc or events) or to one resource of
+	one site. A request takes a token from every bucket that applies to it.
+
+	For example, ten requests a second overall but two a second for the events
+	of one site:
+
+		limiter = RateLimiter()
+		limiter.limit(10)
+		limiter.limit(2, site='123456', resource='events')
+		set_rate_limiter(limiter)
+	"""
+
+	def __init__(self):
+		self._buckets = {}
+
+	def limit(self, rate, capacity=None, site=None, resource=None, path=None):
+		"""Adds a bucket, replacing any bucket with the same scope.
+
+		:param rate: float, requests per second
+		:param capacity: float, largest burst, defaults to rate
+		:param site: str, site the limit applies to, None for every site
+		:param resource: str, resource the limit applies to, None for all
+		:param path: str, file to share the limit with other processes
+		"""
+		if path:
+			bucket = FileTokenBucket(path, rate, capacity)
+		else:
+			bucket = TokenBucket(rate, capacity)
+		key = (str(site) if site else None, resource)
+		self._buckets[key] = bucket
+
+		return bucket
+
+	def reserve(self, site, resource):
+		"""Takes a token from every bucket that applies and returns the seconds
+		to wait before sending the request.
+
+		:param site: str, site the request is for
+		:param resource: str, resource being requested
+		"""
+		site = str(site) if site else None
+		wait = 0.0
+		for key in set([(None, None), (site, None), (None, resource), (site, resource)]):
+			bucket = self._buckets.get(key)
+			if bucket:
+				wait = max(wait, bucket.reserve())
+		return wait
+
+	def acquire(self, site, resource):
+		"""Blocks until the request may be sent."""
+		wait = self.reserve(site, resource)
+		if wait:
+			time.sleep(wait)
+
+	def __repr__(self):
+		return '<Nanigans Rate Limiter [{0}]>'.format(len(self._buckets))
+
+
+def get_rate_limiter():
+	"""Return the rate limiter shared by every adapter. The default one
+	has no buckets and never waits.
+	"""
+	global _limiter
+
+	if _limiter is None:
+		with _limiter_lock:
+			if _limiter is None:
+				_limiter = RateLimiter()
+
+	return _limiter
+
+
+def set_rate_limiter(limiter):
+	"""Replace the shared rate limiter. Passing None removes all limits.
+
+	:param limiter: RateLimiter, limiter used by every adapter
+	"""
+	global _limiter
+
+	with _limiter_lock:
+		_limiter = limiter
+
+	return
@@ -0,0 +1,113 @@
+"""
+Retry policy used by the adapters for transient failures.
+
+"""
+import random
+import re
+import threading
+
+_policy = None
+_policy_lock = threading.Lock()
+
+
+class RetryPolicy(object):
+	"""The '<Nanigans Retry Policy [attempts]>' object decides whether a failed
+	request is worth sending again and how long to wait before doing so.
+
+	A failure is transient when the request got no response at all, when the
+	response was not JSON (e.g. a gateway error page), when its HTTP status is
+	one of retry_statuses, or when the API's error message matches one of
+	retry_messages, which covers rate limiting. Any other error is returned
+	to the caller straight away.
+
+	The wait before attempt n+1 is drawn uniformly between zero and
+	backoff*2**(n-1) seconds, capped at max_backoff ("full jitter"), so
+	concurrent workers do not retry in lockstep. A Retry-After header is
+	honoured when it asks for a longer wait.
+
+	:param max_attempts: int, total attempts including the first one
+	:param backoff: float, base wait in seconds
+	:param max_backoff: float, longest wait in seconds
+	:param jitter: bool, randomise the wait, otherwise wait the full backoff
+	:param retry_statuses: tuple, HTTP statuses that are transient
+	:param retry_messages: tuple, regular expressions matched against API errors
+	"""
+	statuses = (429, 500, 502, 503, 504)
+	messages = (r'rate.?limit', r'too many requests', r'throttl', r'try again',
+				r'time.?out', r'temporar', r'unavailable')
+
+	def __init__(self, max_attempts=3, backoff=0.5, max_backoff=30.0, jitter=True,
+				 retry_statuses=None, retry_messages=None):
+		self.max_attempts = max_attempts
+		self.backoff = backoff
+		self.max_backoff = max_backoff
+		self.jitter = jitter
+		self.retry_statuses = retry_statuses if retry_statuses else self.statuses
+		self.retry_messages = retry_messages if retry_messages else self.messages
+		self._pattern = re.compile('|'.join(self.retry_messages), re.I)
+
+	def is_transient(self, status_code, error, decoded=True):
+		"""Classifies a failed attempt.
+
+		:param status_code: int, HTTP status, None if there was no response
+		:param error: the error message or body returned
+		:param decoded: bool, whether the body was valid JSON
+		"""
+		if status_code is None or not decoded:
+			return True
+		if status_code in self.retry_statuses:
+			return True
+		return bool(self._pattern.search(str(error)))
+
+	def should_retry(self, attempt, response, transient):
+		"""Whether to send the request again after the given attempt.
+
+		:param attempt: int, number of attempts made so far
+		:param response: Response, result of the last attempt
+		:param transient: bool, result of is_transient for the last attempt
+		"""
+		return not response.ok and transient and attempt < self.max_attempts
+
+	def delay(self, attempt, retry_after=None):
+		"""Seconds to wait after the given attempt.
+
+		:param attempt: int, number of attempts made so far
+		:param retry_after: float, wait requested by the server
+		"""
+		wait = min(self.max_backoff, self.backoff*2**(attempt-1))
+		if self.jitter:
+			wait = random.uniform(0, wait)
+		if retry_after:
+			wait = max(wait, min(self.max_backoff, retry_after))
+		return wait
+
+	def __repr__(self):
+		return '<Nanigans Retry Policy [{0}]>'.format(self.max_attempts)
+
+
+def get_retry_policy():
+	"""Return the retry policy shared by every adapter, creating the
+	default one on first use.
+	"""
+	global _policy
+
+	if _policy is None:
+		with _policy_lock:
+			if _policy is None:
+				_policy = RetryPolicy()
+
+	return _policy
+
+
+def set_retry_policy(policy):
+	"""Replace the shared retry policy. Passing None restores the default,
+	and RetryPolicy(max_attempts=1) turns retries off.
+
+	:param policy: RetryPolicy, policy used by every adapter
+	"""
+	global _policy
+
+	with _policy_lock:
+		_policy = policy
+
+	return
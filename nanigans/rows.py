@@ -0,0 +1,147 @@
+"""
+Compact rows sharing one header, used by the compact option of the api
+functions to hold large results in less memory than a dict per row.
+
+"""
+import threading
+
+_types = {}
+_types_lock = threading.Lock()
+
+
+class Row(tuple):
+	"""The '<Nanigans Row {field: value}>' object is a read-only row storing
+	only its values, in the order of the fields of its class, which is made
+	once per header by row_type. It is a tuple, so it takes a fraction of
+	the memory of the equivalent dict, and is read like one:
+
+		row['fbSpend'], row.get('date'), row.keys(), row.items(), dict(row)
+
+	Iterating over a row and the in operator go over its field names, like
+	a dict. Integer indexes and values() return the values by position.
+	Fields a row did not have when it was compacted are None.
+
+	Because a row is a tuple, JSON encoders do not see it as a mapping:
+	json.dumps writes its field names and orjson refuses it. Serialize rows
+	with _asdict, or a whole result with as_dicts:
+
+		json.dump(as_dicts(response.data), f)
+	"""
+	__slots__ = ()
+	_fields = ()
+	_index = {}
+
+	def __getitem__(self, key):
+		if isinstance(key, str):
+			return tuple.__getitem__(self, self._index[key])
+		return tuple.__getitem__(self, key)
+
+	def get(self, key, default=None):
+		index = self._index.get(key)
+		if index is None:
+			return default
+		return tuple.__getitem__(self, index)
+
+	def keys(self):
+		return self._fields
+
+	def values(self):
+		return tuple.__getitem__(self, slice(None))
+
+	def items(self):
+		return zip(self._fields, tuple.__iter__(self))
+
+	def _asdict(self):
+		"""The row as a dict of its fields."""
+		return dict(zip(self._fields, tuple.__iter__(self)))
+
+	def __iter__(self):
+		return iter(self._fields)
+
+	def __contains__(self, key):
+		return key in self._index
+
+	def __eq__(self, other):
+		if isinstance(other, dict):
+			return self._asdict() == other
+		return tuple.__eq__(self, other)
+
+	def __ne__(self, other):
+		return not self == other
+
+	__hash__ = tuple.__hash__
+
+	def __reduce__(self):
+		# The classes are made at run time, so rebuild them from the header
+		return _row, (self._fields, self.values())
+
+	def __repr__(self):
+		return '<Nanigans Row {0}>'.format(self._asdict())
+
+
+def row_type(fields):
+	"""Returns the Row class of a header, creating it on first use, so
+	rows with the same fields share one class.
+
+	:param fields: tuple, field names in the order the values are stored
+	"""
+	fields = tuple(fields)
+	cls = _types.get(fields)
+	if cls is None:
+		with _types_lock:
+			cls = _types.get(fields)
+			if cls is None:
+				index = dict((name, position) for position, name in enumerate(fields))
+				cls = type('Row', (Row,), {'__slots__': (), '_fields': fields, '_index': index})
+				_types[fields] = cls
+	return cls
+
+
+def compact(rows, fields=None):
+	"""Replaces the row dicts of a list with Rows in place and returns the
+	list. The header starts with the given fields, e.g. the requested
+	attributes and metrics, followed by any other field found in the rows.
+	Rows that are already compact are left as they are.
+
+	Equal strings are stored once, so attribute values and dates repeated
+	on many rows share one string.
+
+	:param rows: list, row dicts such as Response.data
+	:param fields: list, fields placed first in the header
+	"""
+	header, seen = [], set()
+	for name in fields or ():
+		if name not in seen:
+			header.append(name)
+			seen.add(name)
+	for row in rows:
+		if isinstance(row, dict) and not seen.issuperset(row):
+			header.extend(name for name in row if name not in seen)
+			seen.update(row)
+
+	cls = row_type(header)
+	shared = {}
+
+	def share(value):
+		# Only strings, since 1, 1.0 and True are equal keys
+		if type(value) is str:
+			return shared.setdefault(value, value)
+		return value
+
+	for position, row in enumerate(rows):
+		if isinstance(row, dict):
+			rows[position] = cls(map(share, map(row.get, header)))
+	return rows
+
+
+def as_dicts(rows):
+	"""Returns a list of the rows as dicts, the form JSON encoders take,
+	whether they are dicts or compact Rows.
+
+	:param rows: list, rows such as Response.data
+	"""
+	return [row._asdict() if isinstance(row, Row) else row for row in rows]
+
+
+def _row(fields, values):
+	return row_type(fields)(values)
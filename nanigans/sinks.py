@@ -0,0 +1,285 @@
+"""
+Sinks writing Reporting API rows to files as they arrive.
+
+"""
+import abc
+import bz2
+import csv
+import gzip
+import json
+import lzma
+import os
+
+from nanigans.models import Response
+
+try:
+	import pyarrow
+	import pyarrow.parquet
+except ImportError:
+	pyarrow = None
+
+_openers = {'gzip': gzip.open, 'bz2': bz2.open, 'xz': lzma.open}
+_extensions = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz'}
+
+
+class Sink(object, metaclass=abc.ABCMeta):
+	"""The '<Nanigans Sink [path]>' object is the base of the file sinks. Rows
+	are written as they are handed over, so only the rows of the Response
+	being written are held in memory.
+
+	With per_day, path must contain a {date} placeholder and rows are
+	written to one file per day, taken from each row's date field or else
+	from the day they were written for. Only one file is open at a time, so
+	rows should arrive grouped by day, as iter_stats and Backfill provide
+	them. The first time a sink opens a day's file it replaces any earlier
+	file for that day, so days retried by a Backfill are not duplicated.
+
+	Without per_day, rows are appended to the file when it already exists,
+	so a Backfill resumed by a new process keeps the days written by the
+	earlier runs. Remove the file to start over.
+
+	Sinks can be passed as the write argument of a Backfill, or fed the
+	Responses of iter_stats or iter_events with consume.
+
+	:param path: str, file to write, or file name template with per_day
+	:param compression: str, gzip, bz2 or xz, inferred from the extension by default
+	:param per_day: bool, write a file per day
+	"""
+	name = 'Sink'
+
+	def __init__(self, path, compression=None, per_day=False):
+		if per_day and '{date}' not in path:
+			raise ValueError('A per day path needs a {date} placeholder.')
+		self.path = path
+		self.compression = self._compression(path, compression)
+		self.per_day = per_day
+		self.rows = 0
+		self._day = None
+		self._file = None
+		self._opened = set()
+
+	def _compression(self, path, compression):
+		if compression is None:
+			compression = _extensions.get(os.path.splitext(path)[1])
+		if compression is not None and compression not in _openers:
+			raise ValueError('Unknown compression {0!r}.'.format(compression))
+		return compression
+
+	def write(self, day, response):
+		"""Writes the rows of a Response fetched for day.
+
+		:param day: str, day in %Y-%m-%d format
+		:param response: Response, rows to write
+		"""
+		self.write_rows(response.data, day)
+
+	def write_rows(self, rows, day=None):
+		"""Writes a list of row dicts.
+
+		:param rows: list, row dicts
+		:param day: str, day used for rows without a date field
+		"""
+		if not self.per_day:
+			self._switch(None)
+			self._write(rows)
+			self.rows += len(rows)
+			return
+
+		batch = []
+		for row in rows:
+			row_day = _day(row.get('date')) or day
+			if row_day is None:
+				raise ValueError('Rows written to a per day sink need a date.')
+			if row_day != self._day and batch:
+				self._write(batch)
+				self.rows += len(batch)
+				batch = []
+			self._switch(row_day)
+			batch.append(row)
+		if batch:
+			self._write(batch)
+			self.rows += len(batch)
+
+	def consume(self, responses):
+		"""Writes the rows of every successful Response of an iterable, e.g.
+		iter_stats, and returns a Response holding the errors of the failed
+		ones, tagged with their dates like Response.concat.
+
+		:param responses: iterable, Response objects
+		"""
+		failed = []
+		for response in responses:
+			if response.ok:
+				self.write_rows(response.data)
+			else:
+				failed.append(response)
+		return Response.concat(failed)
+
+	def close(self):
+		"""Closes the current file."""
+		if self._file is not None:
+			self._close()
+			self._file = None
+
+	def _switch(self, day):
+		if self._file is not None and day == self._day:
+			return
+		self.close()
+		path = self.path.format(date=day) if self.per_day else self.path
+		append = path in self._opened or (not self.per_day and _exists(path))
+		self._opened.add(path)
+		self._day = day
+		self._open(path, append)
+
+	def _stream(self, path, append):
+		"""Opens path for text, through the compression."""
+		mode = ('a' if append else 'w')+'t'
+		opener = _openers.get(self.compression)
+		if opener:
+			return opener(path, mode, encoding='utf-8', newline='')
+		return open(path, mode, encoding='utf-8', newline='')
+
+	@abc.abstractmethod
+	def _open(self, path, append):
+		"""Opens path, appending to it when append is set."""
+
+	@abc.abstractmethod
+	def _write(self, rows):
+		"""Writes a list of rows to the open file."""
+
+	def _close(self):
+		self._file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def __repr__(self):
+		return '<Nanigans {0} [{1}]>'.format(self.name, self.path)
+
+
+class CSVSink(Sink):
+	"""The '<Nanigans CSV Sink [path]>' object writes rows as CSV with a header.
+	The columns are the given fields, or those of the first row written to
+	the file. Fields a row does not have are left empty and fields not in
+	the header are dropped.
+
+	:param path: str, file to write, or file name template with per_day
+	:param fields: list, columns to write
+	:param compression: str, gzip, bz2 or xz, inferred from the extension by default
+	:param per_day: bool, write a file per day
+	"""
+	name = 'CSV Sink'
+
+	def __init__(self, path, fields=None, compression=None, per_day=False):
+		super(CSVSink, self).__init__(path, compression, per_day)
+		self.fields = list(fields) if fields else None
+		self._writer = None
+
+	def _open(self, path, append):
+		self._file = self._stream(path, append)
+		self._writer = None
+		self._append = append
+
+	def _write(self, rows):
+		if not rows:
+			return
+		if self._writer is None:
+			fields = self.fields or list(rows[0])
+			self._writer = csv.DictWriter(self._file, fields, extrasaction='ignore')
+			if not self._append:
+				self._writer.writeheader()
+		self._writer.writerows(rows)
+
+
+class JSONLinesSink(Sink):
+	"""The '<Nanigans JSON Lines Sink [path]>' object writes one JSON object
+	per row and line. Values JSON can not hold, such as the dates of typed
+	results, are written as strings.
+
+	:param path: str, file to write, or file name template with per_day
+	:param compression: str, gzip, bz2 or xz, inferred from the extension by default
+	:param per_day: bool, write a file per day
+	"""
+	name = 'JSON Lines Sink'
+
+	def _open(self, path, append):
+		self._file = self._stream(path, append)
+
+	def _write(self, rows):
+		dumps = json.dumps
+		self._file.writelines(dumps(_dict(row), default=str)+'\n' for row in rows)
+
+
+class ParquetSink(Sink):
+	"""The '<Nanigans Parquet Sink [path]>' object writes rows to Parquet files
+	in row groups of row_group_size rows, so at most one row group is held
+	in memory. The schema is inferred from the first row group of each file.
+	Requires pyarrow.
+
+	Parquet files can not be appended to, so rows for a per day file must
+	arrive grouped by day, and a single file must not exist yet.
+
+	:param path: str, file to write, or file name template with per_day
+	:param compression: str, Parquet codec such as snappy, gzip or zstd
+	:param per_day: bool, write a file per day
+	:param row_group_size: int, rows buffered before they are written
+	"""
+	name = 'Parquet Sink'
+
+	def __init__(self, path, compression='snappy', per_day=False, row_group_size=50000):
+		if pyarrow is None:
+			raise ImportError('ParquetSink requires pyarrow.')
+		super(ParquetSink, self).__init__(path, compression, per_day)
+		self.row_group_size = row_group_size
+
+	def _compression(self, path, compression):
+		return compression
+
+	def _open(self, path, append):
+		if append:
+			raise ValueError('Can not append to the Parquet file {0}.'.format(path))
+		self._file = path
+		self._writer = None
+		self._buffer = []
+
+	def _write(self, rows):
+		self._buffer.extend(map(_dict, rows))
+		if len(self._buffer) >= self.row_group_size:
+			self._flush()
+
+	def _flush(self):
+		if not self._buffer:
+			return
+		if self._writer is None:
+			table = pyarrow.Table.from_pylist(self._buffer)
+			self._writer = pyarrow.parquet.ParquetWriter(self._file, table.schema,
+														 compression=self.compression)
+		else:
+			table = pyarrow.Table.from_pylist(self._buffer, schema=self._writer.schema)
+		self._writer.write_table(table)
+		self._buffer = []
+
+	def _close(self):
+		self._flush()
+		if self._writer is not None:
+			self._writer.close()
+
+
+def _exists(path):
+	"""Whether path is a file that already holds something."""
+	return os.path.isfile(path) and os.path.getsize(path) > 0
+
+
+def _dict(row):
+	"""Rows of compact results as dicts, which is what the encoders take."""
+	return row if isinstance(row, dict) else row._asdict()
+
+
+def _day(value):
+	"""The %Y-%m-%d form of a row's date field, if it has one."""
+	if not value:
+		return None
+	return str(value).replace('/', '-')[:10]
@@ -1,47 +1,56 @@
 """
 Descriptors used in the models.py module.
 
+Each descriptor stores its value on the instance, in the attribute named
+after it with a leading underscore, e.g. Response.data is kept in
+Response._data. Classes that declare that attribute in __slots__ keep
+their values in the slot; other classes keep them in the instance dict.
+Reading a value is a plain attribute lookup, and only assignments go
+through the type check. Unlike a table of values keyed by instance, this
+adds no hashing, no weak references and no per-descriptor bookkeeping.
+
 Credit: https://github.com/essence-tech/twitter-ads-api/blob/master/twitter/structures.py
 """
-from weakref import WeakKeyDictionary
+from operator import attrgetter
+
 
-class BaseDescriptor(object):
+class BaseDescriptor(property):
+    """Typed attribute whose values are stored on the instance. Falsy values
+    such as None are always accepted.
+    """
+    kind = object
+    noun = 'an object'
 
     def __init__(self):
-        self.data = WeakKeyDictionary()
+        super(BaseDescriptor, self).__init__(self._unbound)
 
-    def __get__(self, instance, owner):
-        return self.data[instance]
+    def __set_name__(self, owner, name):
+        slot = '_'+name
+        kind, noun, store = self.kind, self.noun, object.__setattr__
 
- 
-class StringDescriptor(BaseDescriptor):
-    
-    def __init__(self):
-        super(StringDescriptor, self).__init__()
+        def validate(instance, value):
+            if value and not isinstance(value, kind):
+                raise TypeError("{0} is not {1}".format(value, noun))
+            store(instance, slot, value)
 
-    def __set__(self, instance, value):
-        if value and not isinstance(value, str):
-            raise TypeError("{0} is not a string".format(value))
-        self.data[instance] = value
+        # Both run in C except validate, so reads cost about as much as a slot
+        super(BaseDescriptor, self).__init__(attrgetter(slot), validate, doc=self.__doc__)
 
+    @staticmethod
+    def _unbound(instance):
+        raise AttributeError('Descriptors must be assigned in a class body.')
 
-class DictDescriptor(BaseDescriptor):
 
-    def __init__(self):
-        super(DictDescriptor, self).__init__()
+class StringDescriptor(BaseDescriptor):
+    kind = str
+    noun = 'a string'
 
-    def __set__(self, instance, value):
-        if value and not isinstance(value, dict):
-            raise TypeError("{0} is not a dict".format(value))
-        self.data[instance] = value
 
+class DictDescriptor(BaseDescriptor):
+    kind = dict
+    noun = 'a dict'
 
-class ListDescriptor(BaseDescriptor):
-    
-    def __init__(self):
-        super(ListDescriptor, self).__init__()
 
-    def __set__(self, instance, value):
-        if value and not isinstance(value, list):
-            raise TypeError("{0} is not a list".format(value))
-        self.data[instance] = value
+class ListDescriptor(BaseDescriptor):
+    kind = list
+    noun = 'a list'
@@ -0,0 +1,40 @@
+"""
+Test cases and helpers shared by the test modules.
+
+"""
+import json
+import unittest
+
+from mock import Mock
+from nanigans import auth
+
+
+class SignedTestCase(unittest.TestCase):
+    """Signs in with test credentials for the test case, so it also runs
+    on its own, and restores the credentials it found afterwards.
+    """
+    credentials = {'username': 'username@fakers.com', 'password': 'fakePass5000',
+                   'site': '123456', 'token': 'token'}
+
+    @classmethod
+    def setUpClass(cls):
+        cls._saved_credentials = auth._credentials
+        auth._credentials = dict(cls.credentials)
+
+    @classmethod
+    def tearDownClass(cls):
+        auth._credentials = cls._saved_credentials
+
+
+def fake_response(status_code=200, body=None, text='', headers=None):
+    resp = Mock()
+    resp.status_code = status_code
+    resp.text = text
+    resp.headers = headers if headers else {}
+    if body is None:
+        resp.json.side_effect = ValueError(text)
+        resp.content = text.encode('utf-8')
+    else:
+        resp.json.return_value = body
+        resp.content = json.dumps(body).encode('utf-8')
+    return resp
@@ -1,3 +1,8 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
 import unittest
 
 from mock import patch
@@ -5,9 +10,29 @@ from random import randint
 from nanigans.object import Credentials
 from nanigans.utils import set_default_config
 from nanigans.api import facebook, multichannel, publishers, events
-from nanigans.models import Response
+from nanigans.models import Response, AsyncPreparedRequest, AsyncAdapter, aiohttp
+from nanigans.normalize import Schema, normalize
+from datetime import date
+from nanigans.utils import generate_dates, generate_token, get_session, get_token_cache
+from nanigans.retry import RetryPolicy, set_retry_policy
+from nanigans.cache import ResponseCache, set_response_cache
+from nanigans.tests.server import StubServer
+from nanigans.client import Client, fetch_many_sites
+from nanigans import auth
 
 class BaseTestCase(unittest.TestCase):
+    credentials = {'username': 'username@fakers.com', 'password': 'fakePass5000',
+                   'site': '123456', 'token': 'token'}
+
+    @classmethod
+    def setUpClass(cls):
+        cls._saved_credentials = auth._credentials
+        auth._credentials = dict(cls.credentials)
+
+    @classmethod
+    def tearDownClass(cls):
+        auth._credentials = cls._saved_credentials
+
     @classmethod
     def setUp(cls):
         cls.response_dict = [{}]
@@ -69,6 +94,13 @@ class TestGetViews(BaseTestCase):
         self.assertFalse(',' in mc.data[0]['fbSpend'])
         self.assertFalse(',' in pub.data[0]['fbSpend'])
 
+    @patch('nanigans.models.Adapter.get')
+    def test_spend_parsed_beyond_first_record(self, mock_send):
+        view = randint(10000, 99999)
+        mock_send.return_value = Response(data=[{'impressions':'1'}, {'fbSpend':'1,000', 'date':'2016/06/01'}])
+        fb = facebook.get_view(view)
+        self.assertEqual({'fbSpend':'1000', 'date':'2016-06-01'}, fb.data[1])
+
 class TestGetStats(BaseTestCase):
     @patch('nanigans.models.Adapter.get')
     def test_get_stats_with_dummy_vars(self, mock_send):
@@ -90,6 +122,149 @@ class TestGetStats(BaseTestCase):
         self.assertFalse(',' in mc.data[0]['fbSpend'])
         self.assertFalse(',' in pub.data[0]['fbSpend'])
 
+    @patch('nanigans.models.Adapter.get')
+    def test_failed_days_do_not_abort_the_range(self, mock_send):
+        mock_send.side_effect = [Response(data=[{}]), Response(errors=['foo']), Response(data=[{}])]
+        fb = facebook.get_stats(start='2016-06-01', end='2016-06-04')
+        self.assertEqual(2, len(fb.data))
+        self.assertEqual(['foo'], fb.errors)
+
+class TestGetStatsConcurrently(BaseTestCase):
+    start = '2016-06-01'
+    end = '2016-06-11'
+
+    def test_days_are_returned_in_date_order(self):
+        with StubServer(latency=0.05) as server:
+            fb = facebook.get_stats(start=self.start, end=self.end, max_workers=4)
+        self.assertTrue(fb.ok)
+        self.assertEqual(generate_dates(self.start, self.end),
+                         [record['date'] for record in fb.data])
+        self.assertFalse(',' in fb.data[0]['fbSpend'])
+
+    def test_requests_in_flight_are_bounded(self):
+        with StubServer(latency=0.05) as server:
+            multichannel.get_stats(start=self.start, end=self.end, max_workers=4)
+        self.assertEqual(10, len(server.received))
+        self.assertTrue(1 < server.max_active <= 4)
+
+    def test_requests_are_serial_by_default(self):
+        with StubServer(latency=0.01) as server:
+            publishers.get_stats(start=self.start, end=self.end)
+        self.assertEqual(10, len(server.received))
+        self.assertEqual(1, server.max_active)
+
+class TestGetStatsChunked(BaseTestCase):
+    start = '2016-06-01'
+    end = '2016-06-11'
+
+    def test_chunks_cover_every_day_once(self):
+        with StubServer() as server:
+            fb = facebook.get_stats(start=self.start, end=self.end, chunk_size=7)
+        self.assertTrue(fb.ok)
+        self.assertEqual(2, len(server.received))
+        self.assertEqual(['2016-06-10', '2016-06-03'], [q['end'][0] for q in server.received])
+        self.assertEqual('date', server.received[0]['attributes[]='][0])
+        self.assertEqual(generate_dates(self.start, self.end),
+                         [record['date'] for record in fb.data])
+        self.assertFalse(',' in fb.data[0]['fbSpend'])
+
+    def test_failed_chunks_are_split(self):
+        with StubServer(max_days=3) as server:
+            mc = multichannel.get_stats(start=self.start, end=self.end, chunk_size=8, 
+                                        max_workers=2)
+        self.assertTrue(mc.ok)
+        self.assertEqual(generate_dates(self.start, self.end),
+                         [record['date'] for record in mc.data])
+
+    def test_large_chunks_are_split(self):
+        with StubServer() as server:
+            days = list(publishers.iter_stats(start=self.start, end=self.end, chunk_size=10, 
+                                              max_rows=5))
+        pub = Response.concat(days)
+        self.assertTrue(pub.ok)
+        self.assertEqual(generate_dates(self.start, self.end),
+                         [record['date'] for record in pub.data])
+        self.assertTrue(all(len(day.data) < 5 for day in days))
+
+class TestIterStats(BaseTestCase):
+    start = '2016-06-01'
+    end = '2016-06-04'
+
+    @patch('nanigans.models.Adapter.get')
+    def test_nothing_is_sent_until_iterated(self, mock_send):
+        mock_send.return_value = Response(data=self.response_dict)
+        facebook.iter_stats(start=self.start, end=self.end)
+        events.iter_events('click', start=self.start, end=self.end)
+        self.assertFalse(mock_send.called)
+
+    @patch('nanigans.models.Adapter.get')
+    def test_yields_a_response_per_day(self, mock_send):
+        mock_send.side_effect = lambda: Response(data=[{'fbSpend':'1,000'}])
+        for module in (facebook, multichannel, publishers):
+            days = list(module.iter_stats(start=self.start, end=self.end))
+            self.assertEqual(3, len(days))
+            for day in days:
+                self.assertIsInstance(day, Response)
+                self.assertEqual('1000', day.data[0]['fbSpend'])
+
+    @patch('nanigans.models.Adapter.get')
+    def test_failed_days_do_not_stop_iteration(self, mock_send):
+        mock_send.side_effect = [Response(errors=['foo']), Response(data=[{}]), Response(data=[{}])]
+        days = list(events.iter_events('conversion', start=self.start, end=self.end))
+        self.assertEqual([False, True, True], [day.ok for day in days])
+
+class TestGetStatsAsync(BaseTestCase):
+    start = '2016-06-01'
+    end = '2016-06-11'
+
+    def test_days_are_returned_in_date_order(self):
+        with StubServer(latency=0.05) as server:
+            fb = asyncio.run(facebook.get_stats_async(start=self.start, end=self.end))
+            mc = asyncio.run(multichannel.get_stats_async(start=self.start, end=self.end))
+            pub = asyncio.run(publishers.get_stats_async(start=self.start, end=self.end))
+        dates = generate_dates(self.start, self.end)
+        for response in (fb, mc, pub):
+            self.assertTrue(response.ok)
+            self.assertEqual(dates, [record['date'] for record in response.data])
+            self.assertFalse(',' in response.data[0]['fbSpend'])
+        self.assertTrue(server.max_active > 1)
+
+    def test_requests_in_flight_are_bounded(self):
+        with StubServer(latency=0.05) as server:
+            asyncio.run(facebook.get_stats_async(start=self.start, end=self.end, 
+                                                 max_concurrency=2))
+        self.assertEqual(10, len(server.received))
+        self.assertTrue(server.max_active <= 2)
+
+    def test_events_are_returned_in_date_order(self):
+        with StubServer() as server:
+            toclick = asyncio.run(events.get_time_of_click_async(start=self.start, end=self.end))
+            toconv = asyncio.run(events.get_time_of_conversion_async(start=self.start, end=self.end))
+        dates = generate_dates(self.start, self.end)
+        self.assertEqual(dates, [record['date'] for record in toclick.data])
+        self.assertEqual(dates, [record['date'] for record in toconv.data])
+
+    @unittest.skipIf(aiohttp is None, 'aiohttp is not installed')
+    def test_aiohttp_adapter_retries_on_the_event_loop(self):
+        set_retry_policy(RetryPolicy(max_attempts=20, backoff=0.001))
+
+        async def get():
+            request = AsyncPreparedRequest('events', {'attribution': 'click'},
+                                           {'fields[]=': ['timestamp'], 'date': '2016-06-01'})
+            async with aiohttp.ClientSession() as session:
+                return await AsyncAdapter(request).get(session)
+
+        try:
+            with StubServer(error_rate=0.5, seed=1) as server, \
+                 patch('nanigans.models.get_session', side_effect=AssertionError):
+                response = asyncio.run(get())
+        finally:
+            set_retry_policy(None)
+        self.assertTrue(response.ok)
+        self.assertEqual('2016-06-01', response.data[0]['date'])
+        self.assertTrue(len(server.received) > 1)
+        self.assertEqual(['timestamp'], server.received[0]['fields[]='])
+
 class TestGetEvents(BaseTestCase):
     @patch('nanigans.models.Adapter.get')
     def test_get_stats_with_dummy_vars(self, mock_send):
@@ -99,6 +274,249 @@ class TestGetEvents(BaseTestCase):
         self.assertIsInstance(toclick, Response)
         self.assertIsInstance(toconv, Response)
 
+    @patch('nanigans.models.Adapter.get')
+    def test_get_events_needs_an_attribution(self, mock_send):
+        self.assertRaises(ValueError, events.get_events, [])
+        self.assertFalse(mock_send.called)
+
+class TestStubServer(BaseTestCase):
+    start = '2016-06-01'
+    end = '2016-06-04'
+
+    def tearDown(self):
+        set_retry_policy(None)
+
+    def test_tokens_come_from_authenticate_endpoint(self):
+        with StubServer() as server:
+            token = generate_token('test@gmail.com', 'test', '654321')
+        self.assertEqual('token-654321', token)
+        self.assertEqual(['/authenticate.php'], server.paths)
+
+    def test_rows_are_served_per_day(self):
+        with StubServer(rows=5) as server:
+            fb = facebook.get_stats(start=self.start, end=self.end, chunk_size=3)
+        self.assertTrue(fb.ok)
+        self.assertEqual(15, len(fb.data))
+        self.assertEqual('Plan 4', fb.data[-1]['adPlan'])
+
+    def test_compact_rows(self):
+        with StubServer(rows=3) as server:
+            fb = facebook.get_stats(['adPlan'], ['clicks', 'fbSpend'], self.start, self.end,
+                                    compact=True)
+            mc = multichannel.get_stats(start=self.start, end=self.end, chunk_size=3, 
+                                        compact=True)
+            toclick = events.get_time_of_click(start=self.start, end=self.end, compact=True)
+        self.assertEqual(('adPlan', 'clicks', 'fbSpend', 'impressions', 'date'), fb.data[0].keys())
+        self.assertEqual('1000.00', fb.data[0]['fbSpend'])
+        self.assertEqual(generate_dates(self.start, self.end), 
+                         [row['date'] for row in mc.data[::3]])
+        self.assertEqual(generate_dates(self.start, self.end), 
+                         [row['date'] for row in toclick.data[::3]])
+
+    def test_events_decoded_in_processes(self):
+        with StubServer(rows=2000) as server:
+            toclick = events.get_time_of_click(start=self.start, end=self.end, max_workers=2,
+                                               compact=True, processes=1)
+            toconv = events.get_time_of_conversion(start=self.start, end=self.end, processes=1)
+        dates = generate_dates(self.start, self.end)
+        for response in (toclick, toconv):
+            self.assertTrue(response.ok)
+            self.assertEqual(6000, len(response.data))
+            self.assertEqual(dates, [row['date'] for row in response.data[::2000]])
+        self.assertEqual('Plan 1999', toclick.data[-1]['adPlan'])
+        self.assertIsInstance(toconv.data[0], dict)
+
+    def test_events_for_several_attributions(self):
+        with StubServer(latency=0.02) as server:
+            results = events.get_events(start=self.start, end=self.end, max_workers=6)
+        dates = generate_dates(self.start, self.end)
+        self.assertEqual(['click', 'conversion'], sorted(results))
+        for response in results.values():
+            self.assertTrue(response.ok)
+            self.assertEqual(dates, [row['date'] for row in response.data])
+        self.assertEqual(['click']*3+['conversion']*3,
+                         sorted(query['attribution'][0] for query in server.received))
+        self.assertTrue(server.max_active > 2)
+
+    def test_events_tagged_by_attribution(self):
+        with StubServer(rows=2) as server:
+            pairs = list(events.iter_events_many(['conversion', 'click', 'conversion'],
+                                                 start=self.start, end=self.end, compact=True))
+            results = asyncio.run(events.get_events_async('click', start=self.start, 
+                                                          end=self.end))
+        self.assertEqual(['conversion', 'click']*3, [attribution for attribution, _ in pairs])
+        self.assertTrue(all(response.ok for _, response in pairs))
+        self.assertEqual(generate_dates(self.start, self.end)[0], pairs[0][1].data[0]['date'])
+        self.assertEqual(['click'], list(results))
+        self.assertEqual(6, len(results['click'].data))
+
+    def test_cached_events_decoded_in_processes(self):
+        tmp = tempfile.mkdtemp()
+        set_response_cache(ResponseCache(os.path.join(tmp, 'cache.sqlite')))
+        try:
+            with StubServer(rows=2000) as server:
+                compacted = events.get_time_of_click(start=self.start, end=self.end, 
+                                                     compact=True, processes=1)
+                cached = events.get_time_of_click(start=self.start, end=self.end)
+        finally:
+            set_response_cache(None)
+            shutil.rmtree(tmp)
+        self.assertEqual(3, len(server.received))
+        self.assertEqual(6000, len(cached.data))
+        self.assertIsInstance(cached.data[0], dict)
+        self.assertEqual('Plan 1999', cached.data[-1]['adPlan'])
+        self.assertEqual([row._asdict() for row in compacted.data], cached.data)
+
+    def test_event_rows_are_streamed(self):
+        with StubServer(rows=3) as server:
+            rows = events.iter_event_rows('click', start=self.start, end=self.end)
+            first = next(rows)
+            self.assertEqual(1, len(server.received))
+            rows = [first]+list(rows)
+        self.assertEqual(9, len(rows))
+        self.assertEqual(generate_dates(self.start, self.end), [row['date'] for row in rows[::3]])
+        self.assertEqual(['click'], server.received[0]['attribution'])
+
+    def test_failed_event_rows_raise(self):
+        set_retry_policy(RetryPolicy(max_attempts=2, backoff=0.001))
+        with StubServer(error_rate=1.0) as server:
+            with self.assertRaises(ValueError):
+                list(events.iter_event_rows('click', start=self.start, end=self.end))
+        self.assertEqual(2, len(server.received))
+
+    def test_failed_days_are_tagged_with_their_date(self):
+        set_retry_policy(RetryPolicy(max_attempts=1))
+        with StubServer(error_rate=1.0) as server:
+            fb = facebook.get_stats(start=self.start, end=self.end, chunk_size=3)
+            toclick = events.get_time_of_click(start=self.start, end=self.end)
+        for response in (fb, toclick):
+            self.assertEqual(generate_dates(self.start, self.end),
+                             [error['date'] for error in response.errors])
+            self.assertEqual(['Service Unavailable'], response.errors[0]['errors'])
+
+    def test_errors_are_retried(self):
+        set_retry_policy(RetryPolicy(max_attempts=20, backoff=0.001))
+        with StubServer(error_rate=0.5, seed=1) as server:
+            mc = multichannel.get_stats(start=self.start, end=self.end)
+        self.assertTrue(mc.ok)
+        self.assertTrue(len(server.received) > 3)
+
+class TestNormalize(BaseTestCase):
+    metrics = Response(data=[{'name':'impressions', 'type':'integer'},
+                             {'name':'fbSpend', 'type':'currency'},
+                             {'name':'ctr', 'type':'percent'}])
+    attributes = Response(data=[{'name':'adPlan', 'type':'string'},
+                                {'name':'startDate', 'type':'date'}])
+
+    def rows(self):
+        return [{'date':'2016/06/01', 'impressions':'1,200', 'fbSpend':'1,000', 'ctr':'1.5%'},
+                {'date':'2016/06/01', 'impressions':'', 'fbSpend':'2.50'},
+                {'adPlan':'Plan'}]
+
+    def test_only_spend_and_date_by_default(self):
+        rows = normalize(self.rows(), ['impressions', 'fbSpend', 'ctr'])
+        self.assertEqual({'date':'2016-06-01', 'impressions':'1,200', 'fbSpend':'1000', 'ctr':'1.5%'}, 
+                         rows[0])
+        self.assertEqual('', rows[1]['impressions'])
+        self.assertEqual({'adPlan':'Plan'}, rows[2])
+
+    def test_typed_follows_the_schema(self):
+        schema = Schema.from_responses(self.metrics, self.attributes)
+        self.assertEqual(('date', 'startDate'), schema.dates)
+        rows = normalize(self.rows(), ['impressions', 'fbSpend', 'ctr'], schema, typed=True)
+        self.assertEqual({'date':date(2016, 6, 1), 'impressions':1200, 'fbSpend':1000.0, 'ctr':1.5}, 
+                         rows[0])
+        self.assertEqual(2.5, rows[1]['fbSpend'])
+
+    def test_failed_schema_falls_back_to_parsing(self):
+        schema = Schema.from_responses(Response(errors=['foo']), Response(errors=['foo']))
+        rows = normalize(self.rows(), ['impressions', 'fbSpend'], schema, typed=True)
+        self.assertEqual(1200, rows[0]['impressions'])
+        self.assertEqual(2.5, rows[1]['fbSpend'])
+
+    @patch('nanigans.api.facebook.get_attributes')
+    @patch('nanigans.api.facebook.get_metrics')
+    @patch('nanigans.models.Adapter.get')
+    def test_get_stats_typed(self, mock_send, mock_metrics, mock_attributes):
+        mock_send.return_value = Response(data=[{'fbSpend':'100,000.5', 'impressions':'7'}])
+        mock_metrics.return_value = self.metrics
+        mock_attributes.return_value = self.attributes
+        fb = facebook.get_stats(start='2016-06-01', end='2016-06-02', typed=True)
+        self.assertEqual([100000.5], [record['fbSpend'] for record in fb.data])
+        self.assertEqual(7, fb.data[0]['impressions'])
+        self.assertEqual(1, mock_metrics.call_count)
+
+class TestClient(BaseTestCase):
+    start = '2016-06-01'
+    end = '2016-06-05'
+
+    def token(self, username, password, site):
+        return 'token-{0}'.format(site)
+
+    def sites(self, server):
+        # Map each request's site to the token it was sent with
+        sites = {}
+        for path, query in zip(server.paths, server.received):
+            sites.setdefault(path.split('/')[2], set()).update(query['access_token'])
+        return sites
+
+    @patch('nanigans.utils.generate_token')
+    def test_fetch_many_sites_scopes_each_site(self, mock_token):
+        mock_token.side_effect = self.token
+        site, token = auth.credentials['site'], auth.credentials['token']
+        with StubServer(latency=0.02) as server:
+            results = fetch_many_sites([111, 222, 333], facebook.get_stats, start=self.start,
+                                       end=self.end, max_workers=2)
+        self.assertEqual([111, 222, 333], list(results))
+        for response in results.values():
+            self.assertTrue(response.ok)
+            self.assertEqual(4, len(response.data))
+        self.assertEqual({'111': set(['token-111']), '222': set(['token-222']),
+                          '333': set(['token-333'])}, self.sites(server))
+        self.assertEqual((site, token), (auth.credentials['site'], auth.credentials['token']))
+
+    @patch('nanigans.utils.generate_token')
+    def test_failed_site_does_not_abort_the_others(self, mock_token):
+        mock_token.side_effect = self.token
+        def fetch():
+            if auth.credentials['site'] == '222':
+                raise ValueError('boom')
+            return Response(data=[auth.credentials['site']])
+        results = fetch_many_sites(['111', '222'], fetch)
+        self.assertEqual(['111'], results['111'].data)
+        self.assertEqual(['boom'], results['222'].errors)
+
+    @patch('nanigans.utils.generate_token')
+    def test_generators_stay_scoped(self, mock_token):
+        mock_token.side_effect = self.token
+        client = Client(444)
+        with StubServer() as server:
+            days = list(client.facebook.iter_stats(start=self.start, end=self.end, max_workers=3))
+            with client.scope():
+                self.assertEqual('444', auth.credentials['site'])
+                self.assertIs(client.session, get_session())
+        self.assertEqual(4, len(days))
+        self.assertEqual({'444': set(['token-444'])}, self.sites(server))
+        self.assertNotEqual('444', auth.credentials['site'])
+        self.assertEqual('<Nanigans Client [444]>', repr(client))
+
+    def test_client_authenticates_through_its_own_session(self):
+        client = Client(555)
+        get_token_cache().invalidate(client.credentials['username'], client.site)
+        tokens = []
+        def authenticate():
+            with client.scope():
+                tokens.append(auth.token)
+        with StubServer() as server:
+            thread = threading.Thread(target=authenticate)
+            thread.daemon = True
+            thread.start()
+            thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(['token-555'], tokens)
+        self.assertEqual(['/authenticate.php'], server.paths)
+        self.assertIsNotNone(client._session)
+
 
 if __name__ == "__main__":
     test_user = 'username@fakers.com'
@@ -113,7 +531,14 @@ if __name__ == "__main__":
         TestGetMetrics,
         TestGetViews,
         TestGetStats,
-        TestGetEvents
+        TestGetStatsConcurrently,
+        TestGetStatsChunked,
+        TestIterStats,
+        TestGetStatsAsync,
+        TestGetEvents,
+        TestStubServer,
+        TestNormalize,
+        TestClient
     ]
 
     for test_case in test_cases:
@@ -0,0 +1,180 @@
+import os
+import shutil
+import tempfile
+import unittest
+import nanigans
+
+from requests import ConnectionError
+from nanigans.models import Response
+from nanigans.backfill import Backfill, Checkpoint, Sync, SyncState, _digest
+from nanigans.rows import compact
+from nanigans.tests import SignedTestCase
+from datetime import date, timedelta
+from functools import partial
+
+
+class BackfillTests(SignedTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'backfill.sqlite')
+        self.written = {}
+        self.fetched = []
+        self.failing = set()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def fetch(self, start, end):
+        self.fetched.append(start)
+        if start in self.failing:
+            return Response(errors=['Service unavailable'])
+        return Response(data=[{'date': start}])
+
+    def write(self, day, response):
+        self.written[day] = response.data
+
+    def test_failed_days_are_retried_on_the_next_run(self):
+        self.failing = set(['2016-06-02'])
+        backfill = Backfill(self.fetch, self.write, self.path, 'placements', max_workers=3)
+        result = backfill.run('2016-06-01', '2016-06-06')
+        self.assertFalse(result.ok)
+        self.assertEquals([{'date': '2016-06-02', 'errors': ['Service unavailable']}], result.errors)
+        self.assertEquals(4, len(result.data))
+        self.assertEquals(['2016-06-01', '2016-06-03', '2016-06-04', '2016-06-05'], sorted(self.written))
+
+        # A new runner resumes from the checkpoint file
+        self.failing = set()
+        self.fetched = []
+        result = Backfill(self.fetch, self.write, self.path, 'placements').run('2016-06-01', '2016-06-06')
+        self.assertTrue(result.ok)
+        self.assertEquals(['2016-06-02'], self.fetched)
+        self.assertEquals(5, len(self.written))
+
+    def test_raising_fetch_does_not_stop_the_backfill(self):
+        def fetch(start, end):
+            if start == '2016-06-03':
+                raise ConnectionError('reset')
+            return Response(data=[{}])
+        result = Backfill(fetch, self.write, self.path, 'events').run('2016-06-01', '2016-06-05')
+        self.assertEquals(['2016-06-03'], [error['date'] for error in result.errors])
+        self.assertEquals(3, len(self.written))
+
+    def test_checkpoint_is_scoped_by_site_and_source(self):
+        checkpoint = Checkpoint(self.path)
+        checkpoint.mark('1', 'placements', '2016-06-01', 10)
+        checkpoint.mark('2', 'placements', '2016-06-02')
+        checkpoint.mark('1', 'events/click', '2016-06-03')
+        self.assertEquals(set(['2016-06-01']), checkpoint.completed('1', 'placements'))
+        self.assertEquals(set(), checkpoint.completed('1', 'placements', start='2016-06-02'))
+
+        backfill = Backfill(self.fetch, self.write, checkpoint, 'placements')
+        self.assertEquals(['2016-06-03', '2016-06-02'], 
+                          backfill.pending('2016-06-01', '2016-06-04', site='1'))
+        self.assertEquals(1, checkpoint.reset(site='1', source='placements'))
+        self.assertEquals(set(['2016-06-03']), checkpoint.completed('1', 'events/click'))
+
+
+class SyncTests(SignedTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'sync.sqlite')
+        self.written = []
+        self.fetched = []
+        self.failing = set()
+        self.clicks = {}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def day(self, ago):
+        return (date.today()-timedelta(days=ago)).strftime('%Y-%m-%d')
+
+    def fetch(self, start, end):
+        self.fetched.append(start)
+        if start in self.failing:
+            return Response(errors=['Service unavailable'])
+        return Response(data=[{'date': start, 'clicks': self.clicks.get(start, '1')}])
+
+    def write(self, day, response):
+        self.written.append(day)
+
+    def test_only_new_and_mutable_days_are_fetched(self):
+        sync = Sync(self.fetch, self.write, self.path, 'placements', max_workers=3)
+        result = sync.run(self.day(10))
+        self.assertTrue(result.ok)
+        self.assertEquals(11, len(self.fetched))
+        self.assertEquals([self.day(ago) for ago in range(11)], result.data)
+        self.assertEquals(self.day(4), sync.state.settled(*self.key(sync)))
+
+        # Later runs fetch the recent days again and report the changed ones
+        self.fetched, self.written = [], []
+        self.clicks[self.day(1)] = '2'
+        result = Sync(self.fetch, self.write, self.path, 'placements').run()
+        self.assertEquals([self.day(ago) for ago in range(4)], sorted(self.fetched, reverse=True))
+        self.assertEquals([self.day(1)], result.data)
+        self.assertEquals([self.day(1)], self.written)
+
+        self.fetched = []
+        self.assertEquals([], Sync(self.fetch, None, self.path, 'placements').run().data)
+        self.assertEquals(4, len(self.fetched))
+
+    def test_failed_days_hold_back_the_settled_date(self):
+        self.failing = set([self.day(8)])
+        sync = Sync(self.fetch, self.write, self.path, 'placements')
+        result = sync.run(self.day(10))
+        self.assertEquals([self.day(8)], [error['date'] for error in result.errors])
+        self.assertEquals(self.day(9), sync.state.settled(*self.key(sync)))
+
+        self.failing, self.fetched = set(), []
+        result = sync.run()
+        self.assertEquals([self.day(8), self.day(3), self.day(2), self.day(1), self.day(0)],
+                          sorted(self.fetched))
+        self.assertEquals([self.day(8)], result.data)
+        self.assertEquals(self.day(4), sync.state.settled(*self.key(sync)))
+
+    def test_state_is_scoped_by_query_signature(self):
+        fetch = partial(self.fetch_stats, ['adPlan'], ['fbSpend'])
+        signature = Sync(fetch, None, self.path, 'placements').signature
+        self.assertEquals(signature, Sync(partial(fetch, max_workers=8), None, self.path, 
+                                          'placements').signature)
+        self.assertNotEqual(signature, Sync(partial(self.fetch_stats, ['adPlan'], ['clicks']), None,
+                                            self.path, 'placements').signature)
+
+        state = SyncState(self.path)
+        state.record('1', 'placements', 'a', '2016-06-01', 'x', settled=True)
+        state.record('1', 'placements', 'b', '2016-06-02', 'y')
+        state.settle('1', 'placements', 'a', '2016-06-01')
+        self.assertEquals({'2016-06-01': ('x', True)}, state.days('1', 'placements', 'a'))
+        self.assertEquals(1, state.reset(signature='a', start='2016-06-01'))
+        self.assertEquals('2016-05-31', state.settled('1', 'placements', 'a'))
+        self.assertEquals({'2016-06-02': ('y', False)}, state.days('1', 'placements', 'b'))
+
+    def test_days_forgotten_before_end_are_fetched_again(self):
+        sync = Sync(self.fetch, self.write, self.path, 'placements')
+        sync.run(self.day(10))
+        self.assertEquals(4, sync.state.reset(end=self.day(6)))
+        self.assertEquals(self.day(11), sync.state.settled(*self.key(sync)))
+        self.fetched = []
+        result = sync.run()
+        self.assertEquals([self.day(ago) for ago in range(10, 6, -1)], sorted(result.data))
+        self.assertEquals(8, len(self.fetched))
+        self.assertEquals(self.day(4), sync.state.settled(*self.key(sync)))
+
+    def test_digest_ignores_row_order_and_storage(self):
+        rows = [{'adPlan': 'Plan 1', 'clicks': '1'}, {'adPlan': 'Plan 2', 'clicks': '2'}]
+        self.assertEquals(_digest(rows), _digest(compact(list(reversed(rows)))))
+        self.assertNotEqual(_digest(rows), _digest(rows[:1]))
+
+    def fetch_stats(self, attributes, metrics, start=None, end=None, max_workers=1):
+        return self.fetch(start, end)
+
+    def key(self, sync):
+        return nanigans.auth.credentials['site'], sync.source, sync.signature
+
+
+if __name__ == "__main__":
+    test_cases = [BackfillTests, SyncTests]
+
+    for test_case in test_cases:
+        suite = unittest.TestLoader().loadTestsFromTestCase(test_case)
+        unittest.TextTestRunner(verbosity=1).run(suite)
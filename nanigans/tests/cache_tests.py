@@ -0,0 +1,174 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from mock import patch
+from nanigans.models import PreparedRequest, AsyncPreparedRequest, Response
+from nanigans.cache import (ResponseCache, set_response_cache, MetadataCache, 
+                            get_metadata_cache, set_metadata_cache)
+from nanigans.tests import SignedTestCase
+from datetime import date, timedelta
+
+
+class ResponseCacheTests(SignedTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache = ResponseCache(os.path.join(self.tmp, 'cache.sqlite'), mutable_days=3)
+        set_response_cache(self.cache)
+
+    def tearDown(self):
+        set_response_cache(None)
+        shutil.rmtree(self.tmp)
+
+    def request(self, day, resource='adhoc'):
+        parameters = {'metrics[]=': ['clicks'], 'start': day, 'end': day}
+        return PreparedRequest(resource, {'source': 'placements'}, parameters)
+
+    @patch('nanigans.models.Adapter.get')
+    def test_settled_days_are_sent_once(self, mock_get):
+        mock_get.side_effect = lambda: Response(data=[{'clicks': '1', 'date': '2016-06-01'}])
+        first = self.request('2016-06-01').send()
+        second = self.request('2016-06-01').send()
+        self.assertEquals(1, mock_get.call_count)
+        self.assertEquals(first.data, second.data)
+        self.request('2016-06-02').send()
+        self.assertEquals(2, mock_get.call_count)
+
+    @patch('nanigans.models.Adapter.get')
+    def test_recent_days_and_errors_are_not_cached(self, mock_get):
+        mock_get.return_value = Response(data=[{'clicks': '1'}])
+        today = date.today().strftime('%Y-%m-%d')
+        self.request(today).send()
+        self.request(today).send()
+        mock_get.return_value = Response(errors=['foo'])
+        self.request('2016-06-01').send()
+        self.request('2016-06-01').send()
+        self.assertEquals(4, mock_get.call_count)
+        self.assertEquals(0, self.cache.size)
+
+    @patch('nanigans.models.Adapter.get')
+    def test_today_and_mutable_days_before_it_are_not_cached(self, mock_get):
+        mock_get.return_value = Response(data=[{'clicks': '1'}])
+        for ago in (3, 4):
+            day = (date.today()-timedelta(days=ago)).strftime('%Y-%m-%d')
+            self.request(day).send()
+            self.request(day).send()
+        self.assertEquals(3, mock_get.call_count)
+
+    def test_async_requests_use_the_cache_off_the_event_loop(self):
+        threads = []
+        load, store = self.cache.load, self.cache.store
+        def record(function):
+            def recorded(*args):
+                threads.append(threading.current_thread())
+                return function(*args)
+            return recorded
+
+        async def get(adapter, session=None):
+            return Response(data=[{'clicks': '1'}])
+
+        async def send():
+            request = AsyncPreparedRequest('adhoc', {'source': 'placements'},
+                                           {'start': '2016-06-01', 'end': '2016-06-01'})
+            return await request.send()
+
+        with patch.object(self.cache, 'load', record(load)), \
+             patch.object(self.cache, 'store', record(store)), \
+             patch('nanigans.models.AsyncAdapter.get', get):
+            first = asyncio.run(send())
+            second = asyncio.run(send())
+        self.assertEquals(first.data, second.data)
+        self.assertEquals(3, len(threads))
+        self.assertTrue(all(thread is not threading.main_thread() for thread in threads))
+
+    @patch('nanigans.models.Adapter.get')
+    def test_least_recently_used_entries_are_evicted(self, mock_get):
+        mock_get.side_effect = lambda: Response(data=[{'clicks': '1'*100}])
+        self.cache.max_bytes = 300
+        for day in ('2016-06-01', '2016-06-02', '2016-06-01', '2016-06-03'):
+            self.request(day).send()
+        self.assertTrue(self.cache.size <= 300)
+        self.request('2016-06-01').send()
+        self.request('2016-06-02').send()
+        self.assertEquals(4, mock_get.call_count)
+
+    @patch('nanigans.models.Adapter.get')
+    def test_entries_are_invalidated_by_date(self, mock_get):
+        mock_get.side_effect = lambda: Response(data=[{'clicks': '1'}])
+        for day in ('2016-06-01', '2016-06-02', '2016-06-03'):
+            self.request(day).send()
+        self.assertEquals(2, self.cache.invalidate(start='2016-06-02', resource='adhoc'))
+        self.assertEquals(0, self.cache.invalidate(site='654321'))
+        self.request('2016-06-01').send()
+        self.request('2016-06-02').send()
+        self.assertEquals(4, mock_get.call_count)
+
+
+class MetadataCacheTests(SignedTestCase):
+    def setUp(self):
+        set_metadata_cache(MetadataCache(ttl=60))
+
+    def tearDown(self):
+        set_metadata_cache(None)
+
+    def request(self, resource='metrics', source='placements'):
+        return PreparedRequest(resource, {'source': source})
+
+    @patch('nanigans.models.Adapter.get')
+    def test_metadata_is_sent_once_per_source(self, mock_get):
+        mock_get.side_effect = lambda: Response(data=[{'name': 'clicks'}])
+        first = self.request().send()
+        first.data[0]['name'] = 'changed'
+        second = self.request().send()
+        self.request(source='componentplacements').send()
+        self.request(resource='attributes').send()
+        self.assertEquals(3, mock_get.call_count)
+        self.assertEquals([{'name': 'clicks'}], second.data)
+
+    @patch('nanigans.models.Adapter.get')
+    def test_failures_and_other_resources_are_not_kept(self, mock_get):
+        mock_get.return_value = Response(errors=['foo'])
+        self.request().send()
+        self.request().send()
+        mock_get.return_value = Response(data=[{}])
+        self.request(resource='datasources').send()
+        self.request(resource='datasources').send()
+        self.assertEquals(4, mock_get.call_count)
+
+    @patch('nanigans.models.Adapter.get')
+    def test_concurrent_callers_share_one_request(self, mock_get):
+        def slow():
+            time.sleep(0.1)
+            return Response(data=[{'name': 'clicks'}])
+        mock_get.side_effect = slow
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.request().send()))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(1, mock_get.call_count)
+        self.assertEquals(8, len([r for r in results if r.data == [{'name': 'clicks'}]]))
+
+    @patch('nanigans.models.Adapter.get')
+    def test_invalidated_entries_are_sent_again(self, mock_get):
+        mock_get.side_effect = lambda: Response(data=[{}])
+        self.request().send()
+        self.request(resource='attributes').send()
+        get_metadata_cache().invalidate(resource='metrics')
+        self.request().send()
+        self.request(resource='attributes').send()
+        self.assertEquals(3, mock_get.call_count)
+
+
+if __name__ == "__main__":
+    test_cases = [ResponseCacheTests, MetadataCacheTests]
+
+    for test_case in test_cases:
+        suite = unittest.TestLoader().loadTestsFromTestCase(test_case)
+        unittest.TextTestRunner(verbosity=1).run(suite)
@@ -0,0 +1,66 @@
+import unittest
+
+from nanigans.models import Response
+from nanigans.columns import Columns, DictColumn, parse_number
+
+
+class ColumnsTests(unittest.TestCase):
+
+    rows = [
+        {'date': '2016/06/01', 'placementId': '101', 'impressions': '1,200', 'fbSpend': '1,000.50', 'ctr': '1.5%'},
+        {'date': '2016/06/01', 'placementId': '102', 'impressions': '30', 'fbSpend': '2', 'ctr': '0%'},
+        {'date': '2016/06/02', 'placementId': '101', 'impressions': '5', 'fbSpend': '$3.25'},
+    ]
+
+    def test_parse_number_handles_api_formats(self):
+        self.assertEquals(1200, parse_number('1,200'))
+        self.assertEquals(1000.5, parse_number('1,000.50'))
+        self.assertEquals(1.5, parse_number('1.5%'))
+        self.assertEquals(3.25, parse_number('$3.25'))
+        self.assertEquals(None, parse_number('Campaign'))
+        self.assertEquals(None, parse_number(''))
+
+    def test_metrics_are_typed_arrays(self):
+        columns = Response(self.rows).to_columns(metrics=['impressions', 'fbSpend', 'ctr'])
+        self.assertEquals(3, len(columns))
+        self.assertEquals('q', columns['impressions'].typecode)
+        self.assertEquals([1200, 30, 5], list(columns['impressions']))
+        self.assertEquals('d', columns['fbSpend'].typecode)
+        self.assertEquals([1000.5, 2.0, 3.25], list(columns['fbSpend']))
+
+    def test_attributes_are_dictionary_encoded(self):
+        columns = Columns.from_rows(self.rows, metrics=['impressions', 'fbSpend', 'ctr'])
+        self.assertIsInstance(columns['placementId'], DictColumn)
+        self.assertEquals(['101', '102'], columns['placementId'].categories)
+        self.assertEquals([0, 1, 0], list(columns['placementId'].codes))
+        self.assertEquals(['2016/06/01', '2016/06/01', '2016/06/02'], list(columns['date']))
+
+    def test_missing_values_are_padded(self):
+        columns = Columns.from_rows(self.rows, metrics=['impressions', 'fbSpend', 'ctr'])
+        rows = list(columns.rows())
+        self.assertEquals(None, rows[2]['ctr'])
+        self.assertEquals(1.5, rows[0]['ctr'])
+
+        columns.append([{'impressions': '1', 'reach': '2'}])
+        self.assertEquals(4, len(columns))
+        self.assertEquals(None, columns['date'][3])
+        self.assertEquals(4, len(columns['reach']))
+
+    def test_metrics_are_inferred_without_a_schema(self):
+        columns = Columns.from_rows(self.rows)
+        self.assertIsInstance(columns['date'], DictColumn)
+        self.assertEquals('q', columns['impressions'].typecode)
+
+    def test_built_from_responses(self):
+        responses = [Response(self.rows[:2]), Response(self.rows[2:])]
+        columns = Columns.from_responses(responses, metrics=['impressions'])
+        self.assertEquals([1200, 30, 5], list(columns['impressions']))
+        self.assertEquals('<Nanigans Columns [3 x 5]>', repr(columns))
+
+
+if __name__ == "__main__":
+    test_cases = [ColumnsTests]
+
+    for test_case in test_cases:
+        suite = unittest.TestLoader().loadTestsFromTestCase(test_case)
+        unittest.TextTestRunner(verbosity=1).run(suite)
@@ -0,0 +1,127 @@
+import io
+import json
+import tracemalloc
+import unittest
+
+from mock import Mock
+from nanigans.models import PreparedRequest, Adapter
+from nanigans.decoding import Decoder, ArrayStream, ProcessDecoder, set_decoder, activate_decoder
+from nanigans.rows import Row
+from nanigans.tests import SignedTestCase, fake_response
+from nanigans.tests.server import StubServer
+
+
+class DecoderTests(SignedTestCase):
+    document = {'success': True,
+                'data': [{'id': i, 'name': 'a "quoted"}, name', 'spend': -1.5e3} for i in range(50)],
+                'error': None,
+                'total': 12.75}
+
+    def tearDown(self):
+        set_decoder(None)
+
+    def test_stream_matches_whole_body_for_any_chunk_size(self):
+        for body in (json.dumps(self.document), json.dumps(self.document, indent=2)):
+            for chunk_size in (1, 3, 64, 2**16):
+                parsed = Decoder(chunk_size=chunk_size).parse(io.BytesIO(body.encode('utf-8')))
+                self.assertEquals(self.document, parsed)
+
+    def test_stream_yields_items_of_nested_arrays(self):
+        document = {'data': [{'a': {'b': [1, 2]}, 'c': [{'d': 1}]} for _ in range(10)], 'success': False}
+        items = ArrayStream(io.BytesIO(json.dumps(document).encode('utf-8')), chunk_size=7)
+        self.assertEquals(document['data'], list(items))
+        self.assertEquals({'success': False}, items.members)
+
+    def test_iterated_items_use_bounded_memory(self):
+        class Body(object):
+            """A 10MB response body generated as it is read."""
+            def __init__(self):
+                item = json.dumps({'id': 1, 'name': 'x'*100}).encode('utf-8')
+                self.parts = iter([b'{"success": true, "data": ['] +
+                                  [item+b','] * 80000 + [item+b']}'])
+                self.size = 0
+
+            def read(self, size):
+                chunk = b''.join(part for _, part in zip(range(size//100), self.parts))
+                self.size += len(chunk)
+                return chunk
+
+        body = Body()
+        tracemalloc.start()
+        try:
+            items = Decoder(chunk_size=2**16).iter_items(body)
+            count = sum(1 for _ in items)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertEquals(80001, count)
+        self.assertEquals({'success': True}, items.members)
+        self.assertTrue(body.size > 9*2**20)
+        self.assertTrue(peak < 2**20, peak)
+
+    def test_truncated_stream_raises_value_error(self):
+        body = json.dumps(self.document).encode('utf-8')
+        with self.assertRaises(ValueError):
+            Decoder(chunk_size=16).parse(io.BytesIO(body[:-40]))
+        with self.assertRaises(ValueError):
+            Decoder().parse(io.BytesIO(b'<html>Bad Gateway</html>'))
+
+    def test_standard_library_backend(self):
+        decoder = Decoder('json')
+        self.assertEquals(self.document, decoder.loads(json.dumps(self.document)))
+        with self.assertRaises(ValueError):
+            Decoder('simplejson')
+
+    def test_adapter_streams_configured_resources(self):
+        from nanigans.tests.server import StubServer
+
+        set_decoder(Decoder(stream=('adhoc',), chunk_size=8))
+        request = PreparedRequest('adhoc', {'source': 'placements'}, 
+                                  {'start': '2016-06-01', 'end': '2016-06-05'})
+        with StubServer():
+            response = Adapter(request).get()
+        self.assertTrue(response.ok)
+        self.assertEquals(['2016/06/0{0}'.format(day) for day in range(1, 6)], 
+                          [record['date'] for record in response.data])
+
+    def test_day_is_added_to_rows_of_successful_responses(self):
+        decoder = Decoder('json')
+        body = json.dumps(self.document)
+        self.assertEquals(['2016-06-01']*50, 
+                          [row['date'] for row in decoder.loads(body, '2016-06-01')['data']])
+        failed = decoder.loads(json.dumps({'success': False, 'data': [{}], 'error': 'foo'}), 'x')
+        self.assertEquals([{}], failed['data'])
+
+    def test_process_decoder_matches_decoder(self):
+        body = json.dumps(self.document).encode('utf-8')
+        expected = Decoder().loads(body, '2016-06-01')
+        with ProcessDecoder(1, min_size=0) as decoder:
+            self.assertEquals(expected, decoder.decode(fake_response(body=self.document), 
+                                                       day='2016-06-01'))
+            self.assertIsNotNone(decoder._pool)
+        with ProcessDecoder(1, compact=True, min_size=0) as decoder:
+            rows = decoder.decode(fake_response(body=self.document), day='2016-06-01')['data']
+            small = ProcessDecoder(compact=True).decode(fake_response(body=self.document),
+                                                        day='2016-06-01')['data']
+        for data in (rows, small):
+            self.assertTrue(all(isinstance(row, Row) for row in data))
+            self.assertEquals(expected['data'], [dict(row) for row in data])
+        self.assertIsNone(decoder._pool)
+
+    def test_activated_decoder_is_used_by_adapters(self):
+        from nanigans.tests.server import StubServer
+
+        decoder = Decoder()
+        decoder.decode = Mock(wraps=decoder.decode)
+        request = PreparedRequest('events', {'attribution': 'click'}, {'date': '2016-06-01'})
+        with StubServer(), activate_decoder(decoder):
+            self.assertEquals(['2016-06-01'], [row['date'] for row in request.send().data])
+        self.assertTrue(decoder.decode.called)
+
+
+if __name__ == "__main__":
+    test_cases = [DecoderTests]
+
+    for test_case in test_cases:
+        suite = unittest.TestLoader().loadTestsFromTestCase(test_case)
+        unittest.TextTestRunner(verbosity=1).run(suite)
@@ -0,0 +1,103 @@
+import unittest
+
+from mock import Mock, patch
+from requests import ConnectionError
+from nanigans.models import PreparedRequest
+from nanigans.retry import RetryPolicy, set_retry_policy
+from nanigans.hooks import Hooks, Collector, Histogram, set_hooks
+from nanigans.tests import SignedTestCase, fake_response
+from nanigans.tests.server import StubServer
+
+
+class HooksTests(SignedTestCase):
+    def setUp(self):
+        self.hooks = Hooks()
+        self.events = []
+        for event in ('before_request', 'after_response', 'on_error', 'on_retry'):
+            self.hooks.register(event, lambda attempt, event=event: 
+                                self.events.append((event, attempt.number)))
+        set_hooks(self.hooks)
+        set_retry_policy(RetryPolicy(max_attempts=3, backoff=0.01))
+
+    def tearDown(self):
+        set_hooks(None)
+        set_retry_policy(None)
+
+    def request(self, resource='adhoc', day='2016-06-01'):
+        parameters = {'start': day, 'end': day} if day else {}
+        return PreparedRequest(resource, {'source': 'placements', 'view': 'v'}, parameters)
+
+    def test_hooks_are_called_around_each_attempt(self):
+        with StubServer():
+            self.request().send()
+        self.assertEquals([('before_request', 1), ('after_response', 1)], self.events)
+
+    @patch('nanigans.models.time.sleep')
+    @patch('nanigans.models.get_session')
+    def test_failed_attempts_report_errors_and_retries(self, mock_session, mock_sleep):
+        mock_session.return_value.get.side_effect = [
+            ConnectionError('reset'),
+            fake_response(body={'success': True, 'data': []})]
+        self.assertTrue(self.request().send().ok)
+        self.assertEquals(['before_request', 'on_error', 'on_retry'], 
+                          [event for event, number in self.events if number == 1])
+        self.assertEquals(('after_response', 2), self.events[-1])
+
+    def test_attempt_carries_request_details_and_timings(self):
+        attempts = self.hooks.register('after_response', Mock())
+        with StubServer(rows=10):
+            self.request().send()
+        attempt = attempts.call_args[0][0]
+        self.assertEquals(('adhoc', '2016-06-01', 200, True), 
+                          (attempt.resource, attempt.date, attempt.status, attempt.ok))
+        self.assertTrue(attempt.url.endswith('/sites/{0}/datasources/placements/views/adhoc'
+                                             .format(attempt.site)))
+        self.assertTrue(attempt.bytes > 100)
+        self.assertTrue(0 <= attempt.timings['ttfb'] <= attempt.timings['total'])
+        self.assertTrue(attempt.timings['parse'] <= attempt.timings['total'])
+        self.assertIsNone(attempt.timings['dns'])
+        self.assertNotIn('access_token', attempt.params)
+        self.assertEquals('2016-06-01', attempt.params['start'])
+
+    def test_unregistered_callbacks_are_not_called(self):
+        callback = self.hooks.register('before_request', Mock())
+        self.hooks.unregister('before_request', callback)
+        with StubServer():
+            self.request().send()
+        self.assertFalse(callback.called)
+        self.assertRaises(ValueError, self.hooks.register, 'on_success', callback)
+
+    def test_collector_aggregates_per_endpoint_and_day(self):
+        collector = Collector().install(self.hooks)
+        with StubServer(latency=0.01):
+            for day in ('2016-06-01', '2016-06-02', '2016-06-02'):
+                self.request(day=day).send()
+            self.request('view', None).send()
+        summary = dict((row['endpoint'], row) for row in collector.summary())
+        self.assertEquals(3, summary['adhoc']['requests'])
+        self.assertEquals(1, summary['view']['requests'])
+        self.assertEquals(0, summary['adhoc']['errors'])
+        self.assertTrue(0.01 <= summary['adhoc']['p50'] <= summary['adhoc']['max'])
+        self.assertEquals(('adhoc', '2016-06-02'), collector.slowest_days()[0][:2])
+        self.assertEquals(3, collector.histogram('adhoc', 'ttfb').count)
+        collector.uninstall(self.hooks)
+        self.assertEquals(['before_request', 'after_response', 'on_error', 'on_retry'],
+                          [event for event, calls in self.hooks._callbacks.items() if calls])
+
+    def test_histogram_quantiles(self):
+        histogram = Histogram(bounds=(0.1, 1.0))
+        for value in (0.05, 0.05, 0.5, 3.0):
+            histogram.observe(value)
+        self.assertEquals([2, 1, 1], histogram.counts)
+        self.assertEquals(0.1, histogram.quantile(0.5))
+        self.assertEquals(1.0, histogram.quantile(0.75))
+        self.assertEquals(3.0, histogram.quantile(0.99))
+        self.assertEquals(0.9, histogram.mean)
+
+
+if __name__ == "__main__":
+    test_cases = [HooksTests]
+
+    for test_case in test_cases:
+        suite = unittest.TestLoader().loadTestsFromTestCase(test_case)
+        unittest.TextTestRunner(verbosity=1).run(suite)
@@ -1,9 +1,11 @@
+import asyncio
 import unittest
 
 from mock import Mock, MagicMock, patch
 from nanigans.utils import set_default_config
 from nanigans.object import Credentials
-from nanigans.models import PreparedRequest, Adapter, Response
+from nanigans.models import PreparedRequest, AsyncPreparedRequest, Adapter, Response
+from nanigans.tests import SignedTestCase, fake_response
 
 
 class RequestTests(unittest.TestCase):
@@ -102,7 +104,25 @@ class RequestTests(unittest.TestCase):
                             id(another_request.parameters))
 
 
-class AdapterTests(unittest.TestCase):
+class AsyncRequestTests(SignedTestCase):
+    def test_request_validates_like_prepared_request(self):
+        with self.assertRaises(TypeError):
+            AsyncPreparedRequest(resource=1, required_fields={'bar': 'bar'})
+
+    @patch('nanigans.models.aiohttp', None)
+    @patch('nanigans.models.Adapter.get', return_value=Response(data=[1]))
+    def test_send_is_awaitable_and_returns_response(self, mock_get):
+        request = AsyncPreparedRequest(resource='datasources', required_fields={'source': 'foo'})
+        response = asyncio.run(request.send())
+        self.assertIsInstance(response, Response)
+        self.assertEquals([1], response.data)
+
+    def test_repr_outputs_as_intended(self):
+        request = AsyncPreparedRequest(resource='foo', required_fields={'bar': 'bar'})
+        self.assertEquals('<Nanigans Async Prepared Request [foo]>', repr(request))
+
+
+class AdapterTests(SignedTestCase):
     def setUp(self):
         # We mock the Request class so that, if Request changes, we have an
         # obvious starting point from which to make changes to the Adapter
@@ -168,6 +188,16 @@ class AdapterTests(unittest.TestCase):
         self.assertEquals(errors, response.errors)
         self.assertEquals([], response.data)
 
+    @patch('nanigans.models.get_session')
+    def test_get_sends_through_shared_session(self, mock_session):
+        resp = fake_response(body={'success': True, 'data': [{'foo': 'bar'}]})
+        mock_session.return_value.get.return_value = resp
+        response = self.accounts_adapter.get()
+
+        mock_session.return_value.get.assert_called_once_with(
+            url=self.accounts_adapter.endpoint, params=self.accounts_adapter.params)
+        self.assertEquals([{'foo': 'bar'}], response.data)
+
     def test_repr_outputs_as_intended(self):
         self.assertEquals('<Nanigans Adapter [Reporting API]>', repr(self.accounts_adapter))
 
@@ -266,11 +296,43 @@ class ResponseTests(unittest.TestCase):
         self.assertEquals(data_a + data_b, response_sum.data)
         self.assertEquals(errors_a + errors_b, response_sum.errors)
 
+    def test_responses_are_added_in_place_correctly(self):
+        response_a = Response(data=[1], errors=['a'])
+        response_b = Response(data=[2], errors=['b'])
+        response_id = id(response_a)
+
+        response_a += response_b
+        self.assertEquals(response_id, id(response_a))
+        self.assertEquals([1, 2], response_a.data)
+        self.assertEquals(['a', 'b'], response_a.errors)
+        self.assertEquals([2], response_b.data)
+
+    def test_responses_are_concatenated_in_order(self):
+        responses = [Response(data=[i], errors=[i] if i % 2 else None) for i in range(5)]
+        response = Response.concat(iter(responses))
+        self.assertEquals([0, 1, 2, 3, 4], response.data)
+        self.assertEquals([1, 3], response.errors)
+        self.assertEquals([], Response.concat([]).data)
+
+    def test_errors_of_dated_responses_are_tagged(self):
+        responses = [Response(data=[1], date='2016-06-02'),
+                     Response(errors=['Service unavailable'], date='2016-06-01'),
+                     Response(errors=['foo'])]
+        response = Response.concat(responses)
+        self.assertEquals([1], response.data)
+        self.assertEquals([{'date': '2016-06-01', 'errors': ['Service unavailable']}, 'foo'],
+                          response.errors)
+        self.assertEquals(response.errors, Response.concat([response]).errors)
+
     def test_adding_non_response_to_response_raises_type_error(self):
         response = Response()
         for non_response in [1, '1', {1}, {'1': 1}, (1, 1), [1]]:
             with self.assertRaises(TypeError):
                 response + non_response
+            with self.assertRaises(TypeError):
+                response += non_response
+            with self.assertRaises(TypeError):
+                Response.concat([response, non_response])
 
     def test_repr_outputs_as_intended(self):
         response = Response(data=[1])
@@ -288,7 +350,7 @@ if __name__ == "__main__":
     auth = Credentials()
     set_default_config(test_user, test_password, test_site)
 
-    test_cases = [RequestTests, AdapterTests, ResponseTests]
+    test_cases = [RequestTests, AsyncRequestTests, AdapterTests, ResponseTests]
 
     for test_case in test_cases:
         suite = unittest.TestLoader().loadTestsFromTestCase(test_case)
@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from mock import Mock, patch
+from nanigans.models import Adapter
+from nanigans.ratelimit import TokenBucket, RateLimiter, set_rate_limiter
+from nanigans.tests import SignedTestCase, fake_response
+
+
+class RateLimiterTests(SignedTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+        set_rate_limiter(None)
+
+    def test_bucket_allows_bursts_up_to_capacity(self):
+        bucket = TokenBucket(rate=1, capacity=3)
+        self.assertEquals([0, 0, 0], [bucket.reserve() for _ in range(3)])
+        self.assertAlmostEqual(1, bucket.reserve(), places=1)
+        self.assertAlmostEqual(2, bucket.reserve(), places=1)
+
+    def test_limiter_applies_every_matching_bucket(self):
+        limiter = RateLimiter()
+        limiter.limit(100)
+        limiter.limit(1, site=123, resource='events')
+        self.assertEquals(0, limiter.reserve('123', 'events'))
+        self.assertTrue(limiter.reserve('123', 'events') > 0.5)
+        self.assertEquals(0, limiter.reserve('123', 'adhoc'))
+        self.assertEquals(0, limiter.reserve('456', 'events'))
+
+    def test_file_buckets_share_tokens(self):
+        path = os.path.join(self.tmp, 'bucket')
+        first, second = RateLimiter(), RateLimiter()
+        first.limit(1, path=path)
+        second.limit(1, path=path)
+        self.assertEquals(0, first.reserve('123', 'adhoc'))
+        self.assertTrue(second.reserve('123', 'adhoc') > 0.5)
+
+    @patch('nanigans.models.get_session')
+    def test_adapter_waits_for_limiter(self, mock_session):
+        mock_session.return_value.get.return_value = fake_response(
+            body={'success': True, 'data': []})
+        limiter = RateLimiter()
+        limiter.limit(20, capacity=1, resource='datasources')
+        set_rate_limiter(limiter)
+        request = Mock()
+        request.resource = 'datasources'
+        request.required_fields = {'source':'TestResource'}
+        request.parameters = {}
+        started = time.time()
+        for _ in range(5):
+            Adapter(PreparedRequest=request).get()
+        self.assertTrue(time.time()-started >= 0.19)
+
+
+if __name__ == "__main__":
+    test_cases = [RateLimiterTests]
+
+    for test_case in test_cases:
+        suite = unittest.TestLoader().loadTestsFromTestCase(test_case)
+        unittest.TextTestRunner(verbosity=1).run(suite)
@@ -0,0 +1,76 @@
+import unittest
+
+from mock import Mock, patch
+from requests import ConnectionError
+from nanigans.models import Adapter
+from nanigans.retry import RetryPolicy, set_retry_policy
+from nanigans.tests import SignedTestCase, fake_response
+
+
+class RetryTests(SignedTestCase):
+    def setUp(self):
+        request = Mock()
+        request.resource = 'datasources'
+        request.required_fields = {'source':'TestResource'}
+        request.parameters = {}
+        self.adapter = Adapter(PreparedRequest=request)
+        self.ok = fake_response(body={'success': True, 'data': [{'foo': 'bar'}]})
+        set_retry_policy(RetryPolicy(max_attempts=3, backoff=0.01))
+
+    def tearDown(self):
+        set_retry_policy(None)
+
+    @patch('nanigans.models.time.sleep')
+    @patch('nanigans.models.get_session')
+    def test_transient_failures_are_retried(self, mock_session, mock_sleep):
+        failures = [
+            ConnectionError('reset'),
+            fake_response(502, text='<html>Bad Gateway</html>'),
+            fake_response(body={'success': False, 'error': 'Rate limit exceeded'}),
+        ]
+        for failure in failures:
+            mock_session.return_value.get.side_effect = [failure, self.ok]
+            response = self.adapter.get()
+            self.assertTrue(response.ok)
+            self.assertEquals([{'foo': 'bar'}], response.data)
+        self.assertEquals(3, mock_sleep.call_count)
+
+    @patch('nanigans.models.time.sleep')
+    @patch('nanigans.models.get_session')
+    def test_other_errors_are_not_retried(self, mock_session, mock_sleep):
+        error = fake_response(body={'success': False, 'error': 'Invalid metric foo'})
+        mock_session.return_value.get.side_effect = [error, self.ok]
+        response = self.adapter.get()
+        self.assertEquals(['Invalid metric foo'], response.errors)
+        self.assertFalse(mock_sleep.called)
+
+    @patch('nanigans.models.time.sleep')
+    @patch('nanigans.models.get_session')
+    def test_errors_of_last_attempt_are_returned(self, mock_session, mock_sleep):
+        mock_session.return_value.get.side_effect = ConnectionError('reset')
+        response = self.adapter.get()
+        self.assertEquals(['reset'], response.errors)
+        self.assertEquals(3, mock_session.return_value.get.call_count)
+
+    @patch('nanigans.models.time.sleep')
+    @patch('nanigans.models.get_session')
+    def test_retry_after_header_is_honoured(self, mock_session, mock_sleep):
+        limited = fake_response(429, body={'success': False, 'error': 'Slow down'},
+                                headers={'Retry-After': '2'})
+        mock_session.return_value.get.side_effect = [limited, self.ok]
+        self.adapter.get()
+        mock_sleep.assert_called_once_with(2.0)
+
+    def test_delay_is_jittered_and_capped(self):
+        policy = RetryPolicy(backoff=1, max_backoff=4)
+        for attempt in range(1, 10):
+            self.assertTrue(0 <= policy.delay(attempt) <= min(4, 2**(attempt-1)))
+        self.assertEquals(4, RetryPolicy(backoff=1, max_backoff=4, jitter=False).delay(5))
+
+
+if __name__ == "__main__":
+    test_cases = [RetryTests]
+
+    for test_case in test_cases:
+        suite = unittest.TestLoader().loadTestsFromTestCase(test_case)
+        unittest.TextTestRunner(verbosity=1).run(suite)
@@ -0,0 +1,96 @@
+import csv
+import json
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import unittest
+
+from copy import deepcopy
+from nanigans.models import Response
+from nanigans.sinks import CSVSink, JSONLinesSink
+from nanigans.rows import Row, row_type, compact, as_dicts
+
+
+class RowsTests(unittest.TestCase):
+    def setUp(self):
+        self.rows = [{'adPlan': 'Plan 1', 'impressions': '10', 'date': '2016-06-01'},
+                     {'adPlan': 'Plan 2', 'impressions': '20', 'date': '2016-06-01'},
+                     {'adPlan': 'Plan 1', 'clicks': '3', 'date': '2016-06-01'}]
+
+    def test_rows_are_read_like_dicts(self):
+        rows = compact([dict(row) for row in self.rows], ['impressions', 'adPlan'])
+        row = rows[0]
+        self.assertIsInstance(row, Row)
+        self.assertEquals(('impressions', 'adPlan', 'date', 'clicks'), row.keys())
+        self.assertEquals('Plan 1', row['adPlan'])
+        self.assertEquals('10', row[0])
+        self.assertIsNone(row.get('clicks'))
+        self.assertEquals('x', row.get('foo', 'x'))
+        self.assertRaises(KeyError, lambda: row['foo'])
+        self.assertTrue('date' in row)
+        self.assertEquals(['impressions', 'adPlan', 'date', 'clicks'], list(row))
+        self.assertEquals(dict(self.rows[0], clicks=None), dict(row))
+        self.assertEquals(dict(self.rows[2], impressions=None), rows[2])
+
+    def test_rows_share_their_class_and_values(self):
+        rows = compact([dict(row) for row in self.rows])
+        self.assertIs(type(rows[0]), type(rows[2]))
+        self.assertIs(type(rows[0]), row_type(('adPlan', 'impressions', 'date', 'clicks')))
+        self.assertIs(rows[0]['date'], rows[1]['date'])
+        self.assertTrue(sys.getsizeof(rows[0]) < sys.getsizeof(self.rows[0]))
+
+    def test_rows_survive_copies_and_pickling(self):
+        rows = compact([dict(row) for row in self.rows])
+        self.assertEquals(rows, pickle.loads(pickle.dumps(rows)))
+        self.assertEquals(rows, deepcopy(rows))
+        self.assertEquals(rows[0].keys(), pickle.loads(pickle.dumps(rows[0])).keys())
+
+    def test_rows_serialize_as_dicts(self):
+        rows = compact([dict(row) for row in self.rows])
+        self.assertEquals(dict(self.rows[0], clicks=None), rows[0]._asdict())
+        data = as_dicts(rows+[{'adPlan': 'Plan 3'}])
+        self.assertTrue(all(type(row) is dict for row in data))
+        self.assertEquals(data, json.loads(json.dumps(data)))
+        self.assertEquals('Plan 3', data[-1]['adPlan'])
+
+    def test_unhashable_values_are_kept(self):
+        rows = compact([{'ids': [1, 2]}, {'ids': [3]}])
+        self.assertEquals([3], rows[1]['ids'])
+
+    def test_numbers_keep_their_type(self):
+        rows = compact([{'clicks': 1, 'active': True, 'spend': 0, 'paused': False, 'ctr': 1.0},
+                        {'clicks': 1.0}, {'clicks': True}, {'clicks': 1}])
+        self.assertEquals([True, False, 1.0], [rows[0][name] for name in ('active', 'paused', 'ctr')])
+        self.assertEquals([int, float, bool, int], [type(row['clicks']) for row in rows])
+
+    def test_response_compact(self):
+        response = Response(data=[dict(row) for row in self.rows]).compact()
+        self.assertTrue(all(isinstance(row, Row) for row in response.data))
+        columns = response.to_columns(['impressions', 'clicks'])
+        self.assertEquals(3, len(columns))
+        self.assertEquals(['Plan 1', 'Plan 2', 'Plan 1'], list(columns['adPlan']))
+
+    def test_sinks_write_rows(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            rows = compact([dict(row) for row in self.rows])
+            with JSONLinesSink(os.path.join(tmp, 'rows.jsonl')) as sink:
+                sink.write_rows(rows)
+            with open(os.path.join(tmp, 'rows.jsonl')) as f:
+                self.assertEquals(dict(rows[1]), json.loads(f.readlines()[1]))
+            with CSVSink(os.path.join(tmp, 'rows.csv')) as sink:
+                sink.write_rows(rows)
+            with open(os.path.join(tmp, 'rows.csv')) as f:
+                self.assertEquals('Plan 2', list(csv.DictReader(f))[1]['adPlan'])
+        finally:
+            shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    test_cases = [RowsTests]
+
+    for test_case in test_cases:
+        suite = unittest.TestLoader().loadTestsFromTestCase(test_case)
+        unittest.TextTestRunner(verbosity=1).run(suite)
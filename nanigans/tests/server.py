@@ -0,0 +1,132 @@
+"""
+A local stub of the Nanigans Reporting API used by the tests and benchmarks.
+
+The server answers every GET with a successful JSON payload containing one
+row per request and records the query parameters it received, along with
+the largest number of requests it was serving at the same time, and the
+paths it was asked for. Adhoc requests spanning several days get one row
+per day with a date attribute, and fail when they span more than max_days.
+
+Larger payloads are served with rows, the number of rows per request or
+day, and a share of the GETs given by error_rate fails with a 503. POSTs
+to authenticate.php return a token for the site.
+"""
+import json
+import random
+import threading
+import time
+
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs
+from mock import patch
+
+from nanigans.models import Adapter
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            time.sleep(server.latency)
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            with server.lock:
+                server.received.append(query)
+                server.paths.append(url.path)
+                failed = server.random.random() < server.error_rate
+            if failed:
+                self.reply(503, {'success': False, 'error': 'Service Unavailable'})
+            else:
+                self.reply(200, self.payload(query))
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        with self.server.lock:
+            self.server.paths.append(url.path)
+        site = query.get('id', [''])[0]
+        self.reply(200, {'token': 'token-{0}'.format(site)})
+
+    def reply(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def payload(self, query):
+        if 'start' not in query or query['start'] == query['end']:
+            return {'success': True, 'data': self.rows()}
+
+        start = datetime.strptime(query['start'][0], '%Y-%m-%d')
+        end = datetime.strptime(query['end'][0], '%Y-%m-%d')
+        days = (end-start).days+1
+        if self.server.max_days and days > self.server.max_days:
+            return {'success': False, 'error': 'Date range too large'}
+        rows = []
+        for add in range(days):
+            day = (start+timedelta(add)).strftime('%Y/%m/%d')
+            rows.extend(dict(row, date=day) for row in self.rows())
+        return {'success': True, 'data': rows}
+
+    def rows(self):
+        row = {'impressions': '1', 'fbSpend': '1,000.00'}
+        if self.server.rows == 1:
+            return [row]
+        return [dict(row, adPlan='Plan {0}'.format(i), clicks=str(i))
+                for i in range(self.server.rows)]
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, max_days=None, rows=1, error_rate=0.0, seed=None):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.latency = latency
+        self.max_days = max_days
+        self.rows = rows
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.received = []
+        self.paths = []
+
+    @property
+    def url(self):
+        return 'http://{0}:{1}'.format(*self.server_address)
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        base = self.url+'/sites/{0}/datasources'
+        self._patches = [
+            patch.object(Adapter, '_adhoc_endpoint', base+'/{1}/views/adhoc'),
+            patch.object(Adapter, '_views_endpoint', base+'/{1}/views/{2}'),
+            patch.object(Adapter, '_events_endpoint', self.url+'/sites/{0}/events'),
+            patch('nanigans.utils._authenticate_endpoint', self.url+'/authenticate.php'),
+        ]
+        for patcher in self._patches:
+            patcher.start()
+        return self
+
+    def __exit__(self, *exc):
+        for patcher in self._patches:
+            patcher.stop()
+        self.shutdown()
+        self.server_close()
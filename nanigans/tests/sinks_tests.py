@@ -0,0 +1,84 @@
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from nanigans.models import Response
+from nanigans.sinks import Sink, CSVSink, JSONLinesSink, ParquetSink, pyarrow
+
+
+class SinkTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def path(self, name):
+        return os.path.join(self.tmp, name)
+
+    def responses(self):
+        yield Response(data=[{'date': '2016/06/02', 'clicks': '1'}, {'date': '2016/06/02', 'clicks': '2'}])
+        yield Response(errors=['Service unavailable'])
+        yield Response(data=[{'date': '2016/06/01', 'clicks': '3', 'extra': 'x'}])
+
+    def test_csv_is_written_with_a_header(self):
+        with CSVSink(self.path('stats.csv')) as sink:
+            failed = sink.consume(self.responses())
+        self.assertEquals(['Service unavailable'], failed.errors)
+        self.assertEquals(3, sink.rows)
+        with open(self.path('stats.csv')) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEquals(['1', '2', '3'], [row['clicks'] for row in rows])
+        self.assertEquals(['date', 'clicks'], list(rows[0]))
+
+    def test_json_lines_roll_per_day_and_compress(self):
+        with JSONLinesSink(self.path('clicks-{date}.jsonl.gz'), per_day=True) as sink:
+            sink.consume(self.responses())
+        self.assertEquals(['clicks-2016-06-01.jsonl.gz', 'clicks-2016-06-02.jsonl.gz'], 
+                          sorted(os.listdir(self.tmp)))
+        with gzip.open(self.path('clicks-2016-06-02.jsonl.gz'), 'rt') as f:
+            self.assertEquals(['1', '2'], [json.loads(line)['clicks'] for line in f])
+
+    def test_days_written_again_replace_earlier_files(self):
+        backfill_day = Response(data=[{'clicks': '1'}])
+        for _ in range(2):
+            with CSVSink(self.path('day-{date}.csv'), per_day=True) as sink:
+                sink.write('2016-06-01', backfill_day)
+        with open(self.path('day-2016-06-01.csv')) as f:
+            self.assertEquals(2, len(f.readlines()))
+
+    def test_single_files_are_appended_to_by_later_runs(self):
+        for day in ('2016-06-01', '2016-06-02'):
+            with CSVSink(self.path('stats.csv.gz')) as sink:
+                sink.write(day, Response(data=[{'date': day, 'clicks': '1'}]))
+        with gzip.open(self.path('stats.csv.gz'), 'rt') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEquals(['2016-06-01', '2016-06-02'], [row['date'] for row in rows])
+
+    def test_sinks_implement_open_and_write(self):
+        self.assertRaises(TypeError, Sink, self.path('stats.csv'))
+
+    def test_per_day_sinks_need_a_date(self):
+        with self.assertRaises(ValueError):
+            CSVSink(self.path('stats.csv'), per_day=True)
+        with self.assertRaises(ValueError):
+            JSONLinesSink(self.path('stats.jsonl'), compression='zip')
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_parquet_is_written_in_row_groups(self):
+        with ParquetSink(self.path('stats.parquet'), row_group_size=2) as sink:
+            sink.consume(self.responses())
+        table = pyarrow.parquet.read_table(self.path('stats.parquet'))
+        self.assertEquals(3, table.num_rows)
+
+
+if __name__ == "__main__":
+    test_cases = [SinkTests]
+
+    for test_case in test_cases:
+        suite = unittest.TestLoader().loadTestsFromTestCase(test_case)
+        unittest.TextTestRunner(verbosity=1).run(suite)
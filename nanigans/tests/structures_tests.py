@@ -1,6 +1,9 @@
+import pickle
 import unittest
 
+from copy import deepcopy
 from ..structures import StringDescriptor, DictDescriptor, ListDescriptor
+from ..models import PreparedRequest, Response
 
 
 # To test our descriptors, we need a class whose attributes are the descriptors.
@@ -11,6 +14,12 @@ class Foo(object):
     qux = ListDescriptor()
 
 
+class SlottedFoo(object):
+    __slots__ = ('_bar', '_qux')
+    bar = StringDescriptor()
+    qux = ListDescriptor()
+
+
 class StringDescriptorTests(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -80,8 +89,37 @@ class ListDescriptorTests(unittest.TestCase):
         self.assertEquals(['bur'], fu.qux)
 
 
+class StorageTests(unittest.TestCase):
+    def test_values_are_stored_on_the_instance(self):
+        foo = Foo()
+        foo.bar = 'foo'
+        self.assertEquals({'_bar': 'foo'}, vars(foo))
+
+    def test_values_are_stored_in_slots(self):
+        foo = SlottedFoo()
+        foo.bar, foo.qux = 'foo', ['foo']
+        self.assertEquals(('foo', ['foo']), (foo._bar, foo._qux))
+        self.assertFalse(hasattr(foo, '__dict__'))
+        with self.assertRaises(TypeError):
+            foo.qux = 'foo'
+        self.assertEquals(['foo'], foo.qux)
+
+    def test_unset_attribute_raises_attribute_error(self):
+        self.assertFalse(hasattr(SlottedFoo(), 'bar'))
+        self.assertIsInstance(Foo.bar, StringDescriptor)
+
+    def test_models_are_slotted_and_copyable(self):
+        request = PreparedRequest('adhoc', {'source': 'placements'})
+        response = Response(data=[{'foo': 'bar'}], errors=['baz'])
+        self.assertFalse(hasattr(request, '__dict__'))
+        self.assertFalse(hasattr(response, '__dict__'))
+        for copy in (deepcopy(response), pickle.loads(pickle.dumps(response))):
+            self.assertEquals(([{'foo': 'bar'}], ['baz']), (copy.data, copy.errors))
+        self.assertEquals('adhoc', pickle.loads(pickle.dumps(request)).resource)
+
+
 if __name__ == "__main__":
-    test_cases = [StringDescriptor, DictDescriptor, ListDescriptor]
+    test_cases = [StringDescriptorTests, DictDescriptorTests, ListDescriptorTests, StorageTests]
 
     for test_case in test_cases:
         suite = unittest.TestLoader().loadTestsFromTestCase(test_case)
@@ -1,11 +1,18 @@
 import unittest
+import os
 import re
+import shutil
+import tempfile
+import threading
 
 from random import randint
 from datetime import datetime
-from nanigans.object import Credentials
+from mock import Mock, patch
+from nanigans.auth import Credentials, TokenCache
 from nanigans.utils import (generate_date_chunks, generate_dates, 
-                            generate_token, change_site_id, set_default_config)
+                            generate_token, change_site_id, set_default_config,
+                            create_session, get_session, set_session,
+                            get_token_cache, set_token_cache)
 
 
 class GenerateDateRangeTests(unittest.TestCase):
@@ -112,6 +119,153 @@ class GenerateTokenTests(unittest.TestCase):
         self.assertIsNotNone(expr.match(token1))
         self.assertIsNone(expr.match(token2))
 
+class TokenCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'tokens.json')
+        self.fetch = Mock(side_effect=lambda user, password, site: 'token-'+site)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_token_is_fetched_once_per_user_and_site(self):
+        cache = TokenCache()
+        self.assertEqual('token-1', cache.get('foo', 'bar', '1', self.fetch))
+        self.assertEqual('token-1', cache.get('foo', 'bar', '1', self.fetch))
+        self.assertEqual('token-2', cache.get('foo', 'bar', '2', self.fetch))
+        self.assertEqual(2, self.fetch.call_count)
+
+    def test_token_is_refreshed_before_it_expires(self):
+        cache = TokenCache(ttl=10, refresh_margin=10)
+        cache.get('foo', 'bar', '1', self.fetch)
+        cache.get('foo', 'bar', '1', self.fetch)
+        self.assertEqual(2, self.fetch.call_count)
+
+    def test_invalidated_token_is_fetched_again(self):
+        cache = TokenCache()
+        cache.get('foo', 'bar', '1', self.fetch)
+        cache.invalidate('foo', '1')
+        cache.get('foo', 'bar', '1', self.fetch)
+        self.assertEqual(2, self.fetch.call_count)
+
+    def test_failed_authentication_is_not_cached(self):
+        cache = TokenCache()
+        self.assertIsNone(cache.get('foo', 'bar', '1', Mock(return_value=None)))
+        self.assertEqual('token-1', cache.get('foo', 'bar', '1', self.fetch))
+
+    def test_tokens_are_shared_through_file(self):
+        TokenCache(path=self.path).get('foo', 'bar', '1', self.fetch)
+        token = TokenCache(path=self.path).get('foo', 'bar', '1', self.fetch)
+        self.assertEqual('token-1', token)
+        self.assertEqual(1, self.fetch.call_count)
+        with open(self.path) as f:
+            self.assertNotIn('bar', f.read())
+
+    def test_sites_are_fetched_at_the_same_time(self):
+        cache = TokenCache(path=self.path)
+        fetching, released = threading.Event(), threading.Event()
+        def fetch(user, password, site):
+            # Site 1 only gets its token once site 2 was fetched meanwhile
+            if site == '1':
+                fetching.set()
+                return 'token-1' if released.wait(5) else 'serialized'
+            fetching.wait(5)
+            released.set()
+            return 'token-2'
+        tokens = []
+        threads = [threading.Thread(target=lambda site=site: tokens.append(cache.get('foo', 'bar', site, fetch)))
+                   for site in ('1', '2')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(['token-1', 'token-2'], sorted(tokens))
+
+    def test_same_site_is_fetched_once_across_threads(self):
+        cache = TokenCache()
+        started = threading.Event()
+        release = threading.Event()
+        def fetch(user, password, site):
+            started.set()
+            release.wait(5)
+            return 'token-'+site
+        fetch = Mock(side_effect=fetch)
+        tokens = []
+        threads = [threading.Thread(target=lambda: tokens.append(cache.get('foo', 'bar', '1', fetch)))
+                   for _ in range(4)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(['token-1']*4, tokens)
+        self.assertEqual(1, fetch.call_count)
+
+class LazyTokenTests(unittest.TestCase):
+    config = Credentials()
+
+    @patch('nanigans.utils.get_token', return_value='token')
+    def test_token_is_requested_on_first_use(self, mock_token):
+        set_default_config('test@gmail.com', 'test', '456789')
+        self.assertFalse(mock_token.called)
+        self.assertEqual('token', self.config.token)
+        self.assertEqual('token', self.config.token)
+        mock_token.assert_called_once_with('test@gmail.com', 'test', '456789')
+
+    @patch('nanigans.utils.get_token', return_value='token')
+    def test_token_is_requested_once_across_threads(self, mock_token):
+        set_default_config('test@gmail.com', 'test', '456789')
+        threads = [threading.Thread(target=lambda: self.config.token) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(1, mock_token.call_count)
+
+    @patch('nanigans.utils.get_token', return_value='token')
+    def test_changing_site_requests_new_token(self, mock_token):
+        set_default_config('test@gmail.com', 'test', '456789')
+        self.config.token
+        change_site_id('123456')
+        self.config.token
+        mock_token.assert_called_with('test@gmail.com', 'test', '123456')
+
+    @patch('nanigans.utils.generate_token', side_effect=['token-1', 'token-2'])
+    def test_token_is_refreshed_when_it_expires(self, mock_token):
+        cache = get_token_cache()
+        set_token_cache(TokenCache(ttl=60, refresh_margin=10))
+        try:
+            set_default_config('test@gmail.com', 'test', '456789')
+            with patch('time.time', return_value=1000.0):
+                self.assertEqual('token-1', self.config.token)
+            with patch('time.time', return_value=1049.0):
+                self.assertEqual('token-1', self.config.token)
+            with patch('time.time', return_value=1051.0):
+                self.assertEqual('token-2', self.config.token)
+        finally:
+            set_token_cache(cache)
+        self.assertEqual(2, mock_token.call_count)
+
+class SessionTests(unittest.TestCase):
+    def tearDown(self):
+        set_session(None)
+
+    def test_get_session_returns_same_session(self):
+        self.assertIs(get_session(), get_session())
+
+    def test_create_session_sizes_pool(self):
+        session = create_session(pool_maxsize=32)
+        self.assertEqual(32, session.get_adapter('https://app.nanigans.com')._pool_maxsize)
+
+    def test_set_session_injects_session(self):
+        session = create_session()
+        set_session(session)
+        self.assertIs(session, get_session())
+        set_session(None)
+        self.assertIsNot(session, get_session())
+
 class ChangeSiteIdTests(unittest.TestCase):
     config = Credentials()
     test_user= 'test@gmail.com'
@@ -131,6 +285,9 @@ if __name__ == "__main__":
         GenerateDateRangeTests, 
         GenerateDateChunksTest, 
         GenerateTokenTests, 
+        TokenCacheTests,
+        LazyTokenTests,
+        SessionTests,
         ChangeSiteIdTests
     ]
     for test_case in test_cases:
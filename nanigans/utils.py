@@ -2,10 +2,17 @@
 Utilities used throughout package.
 """
 import base64
+import threading
 import requests
 
 from datetime import datetime, timedelta
-from nanigans.auth import Credentials
+from requests.adapters import HTTPAdapter
+from nanigans.auth import Credentials, TokenCache, get_active_client
+
+_session = None
+_session_lock = threading.Lock()
+_token_cache = TokenCache()
+_authenticate_endpoint = 'https://app.nanigans.com/reporting-api/authenticate.php'
 
 def generate_dates(start, end):
 	"""Generates a list of string dates up to but not including 
@@ -46,6 +53,80 @@ def generate_date_chunks(start, end, size):
 			yield (dates[i], dates[len(dates)-1])
 
 
+def create_session(pool_connections=10, pool_maxsize=10, pool_block=False):
+	"""Create a requests session whose connections are kept alive and
+	pooled between requests.
+
+	:params pool_connections: int, number of hosts to keep pools for
+	:params pool_maxsize: int, connections kept per host, should be at least
+	the number of workers sending requests concurrently
+	:params pool_block: bool, wait for a free connection instead of opening
+	an extra one when the pool is exhausted
+	"""
+	adapter = HTTPAdapter(pool_connections=pool_connections,
+						  pool_maxsize=pool_maxsize,
+						  pool_block=pool_block)
+	session = requests.Session()
+	session.mount('https://', adapter)
+	session.mount('http://', adapter)
+
+	return session
+
+
+def get_session():
+	"""Return the session shared by every request, creating a default
+	one on first use. Inside a Client scope the client's session is 
+	returned instead.
+	"""
+	global _session
+
+	client = get_active_client()
+	if client is not None:
+		return client.session
+	if _session is None:
+		with _session_lock:
+			if _session is None:
+				_session = create_session()
+
+	return _session
+
+
+def set_session(session):
+	"""Replace the shared session, e.g. with one carrying proxies or a 
+	larger pool. Passing None restores the default session on next use.
+
+	:params session: requests.Session, session used for all requests
+	"""
+	global _session
+
+	with _session_lock:
+		_session = session
+
+	return
+
+
+def configure_session(pool_connections=10, pool_maxsize=10, pool_block=False):
+	"""Replace the shared session with a new pooled session.
+
+	:params pool_connections: int, number of hosts to keep pools for
+	:params pool_maxsize: int, connections kept per host
+	:params pool_block: bool, wait for a free connection when exhausted
+	"""
+	set_session(create_session(pool_connections, pool_maxsize, pool_block))
+
+	return
+
+
+def next_date(day):
+	"""Return the day after the given day.
+
+	:params day: str, date in YYYY-MM-DD format
+	"""
+	day = datetime.strptime(day, '%Y-%m-%d')+timedelta(days=1)
+
+	return day.strftime('%Y-%m-%d')
+
+
 def generate_token(user, password, site):
 	"""Generate access token.
 
@@ -60,29 +141,55 @@ def generate_token(user, password, site):
 			  'scope':'site',
 			  'id':site}
 			  
-	url = 'https://app.nanigans.com/reporting-api/authenticate.php'
-	resp = requests.post(url=url, params=params)
+	resp = get_session().post(url=_authenticate_endpoint, params=params)
 	resp_json = resp.json()
 
 	return resp_json['token']
 
 
+def get_token(user, password, site):
+	"""Return an access token from the token cache, only authenticating
+	when there is no token for the user and site or it is about to expire.
+
+	:params user: str, email used to access Nanigans account
+	:params password: str, password 
+	:params site: str, site id in Nanigans
+	"""
+	return _token_cache.get(user, password, str(site), generate_token)
+
+
+def get_token_cache():
+	"""Return the token cache used by get_token."""
+	return _token_cache
+
+
+def set_token_cache(cache):
+	"""Replace the token cache, e.g. with one persisted to disk so that
+	worker processes share tokens.
+
+	:params cache: TokenCache, cache used by get_token
+	"""
+	global _token_cache
+
+	_token_cache = cache
+
+	return
+
+
 def change_site_id(site, obj=Credentials()):
-	"""Change site id and access token.
+	"""Change site id. The access token for the new site is requested when
+	the next request is sent.
 
 	:params site: str/int, Nanigans site id
 	"""
 	obj.credentials['site'] = str(site)
-	obj.credentials['token'] = generate_token(
-		obj.credentials['username'], 
-		obj.credentials['password'], 
-		obj.credentials['site']
-	)
+	obj.credentials['token'] = None
 
 	return
 
 def set_default_config(username, password, site, obj=Credentials()):
-	""" Set default configuration.
+	""" Set default configuration. The access token is requested when the
+	first request is sent.
 	
 	:params user: str, email used to access Nanigans account
 	:params password: str, password 
@@ -93,8 +200,7 @@ def set_default_config(username, password, site, obj=Credentials()):
 	config['username'] = username
 	config['password'] = password
 	config['site'] = site 
-	config['token'] = generate_token(
-					  username, password, site)
+	config['token'] = None
 
 	obj._credentials = config
 